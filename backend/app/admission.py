@@ -0,0 +1,224 @@
+# app/admission.py
+"""
+Admission control for database-bound routes.
+
+Without it, a rush-hour burst queues every request on the connection pool
+until they all time out together. Instead, requests are admitted through
+limiters with a bounded wait queue, and turned away early with
+503 + Retry-After when the queue is full or the wait gets too long:
+
+- routes declared with `admission_limit("POST", "/invoices/", 8, queue=32)`
+  get their own limiter (at most 8 running, 32 waiting), then go through
+  the shared database gate
+- the database gate admits at most ADMISSION_DB_CONCURRENCY requests
+  (default: pool size + overflow) and keeps ADMISSION_DB_RESERVED of those
+  slots for routes declared with `admission_priority("GET", "/products/{product_id}")`.
+  Priority requests are also woken first when a slot frees up, so lookups
+  stay fast while invoice creation is saturated
+- routes declared with neither (/health, /metrics, ...) are never held back
+- outlets routed to another database (app/db/outlets.py) go through that
+  database's own gate, picked by the X-Outlet-Id header
+
+In-flight counts, queue depths, waits and rejections are exported on /metrics.
+Limits are per worker process, like the metrics registry.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+from app.core.config import settings
+from app.db.outlets import DEFAULT_TARGET, Target, all_targets, outlet_from_scope, target_for
+from app.metrics import Counter, Gauge, Histogram, registry
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+QUEUE_FULL = "queue_full"
+TIMEOUT = "timeout"
+
+
+class Limiter:
+    """
+    Counting semaphore with a bounded FIFO wait queue and two priorities.
+    `reserved` slots can only be taken by priority requests.
+    Runs on the event loop thread only, so there is no locking.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, reserved: int = 0):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.reserved = min(max(0, reserved), self.limit - 1)
+        self.in_flight = 0
+        self._priority: deque = deque()
+        self._normal: deque = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._priority) + len(self._normal)
+
+    def _can_start(self, priority: bool) -> bool:
+        return self.in_flight < self.limit - (0 if priority else self.reserved)
+
+    async def acquire(self, priority: bool = False, timeout: Optional[float] = None) -> Optional[str]:
+        """Take a slot. Returns None once admitted, or the reason (QUEUE_FULL / TIMEOUT) it was refused."""
+        # don't overtake anyone already waiting at the same or higher priority
+        ahead = len(self._priority) if priority else self.queued
+        if not ahead and self._can_start(priority):
+            self.in_flight += 1
+            return None
+        if self.queued >= self.max_queue:
+            rejected.inc((self.name, QUEUE_FULL))
+            return QUEUE_FULL
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._priority if priority else self._normal
+        queue.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    queue.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            rejected.inc((self.name, TIMEOUT))
+            return TIMEOUT
+        finally:
+            wait_seconds.observe((self.name,), time.perf_counter() - start)
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        for priority, queue in ((True, self._priority), (False, self._normal)):
+            while queue and self._can_start(priority):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+def _db_concurrency(url: str) -> int:
+    if settings.ADMISSION_DB_CONCURRENCY > 0:
+        return settings.ADMISSION_DB_CONCURRENCY
+    if url.startswith("sqlite"):
+        return 1
+    return settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+
+
+def _db_gate(url: str, name: str) -> Limiter:
+    return Limiter(name, _db_concurrency(url), settings.ADMISSION_DB_QUEUE, settings.ADMISSION_DB_RESERVED)
+
+
+db_gate = _db_gate(DEFAULT_TARGET.url, "db")
+limiters: Dict[str, Limiter] = {"db": db_gate}
+# one gate per database URL (one connection pool each), whatever schemas it holds
+_db_gates: Dict[str, Limiter] = {DEFAULT_TARGET.url: db_gate}
+for _target in all_targets():
+    if _target.url not in _db_gates:
+        _name = f"db:{Target(_target.url).name}"
+        _db_gates[_target.url] = limiters[_name] = _db_gate(_target.url, _name)
+
+
+def db_gate_for(outlet_id: int) -> Limiter:
+    return _db_gates[target_for(outlet_id).url]
+
+# (method, route path) -> (route limiter or None, priority)
+_policies: Dict[Tuple[str, str], Tuple[Optional[Limiter], bool]] = {}
+
+
+def admission_limit(method: str, route_path: str, limit: int, queue: int = 0):
+    """At most `limit` concurrent requests to this route, `queue` more waiting; then the database gate."""
+    name = f"{method} {route_path}"
+    limiters[name] = Limiter(name, limit, queue)
+    _policies[(method, route_path)] = (limiters[name], False)
+
+
+def admission_priority(method: str, route_path: str):
+    """Cheap reads that should get a database slot ahead of writes and exports."""
+    _policies[(method, route_path)] = (None, True)
+
+
+def _limiter_stats(attr: str):
+    def collect():
+        return {(name,): getattr(limiter, attr) for name, limiter in limiters.items()}
+    return collect
+
+
+registry.register(Gauge(
+    "pos_admission_in_flight", "Requests holding a slot, by limiter", ("limiter",), fn=_limiter_stats("in_flight")))
+registry.register(Gauge(
+    "pos_admission_queue_depth", "Requests waiting for a slot, by limiter", ("limiter",), fn=_limiter_stats("queued")))
+rejected = registry.register(Counter(
+    "pos_admission_rejected_total", "Requests turned away with 503, by limiter and reason", ("limiter", "reason")))
+wait_seconds = registry.register(Histogram(
+    "pos_admission_wait_seconds", "Time spent queued for a slot", ("limiter",), buckets=WAIT_BUCKETS))
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the declared policies before the request reaches the router."""
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+        self._routes: Optional[List[tuple]] = None
+
+    def _resolve(self, scope):
+        if self._routes is None:
+            # built on first request, once every router has been included
+            self._routes = [
+                (route, _policies[(method, route.path)])
+                for route in self.router.routes
+                for method in sorted(getattr(route, "methods", None) or ())
+                if (method, getattr(route, "path", None)) in _policies
+            ]
+        for route, policy in self._routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route, policy
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route, policy = self._resolve(scope)
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        route_limiter, priority = policy
+        # one ADMISSION_QUEUE_TIMEOUT for the whole request, shared by the route limiter and the gate
+        deadline = time.monotonic() + settings.ADMISSION_QUEUE_TIMEOUT
+        held = []
+        try:
+            for limiter in (route_limiter, db_gate_for(outlet_from_scope(scope))):
+                if limiter is None:
+                    continue
+                timeout = max(0.0, deadline - time.monotonic())
+                if await limiter.acquire(priority, timeout) is not None:
+                    # label the 503 with the route template in the HTTP metrics
+                    scope["route"] = route
+                    response = JSONResponse(
+                        {"detail": "Server busy, please retry"},
+                        status_code=503,
+                        headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)},
+                    )
+                    return await response(scope, receive, send)
+                held.append(limiter)
+            await self.app(scope, receive, send)
+        finally:
+            for limiter in reversed(held):
+                limiter.release()
@@ -0,0 +1,628 @@
+# app/analytics.py
+"""
+Columnar snapshot of invoice items for reporting, off the billing database.
+
+A snapshot job copies invoice_item rows (joined to their invoice) into
+ANALYTICS_DIR as one .npy file per column, in segments of at most
+ANALYTICS_SEGMENT_ROWS rows:
+
+    analytics_data/
+      manifest.json            watermark, segments, row counts
+      dims.json                product / category / employee names
+      seg-000007-000/*.npy     one array per column (COLUMNS)
+
+Each run only exports what is new since the last one: items whose invoice
+created_at is past the watermark, plus items with an id above (highest id
+exported so far - ANALYTICS_RESCAN_IDS). Offline bills synced late carry an
+old created_at, and ids are allocated at insert, not commit, so a late sync
+can commit below ids that were already exported; the re-scanned range is
+deduplicated against the item ids already in the snapshot. Bills younger
+than ANALYTICS_SNAPSHOT_LAG seconds wait for the next run, so transactions
+still in flight aren't skipped. A run only becomes visible when
+manifest.json is replaced, so readers never see half a run.
+
+Exports run in a spawned child process (AnalyticsSnapshotter.run_once), so
+the row streaming, np.save and compaction never block the API's event loop.
+With an in-memory SQLite database (offline mode) they run in-process, since a
+child could not see that database.
+The schedule only runs with ANALYTICS_SOURCE_URL set: point it at a read
+replica (or at DATABASE_URL to accept the load on the primary).
+
+Every row carries its outlet and reports filter on it. Outlets routed to
+another database (app/db/outlets.py) get their own snapshot directory,
+ANALYTICS_DIR/<target name>/, exported from that database.
+
+Money is stored as integer paise and quantity / tax rate in hundredths, so
+sums are exact. Exported rows are not revisited: an invoice cancelled after
+it was exported keeps its old status until a full rebuild (`--full`).
+
+Reports memory-map the segments and aggregate them with NumPy
+(np.unique / np.bincount); nothing here touches the transactional database.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import BigInteger, and_, case, cast, func, or_, select
+
+from app.core.config import settings
+from app.db.models import Category, Employee, Invoice, InvoiceItem, Product
+from app.db.outlets import DEFAULT_TARGET, Target, all_targets
+from app.db.session import engine, make_engine, outlet_router, sqlite_memory
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("draft", "preparing", "served", "finalized", "paid", "cancelled")
+# what counts as a sale unless the caller asks for other statuses
+SALE_STATUSES = ("preparing", "served", "finalized", "paid")
+
+COLUMNS = {
+    "item_id": np.int64,
+    "invoice_id": np.int64,
+    "outlet_id": np.int32,
+    "created_at": np.int64,   # unix seconds, UTC
+    "product_id": np.int64,   # -1 = none
+    "employee_id": np.int64,  # -1 = none
+    "status": np.int8,        # index into STATUSES
+    "quantity": np.int64,     # hundredths
+    "tax_rate": np.int32,     # hundredths of a percent
+    "discount": np.int64,     # paise
+    "net": np.int64,          # line_total_excl_tax, paise
+    "tax": np.int64,          # line_tax_amount, paise
+    "gross": np.int64,        # line_total_incl_tax, paise
+}
+
+# bumped when COLUMNS or the manifest change; an older snapshot is rebuilt from scratch on the next run
+FORMAT = 3
+MANIFEST = "manifest.json"
+DIMS = "dims.json"
+# merge small segments once there are this many of them
+_COMPACT_AFTER = 8
+
+
+def _hundredths(column):
+    return cast(func.round(func.coalesce(column, 0) * 100), BigInteger)
+
+
+def _epoch(dt: Optional[datetime]) -> Optional[int]:
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((dt - datetime(1970, 1, 1)).total_seconds())
+
+
+def _write_json(path: str, data) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str, default):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        # gone, or caught half-written by a writer that doesn't replace atomically
+        return default
+
+
+# ---- export ----
+
+def _export_query(watermark: Optional[datetime], rescan_from_id: int, cutoff: datetime):
+    q = (
+        select(
+            InvoiceItem.id,
+            InvoiceItem.invoice_id,
+            Invoice.outlet_id,
+            InvoiceItem.invoice_created_at,
+            func.coalesce(InvoiceItem.product_id, -1),
+            func.coalesce(Invoice.employee_id, -1),
+            case({s: i for i, s in enumerate(STATUSES)}, value=Invoice.status, else_=-1),
+            _hundredths(InvoiceItem.quantity),
+            _hundredths(InvoiceItem.tax_rate),
+            _hundredths(InvoiceItem.discount_amount),
+            _hundredths(InvoiceItem.line_total_excl_tax),
+            _hundredths(InvoiceItem.line_tax_amount),
+            _hundredths(InvoiceItem.line_total_incl_tax),
+        )
+        .join(Invoice, and_(Invoice.id == InvoiceItem.invoice_id, Invoice.created_at == InvoiceItem.invoice_created_at))
+        .where(InvoiceItem.invoice_created_at <= cutoff)
+    )
+    if watermark is not None:
+        q = q.where(or_(InvoiceItem.invoice_created_at > watermark, InvoiceItem.id > rescan_from_id))
+    return q
+
+
+def _to_columns(rows) -> Dict[str, np.ndarray]:
+    values = list(zip(*rows))
+    cols = {}
+    for (name, dtype), col in zip(COLUMNS.items(), values):
+        if name == "created_at":
+            cols[name] = np.array(col, dtype="datetime64[s]").astype(np.int64)
+        else:
+            cols[name] = np.array(col, dtype=dtype)
+    return cols
+
+
+def _write_segment(root: str, name: str, cols: Dict[str, np.ndarray]) -> dict:
+    tmp = os.path.join(root, name + ".tmp")
+    os.makedirs(tmp, exist_ok=True)
+    for col, arr in cols.items():
+        np.save(os.path.join(tmp, col + ".npy"), arr)
+    os.replace(tmp, os.path.join(root, name))
+    ts = cols["created_at"]
+    return {
+        "name": name,
+        "rows": int(len(ts)),
+        "min_ts": int(ts.min()),
+        "max_ts": int(ts.max()),
+        "max_id": int(cols["item_id"].max()),
+        "outlets": np.unique(cols["outlet_id"]).tolist(),
+    }
+
+
+def _exported_ids(root: str, segments: List[dict], above: int) -> np.ndarray:
+    """Item ids > `above` already in the snapshot (what a re-scan must not export twice)."""
+    ids = [
+        ids[ids > above]
+        for ids in (np.load(os.path.join(root, s["name"], "item_id.npy"), mmap_mode="r")
+                    for s in segments if s["max_id"] > above)
+    ]
+    return np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+
+async def _export_dims(conn) -> dict:
+    products = await conn.execute(select(Product.id, Product.name, Product.category_id))
+    categories = await conn.execute(select(Category.id, Category.name))
+    employees = await conn.execute(select(Employee.id, Employee.full_name))
+    return {
+        "products": {str(pid): [name, cat] for pid, name, cat in products.all()},
+        "categories": {str(cid): name for cid, name in categories.all()},
+        "employees": {str(eid): name for eid, name in employees.all()},
+    }
+
+
+def _compact(root: str, segments: List[dict], run: int) -> List[dict]:
+    """Merge small segments into ones of up to ANALYTICS_SEGMENT_ROWS rows."""
+    limit = settings.ANALYTICS_SEGMENT_ROWS
+    small = [s for s in segments if s["rows"] < limit]
+    if len(small) < _COMPACT_AFTER:
+        return segments
+    kept = [s for s in segments if s["rows"] >= limit]
+    groups, group, size = [], [], 0
+    for seg in small:
+        if group and size + seg["rows"] > limit:
+            groups.append(group)
+            group, size = [], 0
+        group.append(seg)
+        size += seg["rows"]
+    groups.append(group)
+    for n, group in enumerate(groups):
+        if len(group) == 1:
+            kept.append(group[0])
+            continue
+        cols = {
+            col: np.concatenate([np.load(os.path.join(root, s["name"], col + ".npy")) for s in group])
+            for col in COLUMNS
+        }
+        kept.append(_write_segment(root, f"seg-{run:06d}-c{n:02d}", cols))
+    return kept
+
+
+def _remove_unlisted(root: str, manifest: dict) -> None:
+    """Drop segment directories not referenced by the manifest (compacted or left by a failed run)."""
+    listed = {s["name"] for s in manifest["segments"]}
+    for name in os.listdir(root):
+        if name.startswith("seg-") and name not in listed:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def snapshot_root(target: Target = DEFAULT_TARGET) -> str:
+    if target == DEFAULT_TARGET:
+        return settings.ANALYTICS_DIR
+    return os.path.join(settings.ANALYTICS_DIR, target.name)
+
+
+async def run_snapshot(source=None, full: bool = False, root: Optional[str] = None) -> dict:
+    """
+    Export new invoice items from `source` (default: the main engine) into `root`
+    (default: ANALYTICS_DIR). Runs are serialized with a file lock, so several
+    app workers can share the directory; a run that finds the lock taken
+    returns {"skipped": True}.
+    """
+    root = root or settings.ANALYTICS_DIR
+    os.makedirs(root, exist_ok=True)
+    lock = open(os.path.join(root, ".lock"), "w")
+    try:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return {"skipped": True}
+
+        manifest = _read_json(os.path.join(root, MANIFEST), None)
+        if manifest is None:
+            manifest = {"watermark": None, "max_item_id": 0, "run": 0, "segments": []}
+        elif manifest.get("format") != FORMAT:
+            full = True
+        _remove_unlisted(root, manifest)
+        run = manifest["run"] + 1
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.ANALYTICS_SNAPSHOT_LAG)
+        if full:
+            # old segments stay readable until the new manifest replaces them
+            watermark, max_item_id, segments = None, 0, []
+        else:
+            watermark = datetime.fromisoformat(manifest["watermark"]) if manifest["watermark"] else None
+            max_item_id, segments = manifest["max_item_id"], list(manifest["segments"])
+        exported = 0
+        rescan_from_id = max(0, max_item_id - settings.ANALYTICS_RESCAN_IDS)
+        seen = _exported_ids(root, segments, rescan_from_id)
+
+        async with (source if source is not None else engine).connect() as conn:
+            result = await conn.stream(_export_query(watermark, rescan_from_id, cutoff))
+            n = 0
+            async for rows in result.partitions(settings.ANALYTICS_SEGMENT_ROWS):
+                cols = _to_columns(rows)
+                new = ~np.isin(cols["item_id"], seen)
+                if not new.all():
+                    if not new.any():
+                        continue
+                    cols = {name: arr[new] for name, arr in cols.items()}
+                segments.append(_write_segment(root, f"seg-{run:06d}-{n:03d}", cols))
+                max_item_id = max(max_item_id, int(cols["item_id"].max()))
+                exported += len(cols["item_id"])
+                n += 1
+            dims = await _export_dims(conn)
+
+        segments = _compact(root, segments, run)
+        _write_json(os.path.join(root, DIMS), dims)
+        manifest = {
+            "format": FORMAT,
+            "watermark": cutoff.isoformat(),
+            "max_item_id": max_item_id,
+            "run": run,
+            "updated_at": datetime.utcnow().isoformat(),
+            "rows": sum(s["rows"] for s in segments),
+            "segments": segments,
+        }
+        _write_json(os.path.join(root, MANIFEST), manifest)
+        _remove_unlisted(root, manifest)
+        logger.info("Analytics snapshot %d: %d new rows, %d total", run, exported, manifest["rows"])
+        return {"skipped": False, "exported": exported, "rows": manifest["rows"], "watermark": manifest["watermark"]}
+    finally:
+        lock.close()
+
+
+class AnalyticsSnapshotter:
+    """
+    Runs the export every `interval` seconds (same lifecycle as the stock reconciler),
+    once per outlet database, each run in a spawned child process. The schedule needs
+    `source_url`; on-demand runs fall back to DATABASE_URL.
+    """
+
+    def __init__(self, interval: float, source_url: str = ""):
+        self.interval = interval
+        self.source_url = source_url
+        self._source = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def source(self):
+        if self._source is None and self.source_url:
+            self._source = make_engine(self.source_url, "analytics_source")
+        return self._source
+
+    async def export(self, full: bool = False) -> dict:
+        """
+        Snapshot DATABASE_URL (or the source URL), then any routed outlet databases under
+        "targets", in this process. Used by the child process and scripts/analytics_snapshot.py.
+        """
+        result = await run_snapshot(self.source, full=full)
+        routed = [t for t in all_targets() if t != DEFAULT_TARGET]
+        if routed:
+            result["targets"] = {
+                t.name: await run_snapshot(outlet_router.engine(t), full=full, root=snapshot_root(t)) for t in routed
+            }
+        return result
+
+    def _in_memory(self) -> bool:
+        urls = [self.source_url or settings.DATABASE_URL, *(t.url for t in all_targets())]
+        return any(sqlite_memory(url) for url in urls)
+
+    async def run_once(self, full: bool = False) -> dict:
+        """export() in the child process; the event loop only waits for the result."""
+        if self._in_memory():
+            # an in-memory SQLite database only exists in this process: a child would open an
+            # empty one and export nothing, so offline mode exports here, on the event loop
+            return await self.export(full=full)
+        if self._executor is None:
+            # spawned, not forked: this process runs an event loop and holds pooled connections
+            self._executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _export_in_child, self.source_url, full)
+
+    async def start(self):
+        if self._task is None and self.interval > 0:
+            if not self.source_url:
+                logger.warning(
+                    "Scheduled analytics snapshots are off: set ANALYTICS_SOURCE_URL to a read replica "
+                    "(or to DATABASE_URL to export from the primary)"
+                )
+                return
+            self._task = asyncio.create_task(self._run(), name="analytics-snapshot")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._source is not None:
+            await self._source.dispose()
+            self._source = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception("Analytics snapshot failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+async def _export_standalone(source_url: str, full: bool) -> dict:
+    snapshotter = AnalyticsSnapshotter(0, source_url)
+    try:
+        return await snapshotter.export(full=full)
+    finally:
+        await snapshotter.stop()
+        await outlet_router.dispose()
+        await engine.dispose()
+
+
+def _export_in_child(source_url: str, full: bool) -> dict:
+    """Child process entry point: its own event loop and engines, disposed before returning."""
+    return asyncio.run(_export_standalone(source_url, full))
+
+
+snapshotter = AnalyticsSnapshotter(settings.ANALYTICS_SNAPSHOT_INTERVAL, settings.ANALYTICS_SOURCE_URL)
+
+
+# ---- reading ----
+
+class Snapshot:
+    """The segments listed in one manifest, memory-mapped."""
+
+    def __init__(self, root: str, manifest: dict, dims: dict):
+        self.root = root
+        self.manifest = manifest
+        self.dims = dims
+        self.segments = [
+            (seg, {col: np.load(os.path.join(root, seg["name"], col + ".npy"), mmap_mode="r") for col in COLUMNS})
+            for seg in manifest["segments"]
+        ]
+
+    @property
+    def as_of(self) -> Optional[str]:
+        return self.manifest.get("watermark")
+
+    def scan(self, since: Optional[datetime], until: Optional[datetime], statuses=SALE_STATUSES,
+             outlet_id: Optional[int] = None) -> Iterator[Tuple[Dict[str, np.ndarray], np.ndarray]]:
+        """Yield (columns, row mask) per segment overlapping [since, until) (and holding the outlet)."""
+        lo, hi = _epoch(since), _epoch(until)
+        codes = np.array([STATUSES.index(s) for s in statuses], dtype=np.int8)
+        for seg, cols in self.segments:
+            if (lo is not None and seg["max_ts"] < lo) or (hi is not None and seg["min_ts"] >= hi):
+                continue
+            if outlet_id is not None and outlet_id not in seg["outlets"]:
+                continue
+            mask = np.isin(cols["status"], codes)
+            if outlet_id is not None:
+                mask &= cols["outlet_id"] == outlet_id
+            if lo is not None:
+                mask &= cols["created_at"] >= lo
+            if hi is not None:
+                mask &= cols["created_at"] < hi
+            yield cols, mask
+
+
+_cache: Dict[str, Tuple[int, Snapshot]] = {}
+
+
+def load_snapshot(root: Optional[str] = None) -> Optional[Snapshot]:
+    """Current snapshot (reopened only when manifest.json changes), or None before the first run."""
+    root = root or settings.ANALYTICS_DIR
+    path = os.path.join(root, MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _cache.get(root)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    for _ in range(3):
+        # manifest.json can be replaced (or removed) between the stat and the read, and a
+        # run deletes the segments of the manifest it replaced: re-read when that happens
+        manifest = _read_json(path, None)
+        if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+            # not there any more, or written by an older version; the next run rebuilds it
+            return None
+        try:
+            snap = Snapshot(root, manifest, _read_json(os.path.join(root, DIMS), {}))
+        except FileNotFoundError:
+            continue
+        _cache[root] = (mtime, snap)
+        return snap
+    return cached[1] if cached is not None else None
+
+
+def _group_index(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(unique keys, index of each row's key): dense offsets when the key range is small, else np.unique."""
+    lo, hi = int(keys.min()), int(keys.max())
+    if hi - lo < max(len(keys), 1 << 16):
+        present = np.bincount(keys - lo, minlength=hi - lo + 1) > 0
+        uniq = np.flatnonzero(present) + lo
+        return uniq, np.cumsum(present)[keys - lo] - 1
+    return np.unique(keys, return_inverse=True)
+
+
+def _count_bills(parts: List[Tuple[np.ndarray, np.ndarray]]) -> Dict[int, int]:
+    """
+    Distinct invoices per key from per-segment (invoice_ids, keys) pairs. Every
+    invoice has a single key (its employee, its hour) but can straddle two
+    segments, so it is deduplicated across all of them.
+    """
+    invoice_ids = np.concatenate([ids for ids, _ in parts])
+    keys = np.concatenate([k for _, k in parts])
+    _, first = np.unique(invoice_ids, return_index=True)
+    uniq, counts = np.unique(keys[first], return_counts=True)
+    return dict(zip(uniq.tolist(), counts.tolist()))
+
+
+def _first_per_invoice(invoice_ids: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    ids, first = np.unique(invoice_ids, return_index=True)
+    return ids, keys[first]
+
+
+class _Groups:
+    """Accumulates per-key sums across segments."""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.sums: Dict[int, Dict[str, float]] = {}
+        self.bills: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def add(self, keys: np.ndarray, values: Dict[str, np.ndarray], invoice_ids: Optional[np.ndarray] = None):
+        if not len(keys):
+            return
+        uniq, inverse = _group_index(keys)
+        totals = {f: np.bincount(inverse, weights=values[f], minlength=len(uniq)) for f in self.fields}
+        totals["lines"] = np.bincount(inverse, minlength=len(uniq))
+        for i, key in enumerate(uniq.tolist()):
+            acc = self.sums.setdefault(key, dict.fromkeys(totals, 0.0))
+            for f, arr in totals.items():
+                acc[f] += arr[i]
+        if invoice_ids is not None:
+            self.bills.append(_first_per_invoice(invoice_ids, keys))
+
+    def result(self) -> Dict[int, Dict[str, float]]:
+        if self.bills:
+            for key, count in _count_bills(self.bills).items():
+                self.sums[key]["bills"] = count
+        return self.sums
+
+
+def _rupees(paise: float) -> float:
+    return round(paise / 100.0, 2)
+
+
+def item_mix(snap: Snapshot, since=None, until=None, by: str = "product", limit: int = 50,
+             outlet_id: Optional[int] = None) -> List[dict]:
+    """Quantity and revenue per product (or category), largest revenue first."""
+    products = snap.dims.get("products", {})
+    groups = _Groups(("quantity", "net", "gross"))
+    if by == "category":
+        # product id -> category id lookup, sorted for searchsorted
+        lookup = sorted((int(pid), cat if cat is not None else -1) for pid, (_, cat) in products.items()) or [(0, -1)]
+        ids = np.array([pid for pid, _ in lookup], dtype=np.int64)
+        cats = np.array([cat for _, cat in lookup], dtype=np.int64)
+    for cols, mask in snap.scan(since, until, outlet_id=outlet_id):
+        keys = cols["product_id"][mask]
+        if by == "category":
+            pos = np.clip(np.searchsorted(ids, keys), 0, len(ids) - 1)
+            keys = np.where(ids[pos] == keys, cats[pos], -1)
+        groups.add(keys, {f: cols[f][mask] for f in groups.fields})
+    sums = groups.result()
+    total = sum(s["gross"] for s in sums.values()) or 1.0
+    names = snap.dims.get("categories", {}) if by == "category" else {k: v[0] for k, v in products.items()}
+    rows = [
+        {
+            "id": key if key >= 0 else None,
+            "name": names.get(str(key)),
+            "quantity": round(s["quantity"] / 100.0, 2),
+            "lines": int(s["lines"]),
+            "net": _rupees(s["net"]),
+            "gross": _rupees(s["gross"]),
+            "share": round(s["gross"] / total, 4),
+        }
+        for key, s in sums.items()
+    ]
+    rows.sort(key=lambda r: r["gross"], reverse=True)
+    return rows[:limit]
+
+
+def heatmap(snap: Snapshot, since=None, until=None, metric: str = "gross",
+            outlet_id: Optional[int] = None) -> List[List[float]]:
+    """7 x 24 matrix (Monday first, local hours) of revenue, bills or items sold."""
+    offset = settings.LOCAL_UTC_OFFSET_MINUTES * 60
+    cells = np.zeros(7 * 24, dtype=np.float64)
+    bills = []
+    for cols, mask in snap.scan(since, until, outlet_id=outlet_id):
+        local = cols["created_at"][mask] + offset
+        # 1970-01-01 was a Thursday (weekday 3)
+        cell = ((local // 86400 + 3) % 7) * 24 + (local % 86400) // 3600
+        if metric == "bills":
+            bills.append(_first_per_invoice(cols["invoice_id"][mask], cell))
+        else:
+            weights = cols["quantity" if metric == "items" else "gross"][mask]
+            cells += np.bincount(cell, weights=weights, minlength=7 * 24)
+    if metric != "bills":
+        cells /= 100.0
+    elif bills:
+        for cell, count in _count_bills(bills).items():
+            cells[cell] = count
+    return np.round(cells, 2).reshape(7, 24).tolist()
+
+
+def employee_sales(snap: Snapshot, since=None, until=None, outlet_id: Optional[int] = None) -> List[dict]:
+    names = snap.dims.get("employees", {})
+    groups = _Groups(("quantity", "net", "gross"))
+    for cols, mask in snap.scan(since, until, outlet_id=outlet_id):
+        groups.add(cols["employee_id"][mask], {f: cols[f][mask] for f in groups.fields}, cols["invoice_id"][mask])
+    rows = []
+    for key, s in groups.result().items():
+        bills = int(s.get("bills", 0))
+        rows.append({
+            "employee_id": key if key >= 0 else None,
+            "name": names.get(str(key)),
+            "bills": bills,
+            "items": round(s["quantity"] / 100.0, 2),
+            "net": _rupees(s["net"]),
+            "gross": _rupees(s["gross"]),
+            "avg_bill": _rupees(s["gross"] / bills) if bills else 0.0,
+        })
+    rows.sort(key=lambda r: r["gross"], reverse=True)
+    return rows
+
+
+def tax_breakdown(snap: Snapshot, since=None, until=None, outlet_id: Optional[int] = None) -> List[dict]:
+    groups = _Groups(("net", "tax", "gross"))
+    for cols, mask in snap.scan(since, until, outlet_id=outlet_id):
+        groups.add(cols["tax_rate"][mask].astype(np.int64), {f: cols[f][mask] for f in groups.fields})
+    rows = [
+        {
+            "tax_rate": key / 100.0,
+            "lines": int(s["lines"]),
+            "taxable": _rupees(s["net"]),
+            "tax": _rupees(s["tax"]),
+            "gross": _rupees(s["gross"]),
+        }
+        for key, s in groups.result().items()
+    ]
+    rows.sort(key=lambda r: r["tax_rate"])
+    return rows
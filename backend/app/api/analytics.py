@@ -0,0 +1,89 @@
+# app/api/analytics.py
+"""
+Reports over the columnar snapshot (app/analytics.py), for the request's
+outlet. Handlers are plain `def` so the NumPy work runs in the threadpool
+instead of on the event loop; none of them query the database.
+"""
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app import analytics
+from app.admission import admission_limit
+from app.db.outlets import current_outlet, target_for
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+admission_limit("POST", "/analytics/snapshot", 1)
+
+
+def _load(outlet_id: int) -> Optional[analytics.Snapshot]:
+    return analytics.load_snapshot(analytics.snapshot_root(target_for(outlet_id)))
+
+
+def _snapshot(outlet_id: int) -> analytics.Snapshot:
+    snap = _load(outlet_id)
+    if snap is None:
+        raise HTTPException(503, "Analytics snapshot not built yet")
+    return snap
+
+
+@router.get("/status")
+def status(outlet_id: int = Depends(current_outlet)):
+    snap = _load(outlet_id)
+    if snap is None:
+        return {"as_of": None, "rows": 0, "segments": 0}
+    return {
+        "as_of": snap.as_of,
+        "rows": snap.manifest["rows"],
+        "segments": len(snap.manifest["segments"]),
+        "updated_at": snap.manifest.get("updated_at"),
+    }
+
+
+@router.post("/snapshot")
+async def snapshot(full: bool = False):
+    """Export new invoice items now instead of waiting for the next scheduled run."""
+    return await analytics.snapshotter.run_once(full=full)
+
+
+@router.get("/items")
+def items(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    by: str = Query("product", regex="^(product|category)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    outlet_id: int = Depends(current_outlet),
+):
+    snap = _snapshot(outlet_id)
+    rows = analytics.item_mix(snap, since, until, by=by, limit=limit, outlet_id=outlet_id)
+    return {"as_of": snap.as_of, "rows": rows}
+
+
+@router.get("/heatmap")
+def heatmap(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    metric: str = Query("gross", regex="^(gross|bills|items)$"),
+    outlet_id: int = Depends(current_outlet),
+):
+    snap = _snapshot(outlet_id)
+    cells = analytics.heatmap(snap, since, until, metric=metric, outlet_id=outlet_id)
+    return {"as_of": snap.as_of, "metric": metric, "cells": cells}
+
+
+@router.get("/employees")
+def employees(
+    since: Optional[datetime] = None, until: Optional[datetime] = None, outlet_id: int = Depends(current_outlet)
+):
+    snap = _snapshot(outlet_id)
+    return {"as_of": snap.as_of, "rows": analytics.employee_sales(snap, since, until, outlet_id=outlet_id)}
+
+
+@router.get("/tax")
+def tax(
+    since: Optional[datetime] = None, until: Optional[datetime] = None, outlet_id: int = Depends(current_outlet)
+):
+    snap = _snapshot(outlet_id)
+    return {"as_of": snap.as_of, "rows": analytics.tax_breakdown(snap, since, until, outlet_id=outlet_id)}
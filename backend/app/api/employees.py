@@ -1,17 +1,30 @@
 # app/api/employees.py
+from datetime import date, datetime
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
+from app.db.outlets import current_outlet
 from app.db.models import Employee
 from app.schemas.employee import EmployeeCreate, EmployeeOut
+from app.db.query_log import query_budget
+from app.admission import admission_priority
+from app import shifts
 import traceback
 
 router = APIRouter(prefix="/employees", tags=["employees"])
 
+query_budget("/employees/{employee_id}/performance", 4)
+admission_priority("GET", "/employees/{employee_id}/performance")
+
 @router.post("/", response_model=EmployeeOut)
-async def create_employee(payload: EmployeeCreate, db: AsyncSession = Depends(get_db)):
+async def create_employee(
+    payload: EmployeeCreate, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
     try:
         employee = Employee(
+            outlet_id=outlet_id,
             full_name=payload.full_name,
             phone=payload.phone,
             employee_code=payload.employee_code,
@@ -26,3 +39,36 @@ async def create_employee(payload: EmployeeCreate, db: AsyncSession = Depends(ge
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{employee_id}/performance")
+async def employee_performance(
+    employee_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Bills, gross, average ticket, items per ticket and payment mix.
+    Whole business dates (date_from / date_to, default today) come from the
+    per-shift aggregates; an exact since / until window is computed from invoices.
+    """
+    if since is not None or until is not None:
+        if since is None or until is None:
+            raise HTTPException(status_code=422, detail="since and until must be given together")
+        since, until = shifts.utc_naive(since), shifts.utc_naive(until)
+        if since >= until:
+            raise HTTPException(status_code=422, detail="since must be before until")
+        result = await shifts.employee_window(db, outlet_id, employee_id, since, until)
+        return {"employee_id": employee_id, "since": since.isoformat(), "until": until.isoformat(), **result}
+
+    today = shifts.shift_of(datetime.utcnow())[0]
+    date_from = date_from or date_to or today
+    date_to = date_to or max(date_from, today)
+    if date_from > date_to:
+        raise HTTPException(status_code=422, detail="date_from must not be after date_to")
+    result = await shifts.employee_totals(db, outlet_id, employee_id, date_from, date_to)
+    return {"employee_id": employee_id, "date_from": date_from.isoformat(), "date_to": date_to.isoformat(), **result}
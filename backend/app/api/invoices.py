@@ -1,24 +1,49 @@
 # app/api/invoices.py
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 import logging
 import traceback
+import base64
 from decimal import Decimal, InvalidOperation
-from typing import Any
+from datetime import date
+from typing import Any, Optional
 from fastapi import Path
 
 from app.db.session import get_db
-from app.crud import create_invoice_with_items
-from app.schemas.invoice import InvoiceCreate, InvoiceOut
+from app.db.outlets import current_outlet
+from app.crud import CatalogError, create_invoice_with_items
+from app.audit import audit_async
+from app.db.query_log import query_budget
+from app.admission import admission_limit, admission_priority
+from app.core.config import settings
+from app.schemas.invoice import (
+    InvoiceCreate, InvoiceOut, InvoiceSearchResponse, ReceiptBatchRequest, ReceiptBatchResponse,
+)
+from app import receipts, search, shifts
 from app.db.models import Invoice  # import model to re-query with selectinload
+from app.db.partitions import invoice_ids_clause
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/invoices", tags=["invoices"])
 
+# SQL statements per request (see app/db/query_log.py); raise deliberately, not by accident
+query_budget("/invoices/", 14)
+query_budget("/invoices/{invoice_id}", 3)
+query_budget("/invoices/{invoice_id}/pay", 7)
+query_budget("/invoices/{invoice_id}/receipt", 2)
+query_budget("/invoices/receipts", 2)
+query_budget("/invoices/search", 1)
+
+admission_limit("POST", "/invoices/", 8, queue=32)
+admission_limit("POST", "/invoices/{invoice_id}/pay", 8, queue=32)
+admission_priority("GET", "/invoices/{invoice_id}")
+admission_limit("POST", "/invoices/receipts", 2, queue=8)
+admission_limit("GET", "/invoices/search", 4, queue=16)
+
 
 def _decimal_to_float(value: Any) -> float:
     """
@@ -39,7 +64,9 @@ def _decimal_to_float(value: Any) -> float:
 
 
 @router.post("/", response_model=InvoiceOut)
-async def create_invoice(payload: InvoiceCreate, db: AsyncSession = Depends(get_db)):
+async def create_invoice(
+    payload: InvoiceCreate, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
     """
     Create an invoice with its items.
 
@@ -50,7 +77,7 @@ async def create_invoice(payload: InvoiceCreate, db: AsyncSession = Depends(get_
     """
     try:
         # create invoice in DB (this returns ORM object or dict depending on your CRUD)
-        invoice = await create_invoice_with_items(db, payload)
+        invoice = await create_invoice_with_items(db, outlet_id, payload)
 
         # Ensure we have a numeric invoice.id to re-query; invoice may be ORM object
         invoice_id = None
@@ -75,7 +102,13 @@ async def create_invoice(payload: InvoiceCreate, db: AsyncSession = Depends(get_
             )
 
         # Re-fetch invoice with items eagerly loaded to avoid async lazy loads
-        stmt = select(Invoice).options(selectinload(Invoice.items)).filter(Invoice.id == invoice_id)
+        stmt = (
+            select(Invoice)
+            .options(selectinload(Invoice.items))
+            # created_at pins the partition when INVOICE_PARTITIONING is on
+            .filter(Invoice.id == invoice_id, Invoice.created_at == invoice.created_at)
+            .filter(Invoice.outlet_id == outlet_id)
+        )
         result = await db.execute(stmt)
         invoice_fresh = result.scalars().first()
 
@@ -91,11 +124,13 @@ async def create_invoice(payload: InvoiceCreate, db: AsyncSession = Depends(get_
             "table_number": getattr(invoice_fresh, "table_number", None),
             "order_type": getattr(invoice_fresh, "order_type", None),
             "employee_id": getattr(invoice_fresh, "employee_id", None),
+            "notes": getattr(invoice_fresh, "notes", None),
             "status": getattr(invoice_fresh, "status", None),
             "created_at": getattr(invoice_fresh, "created_at").isoformat() if getattr(invoice_fresh, "created_at", None) else None,
             "total_amount": _decimal_to_float(getattr(invoice_fresh, "total_amount", 0)),
             # items: ensure each item contains expected fields (and 'line_total')
-            "items": []
+            "items": [],
+            "stock_warnings": getattr(invoice, "stock_warnings", []),
         }
 
         for it in getattr(invoice_fresh, "items", []) or []:
@@ -140,9 +175,21 @@ async def create_invoice(payload: InvoiceCreate, db: AsyncSession = Depends(get_
             }
             resp["items"].append(item_obj)
 
+        await audit_async(
+            "invoice.create", "invoice", resp["id"], actor=payload.created_by,
+            payload={"invoice_number": resp["invoice_number"], "total_amount": resp["total_amount"],
+                     "items": len(resp["items"]), "employee_id": resp["employee_id"]},
+        )
+        overrides = getattr(invoice, "price_overrides", [])
+        if overrides:
+            await audit_async("invoice.price_override", "invoice", resp["id"], actor=payload.created_by,
+                              payload={"lines": overrides})
+
         # Return the response dict (FastAPI will apply response_model validation)
         return resp
 
+    except CatalogError as e:
+        return JSONResponse(status_code=422, content={"detail": str(e)})
     except IntegrityError as e:
         logger.exception("Database integrity error while creating invoice")
         detail = str(getattr(e, "orig", e))
@@ -159,15 +206,54 @@ async def create_invoice(payload: InvoiceCreate, db: AsyncSession = Depends(get_
         )
 
 
+# declared before GET /{invoice_id} so "search" is not taken for an id
+@router.get("/search", response_model=InvoiceSearchResponse)
+async def search_invoices(
+    number: Optional[str] = Query(None, min_length=1, max_length=100, description="invoice_number prefix"),
+    table: Optional[str] = Query(None, min_length=1, max_length=50, description="exact table_number"),
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="words in notes / item descriptions"),
+    min_total: Optional[Decimal] = None,
+    max_total: Optional[Decimal] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=settings.SEARCH_PAGE_MAX),
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Find bills to reprint or void: invoice number prefix, table, words in notes or
+    item descriptions and a total range, within business dates date_from..date_to
+    (default today). Newest first; pass next_cursor back as ?cursor= for more.
+    """
+    try:
+        date_from, date_to = search.date_window(date_from, date_to)
+        results, next_cursor = await search.search_invoices(
+            db, outlet_id, date_from, date_to, number=number, table_number=table, q=q,
+            min_total=min_total, max_total=max_total, cursor=cursor, limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "results": results,
+        "next_cursor": next_cursor,
+    }
+
+
 @router.post("/{invoice_id}/pay")
-async def pay_invoice(invoice_id: int, db: AsyncSession = Depends(get_db)):
+async def pay_invoice(invoice_id: int, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)):
     """
     Marks an invoice as paid if it exists.
     """
     from app.db.models import Invoice  # avoid circular import
 
     try:
-        result = await db.execute(select(Invoice).filter(Invoice.id == invoice_id))
+        result = await db.execute(
+            # locked, so two concurrent pays can't both see it unpaid and count it twice
+            select(Invoice).filter(invoice_ids_clause([invoice_id]), Invoice.outlet_id == outlet_id).with_for_update()
+        )
         invoice = result.scalars().first()
         if not invoice:
             return JSONResponse(
@@ -175,9 +261,15 @@ async def pay_invoice(invoice_id: int, db: AsyncSession = Depends(get_db)):
                 content={"detail": f"Invoice {invoice_id} not found"}
             )
 
+        if invoice.status != "paid":
+            # no payment row on this path; counted under the "unrecorded" method
+            await shifts.record_payments(db, outlet_id, [(
+                invoice.employee_id, invoice.created_at, shifts.UNRECORDED, invoice.total_amount, True,
+            )])
         invoice.status = "paid"
         await db.commit()
         await db.refresh(invoice)
+        await audit_async("invoice.pay", "invoice", invoice.id, payload={"total_amount": invoice.total_amount})
 
         return {
             "id": invoice.id,
@@ -199,14 +291,20 @@ async def pay_invoice(invoice_id: int, db: AsyncSession = Depends(get_db)):
         )
 
 @router.get("/{invoice_id}", response_model=InvoiceOut)
-async def get_invoice(invoice_id: int = Path(..., gt=0), db: AsyncSession = Depends(get_db)):
+async def get_invoice(
+    invoice_id: int = Path(..., gt=0), outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
     """
     Return invoice by id (with items). Builds a response dict identical
     to the create path to avoid async lazy-load / pydantic issues.
     """
     try:
         # re-query invoice with items eagerly loaded
-        stmt = select(Invoice).options(selectinload(Invoice.items)).filter(Invoice.id == invoice_id)
+        stmt = (
+            select(Invoice)
+            .options(selectinload(Invoice.items))
+            .filter(invoice_ids_clause([invoice_id]), Invoice.outlet_id == outlet_id)
+        )
         result = await db.execute(stmt)
         invoice = result.scalars().first()
         if not invoice:
@@ -219,6 +317,7 @@ async def get_invoice(invoice_id: int = Path(..., gt=0), db: AsyncSession = Depe
             "table_number": getattr(invoice, "table_number", None),
             "order_type": getattr(invoice, "order_type", None),
             "employee_id": getattr(invoice, "employee_id", None),
+            "notes": getattr(invoice, "notes", None),
             "status": getattr(invoice, "status", None),
             "created_at": getattr(invoice, "created_at").isoformat() if getattr(invoice, "created_at", None) else None,
             "total_amount": _decimal_to_float(getattr(invoice, "total_amount", 0)),
@@ -260,4 +359,36 @@ async def get_invoice(invoice_id: int = Path(..., gt=0), db: AsyncSession = Depe
     except Exception as e:
         tb = traceback.format_exc()
         logger.error("Unhandled exception in get_invoice:\n%s", tb)
-        return JSONResponse(status_code=500, content={"detail":"Internal Server Error","error":str(e),"trace":tb})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"detail":"Internal Server Error","error":str(e),"trace":tb})
+
+@router.get("/{invoice_id}/receipt")
+async def get_receipt(
+    invoice_id: int = Path(..., gt=0),
+    format: str = Query("text", regex="^(text|escpos|pdf)$"),
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    """Receipt rendered server-side: 80mm text, raw ESC/POS bytes for the printer, or PDF."""
+    rendered, missing = await receipts.render_receipts(db, outlet_id, [invoice_id], format)
+    if missing:
+        raise HTTPException(404, "Not Found")
+    headers = {"Content-Disposition": f'inline; filename="receipt-{invoice_id}.{"txt" if format == "text" else format}"'}
+    return Response(rendered[invoice_id], media_type=receipts.MEDIA_TYPES[format], headers=headers)
+
+
+@router.post("/receipts", response_model=ReceiptBatchResponse)
+async def batch_receipts(
+    payload: ReceiptBatchRequest, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
+    """Render many receipts in one request (e.g. end-of-shift reprints); binary formats come back base64."""
+    rendered, missing = await receipts.render_receipts(db, outlet_id, payload.invoice_ids, payload.format)
+    out = []
+    for invoice_id in dict.fromkeys(payload.invoice_ids):
+        body = rendered.get(invoice_id)
+        if body is None:
+            continue
+        if payload.format == "text":
+            out.append({"invoice_id": invoice_id, "encoding": "utf-8", "content": body.decode("utf-8")})
+        else:
+            out.append({"invoice_id": invoice_id, "encoding": "base64", "content": base64.b64encode(body).decode()})
+    return {"format": payload.format, "receipts": out, "missing": missing}
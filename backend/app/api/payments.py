@@ -3,17 +3,29 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.db.session import get_db
+from app.db.outlets import current_outlet
 from app.db.models import Invoice
 from app.db.models import Payment
+from app.db.partitions import invoice_ids_clause
 from datetime import datetime
 import traceback
+from app.audit import audit_async
+from app.db.query_log import query_budget
+from app.admission import admission_limit
+from app import shifts
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
+query_budget("/payments/{invoice_id}/pay", 9)
+admission_limit("POST", "/payments/{invoice_id}/pay", 8, queue=32)
+
 @router.post("/{invoice_id}/pay")
-async def pay_invoice(invoice_id: int, db: AsyncSession = Depends(get_db)):
+async def pay_invoice(invoice_id: int, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)):
     try:
-        result = await db.execute(select(Invoice).filter(Invoice.id == invoice_id))
+        result = await db.execute(
+            # locked, so two concurrent pays can't both see it unpaid and count it twice
+            select(Invoice).filter(invoice_ids_clause([invoice_id]), Invoice.outlet_id == outlet_id).with_for_update()
+        )
         invoice = result.scalars().first()
 
         if not invoice:
@@ -21,16 +33,24 @@ async def pay_invoice(invoice_id: int, db: AsyncSession = Depends(get_db)):
 
         payment = Payment(
             invoice_id=invoice.id,
+            invoice_created_at=invoice.created_at,
             paid_at=datetime.utcnow(),
             amount=invoice.total_amount,
             method="cash",
             reference=f"PAY-{invoice.invoice_number}"
         )
+        await shifts.record_payments(db, outlet_id, [(
+            invoice.employee_id, invoice.created_at, payment.method, payment.amount, invoice.status != "paid",
+        )])
         invoice.status = "paid"
 
         db.add(payment)
         await db.commit()
         await db.refresh(invoice)
+        await audit_async(
+            "payment.create", "payment", payment.id,
+            payload={"invoice_id": invoice.id, "amount": payment.amount, "method": payment.method},
+        )
 
         return {
             "id": invoice.id,
@@ -1,22 +1,95 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
-from app.schemas.product import ProductCreate, ProductOut
-from app.crud import create_product, get_product
+from app.db.outlets import current_outlet
+from app.schemas.product import ProductCreate, ProductOut, StockAdjust, StockSettings, StockOut
+from app.crud import CatalogError, create_product, get_product
 from typing import List
+from app.audit import audit_async
+from app import stock
+from app.admission import admission_limit, admission_priority
 
 router = APIRouter(prefix="/products", tags=["products"])
 
+admission_priority("GET", "/products/{product_id}")
+admission_priority("GET", "/products/{product_id}/stock")
+admission_limit("POST", "/products/stock/reconcile", 1)
+
 @router.post("/", response_model=ProductOut)
-async def create_product_endpoint(payload: ProductCreate, db: AsyncSession = Depends(get_db)):
-    obj = await create_product(db, payload)
+async def create_product_endpoint(
+    payload: ProductCreate, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
+    try:
+        obj = await create_product(db, outlet_id, payload)
+    except CatalogError as e:
+        raise HTTPException(422, str(e))
     await db.commit()
     await db.refresh(obj)
+    await audit_async(
+        "product.price_set", "product", obj.id,
+        payload={"unit_price": obj.current_unit_price, "tax_slab_id": obj.tax_slab_id},
+    )
     return obj
 
 @router.get("/{product_id}", response_model=ProductOut)
-async def get_product_endpoint(product_id: int, db: AsyncSession = Depends(get_db)):
-    obj = await get_product(db, product_id)
+async def get_product_endpoint(
+    product_id: int, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
+    obj = await get_product(db, outlet_id, product_id)
     if not obj:
         raise HTTPException(404, "Product not found")
     return obj
+
+
+async def _stock_out(db: AsyncSession, outlet_id: int, product_id: int):
+    obj = await get_product(db, outlet_id, product_id)
+    if not obj:
+        raise HTTPException(404, "Product not found")
+    await db.refresh(obj)
+    levels = await stock.on_hand(db, [product_id])
+    return {"product_id": obj.id, "track_stock": obj.track_stock, "shards": obj.stock_shards,
+            "on_hand": levels[product_id]}
+
+
+@router.get("/{product_id}/stock", response_model=StockOut)
+async def get_stock(product_id: int, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)):
+    return await _stock_out(db, outlet_id, product_id)
+
+
+@router.put("/{product_id}/stock/settings", response_model=StockOut)
+async def set_stock_settings(
+    product_id: int,
+    payload: StockSettings,
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    if not await get_product(db, outlet_id, product_id):
+        raise HTTPException(404, "Product not found")
+    await stock.configure(db, product_id, payload.track_stock, payload.shards)
+    await db.commit()
+    return await _stock_out(db, outlet_id, product_id)
+
+
+@router.post("/{product_id}/stock", response_model=StockOut)
+async def adjust_stock(
+    product_id: int,
+    payload: StockAdjust,
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    if not await get_product(db, outlet_id, product_id):
+        raise HTTPException(404, "Product not found")
+    await stock.adjust(db, product_id, payload.delta, payload.reason, payload.note)
+    await db.commit()
+    await audit_async(
+        "stock." + payload.reason, "product", product_id, payload={"delta": payload.delta, "note": payload.note}
+    )
+    return await _stock_out(db, outlet_id, product_id)
+
+
+@router.post("/stock/reconcile")
+async def reconcile_stock(
+    fix: bool = True, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
+    """Run the periodic counter/ledger reconciliation now, for this outlet's products."""
+    return await stock.reconcile(db, fix=fix, outlet_id=outlet_id)
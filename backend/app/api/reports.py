@@ -0,0 +1,59 @@
+# app/api/reports.py
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import shifts
+from app.admission import admission_limit
+from app.audit import audit_async
+from app.db.query_log import query_budget
+from app.db.outlets import current_outlet
+from app.db.session import get_db
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+query_budget("/reports/shifts", 3)
+admission_limit("POST", "/reports/shifts/rebuild", 1)
+
+
+def _date_range(date_from: Optional[date], date_to: Optional[date]):
+    today = shifts.shift_of(datetime.utcnow())[0]
+    date_from = date_from or date_to or today
+    date_to = date_to or max(date_from, today)
+    if date_from > date_to:
+        raise HTTPException(status_code=422, detail="date_from must not be after date_to")
+    return date_from, date_to
+
+
+@router.get("/shifts")
+async def shift_report(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    employee_id: Optional[int] = None,
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    """Per business date, shift and employee: bills, gross, average ticket, items per ticket, payment mix."""
+    date_from, date_to = _date_range(date_from, date_to)
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "shifts": [{"name": name, "starts": start.strftime("%H:%M")} for start, name in shifts.SHIFTS],
+        "rows": await shifts.shift_report(db, outlet_id, date_from, date_to, employee_id),
+    }
+
+
+@router.post("/shifts/rebuild")
+async def rebuild_shift_report(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    """Recompute the shift aggregates for a date range from invoices and payments."""
+    date_from, date_to = _date_range(date_from, date_to)
+    result = await shifts.rebuild(db, outlet_id, date_from, date_to)
+    await audit_async("reports.shifts.rebuild", "outlet", outlet_id, payload=result)
+    return result
@@ -0,0 +1,69 @@
+# app/api/sync.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import logging
+
+from app.db.session import get_db
+from app.db.outlets import current_outlet
+from app.schemas.sync import SyncPushRequest, SyncPushResponse, CatalogChanges
+from app.sync import SyncError, push_batch, catalog_changes
+from app.audit import audit_async
+from app.admission import admission_limit
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+# reconnecting terminals push whole offline backlogs; don't let them crowd out live billing
+admission_limit("POST", "/sync/push", 2, queue=8)
+admission_limit("GET", "/sync/changes", 4, queue=16)
+
+
+@router.post("/push", response_model=SyncPushResponse)
+async def push(
+    payload: SyncPushRequest, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
+    """
+    Apply a batch of invoices/payments made offline by one terminal. Safe to
+    retry: records already applied come back as "duplicate" with their server id.
+    Send `cursor` to get catalog changes in the same round trip.
+    """
+    try:
+        results = await push_batch(db, outlet_id, payload)
+    except SyncError as e:
+        await db.rollback()
+        raise HTTPException(status_code=422, detail=str(e))
+    except IntegrityError as e:
+        await db.rollback()
+        logger.exception("Integrity error applying sync batch from %s", payload.terminal_id)
+        raise HTTPException(status_code=409, detail=str(getattr(e, "orig", e)))
+
+    applied = sum(1 for r in results if r["status"] == "applied")
+    await audit_async("sync.push", "terminal", payload.terminal_id,
+                      payload={"records": len(results), "applied": applied})
+
+    changes = None
+    if payload.cursor is not None:
+        try:
+            changes = await catalog_changes(db, outlet_id, payload.cursor or None)
+        except SyncError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    return {"terminal_id": payload.terminal_id, "results": results, "changes": changes}
+
+
+@router.get("/changes", response_model=CatalogChanges)
+async def changes(
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    outlet_id: int = Depends(current_outlet),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Product / tax slab / category rows changed since `cursor`, plus ids deleted since then;
+    all rows (`snapshot: true`, paged) when omitted.
+    """
+    try:
+        return await catalog_changes(db, outlet_id, cursor, limit)
+    except SyncError as e:
+        raise HTTPException(status_code=422, detail=str(e))
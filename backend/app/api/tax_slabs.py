@@ -3,8 +3,11 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from app.db.session import get_db
+from app.db.outlets import current_outlet
 from app.db.models import TaxSlab  # adjust if separate model
 from sqlalchemy.future import select
+from app.audit import audit_async
+from app.crud import record_catalog_change
 
 router = APIRouter(prefix="/tax_slabs", tags=["tax_slabs"])
 
@@ -13,12 +16,19 @@ class TaxSlabCreate(BaseModel):
     name: str
 
 @router.post("/")
-async def create_tax_slab(payload: TaxSlabCreate, db: AsyncSession = Depends(get_db)):
-    existing = await db.execute(select(TaxSlab).where(TaxSlab.rate == payload.rate))
+async def create_tax_slab(
+    payload: TaxSlabCreate, outlet_id: int = Depends(current_outlet), db: AsyncSession = Depends(get_db)
+):
+    existing = await db.execute(
+        select(TaxSlab).where(TaxSlab.outlet_id == outlet_id, TaxSlab.rate == payload.rate)
+    )
     slab = existing.scalars().first()
     if not slab:
-        slab = TaxSlab(rate=payload.rate, name=payload.name)
+        slab = TaxSlab(outlet_id=outlet_id, rate=payload.rate, name=payload.name)
         db.add(slab)
+        await db.flush()
+        await record_catalog_change(db, outlet_id, "tax_slabs", [slab.id])
         await db.commit()
         await db.refresh(slab)
+        await audit_async("tax_slab.rate_set", "tax_slab", slab.id, payload={"rate": slab.rate, "name": slab.name})
     return {"id": slab.id, "rate": slab.rate, "name": slab.name}
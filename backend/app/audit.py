@@ -0,0 +1,314 @@
+# app/audit.py
+"""
+Asynchronous, batched writer for the audit_log table.
+
+Request handlers `await audit_async(...)`, which puts the event on a bounded
+in-memory queue, waiting up to AUDIT_PUT_TIMEOUT seconds for space when it is
+full (backpressure). A background task drains the queue and writes events with
+one multi-row INSERT per batch, whenever AUDIT_BATCH_SIZE events are waiting
+or AUDIT_FLUSH_INTERVAL seconds have passed. On shutdown the queue is drained.
+
+Events are not thrown away: one that still finds the queue full, or a batch
+whose INSERT fails AUDIT_FLUSH_RETRIES more times (with backoff), is appended
+to a spill file in AUDIT_SPILL_DIR. Spill files are replayed into audit_log
+when the writer starts and after the next successful flush; events the
+database rejects outright are set aside in a `.rejected` file. `dropped` only
+counts events that could not be spilled either. `audit()` is the non-waiting
+variant for code that cannot await.
+
+Payloads are stored as msgpack bytes; use `decode_payload()` to read them
+(it also reads the JSON text of rows from before the change).
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+import msgpack
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.core.config import settings
+from app.db.models import AuditLog
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def encode_payload(payload: Any) -> Optional[bytes]:
+    if payload is None:
+        return None
+    # default=str covers Decimal / datetime values coming straight off the models
+    return msgpack.packb(payload, default=str, use_bin_type=True)
+
+
+def decode_payload(data: Optional[bytes]) -> Any:
+    """msgpack payload, or the JSON text rows written before the column became binary."""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        return json.loads(data)
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except ValueError:
+        # JSON text reads as several msgpack values back to back (ExtraData) or none at all
+        return json.loads(data.decode("utf-8"))
+
+
+def _actor_id(actor) -> Optional[int]:
+    # created_by arrives as a string in some schemas
+    try:
+        return int(actor) if actor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class AuditWriter:
+    def __init__(
+        self,
+        session_factory,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        put_timeout: float,
+        retries: int = 3,
+        spill_dir: Optional[str] = None,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.spill_dir = spill_dir
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.spilled = 0
+        self.replayed = 0
+        self._spill_pending = False
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @staticmethod
+    def _event(action, entity, entity_id, actor, payload) -> dict:
+        return {
+            "actor_id": _actor_id(actor),
+            "action": action,
+            "entity": entity,
+            "entity_id": str(entity_id) if entity_id is not None else None,
+            "payload": encode_payload(payload),
+            "created_at": datetime.utcnow(),
+        }
+
+    def emit(self, action: str, entity: str = None, entity_id=None, actor=None, payload: Any = None) -> bool:
+        """Queue an event without waiting; spills it to disk if the queue is full. False if it was not queued."""
+        event = self._event(action, entity, entity_id, actor, payload)
+        if self._stopping:
+            self.spill([event])
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.spill([event])
+            return False
+
+    async def emit_wait(self, action: str, entity: str = None, entity_id=None, actor=None, payload: Any = None) -> bool:
+        """Like emit(), but applies backpressure: wait up to put_timeout for queue space before spilling."""
+        event = self._event(action, entity, entity_id, actor, payload)
+        if self._stopping:
+            self.spill([event])
+            return False
+        try:
+            await asyncio.wait_for(self.queue.put(event), self.put_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.spill([event])
+            return False
+
+    # --- spill files -------------------------------------------------------
+
+    def spill(self, events: list):
+        """Append events to this process's spill file (or count them dropped if that fails)."""
+        if not self.spill_dir:
+            self._drop(len(events))
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f"audit-{os.getpid()}.spill")
+            self._append(path, events)
+            self.spilled += len(events)
+            self._spill_pending = True
+        except OSError:
+            logger.exception("Could not spill %d audit events", len(events))
+            self._drop(len(events))
+
+    def _drop(self, n: int):
+        self.dropped += n
+        if self.dropped % 1000 < n or self.dropped == n:
+            logger.warning("%d audit events dropped so far", self.dropped)
+
+    @staticmethod
+    def _append(path: str, events: list):
+        with open(path, "ab") as fh:
+            for event in events:
+                fh.write(msgpack.packb({**event, "created_at": event["created_at"].isoformat()}, use_bin_type=True))
+
+    @staticmethod
+    def _read_spill(path: str) -> list:
+        with open(path, "rb") as fh:
+            events = list(msgpack.Unpacker(fh, raw=False))
+        for event in events:
+            event["created_at"] = datetime.fromisoformat(event["created_at"])
+        return events
+
+    async def replay_spill(self) -> int:
+        """Write every spill file in spill_dir to audit_log, one transaction per file; returns events written."""
+        self._spill_pending = False
+        if not self.spill_dir:
+            return 0
+        total = 0
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "*.spill"))):
+            claimed = f"{path}.{os.getpid()}.replaying"
+            try:
+                # the rename claims the file: other workers (and our own spill()) stop seeing it
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            try:
+                events = await asyncio.to_thread(self._read_spill, claimed)
+                try:
+                    async with self.session_factory() as session:
+                        for i in range(0, len(events), self.batch_size):
+                            await session.execute(insert(AuditLog).values(events[i:i + self.batch_size]))
+                        await session.commit()
+                except (IntegrityError, DataError):
+                    events = await self._replay_one_by_one(events)
+            except Exception:
+                logger.exception("Could not replay audit spill file %s; will retry", path)
+                os.rename(claimed, os.path.join(self.spill_dir, f"audit-{uuid.uuid4().hex}.spill"))
+                self._spill_pending = True
+                break
+            os.remove(claimed)
+            total += len(events)
+        self.replayed += total
+        return total
+
+    async def _replay_one_by_one(self, events: list) -> list:
+        """Insert events singly so the ones the database rejects (e.g. an unknown actor) don't block the rest.
+
+        Rejected events go to a `.rejected` file next to the spill files, which is not replayed.
+        """
+        written, rejected = [], []
+        async with self.session_factory() as session:
+            for event in events:
+                try:
+                    async with session.begin_nested():
+                        await session.execute(insert(AuditLog).values([event]))
+                    written.append(event)
+                except (IntegrityError, DataError):
+                    rejected.append(event)
+            await session.commit()
+        if rejected:
+            path = os.path.join(self.spill_dir, f"audit-{uuid.uuid4().hex}.rejected")
+            self._append(path, rejected)
+            logger.error("%d audit events were rejected by the database; kept in %s", len(rejected), path)
+        return written
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop accepting events and flush whatever is queued (bounded by `timeout`, then spilled)."""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.error("Audit writer did not drain in %.1fs, spilling %d events", timeout, self.queue.qsize())
+            rest = []
+            while not self.queue.empty():
+                rest.append(self.queue.get_nowait())
+            if rest:
+                self.spill(rest)
+        self._task = None
+
+    async def _next_batch(self) -> list:
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.queue.get(), self.flush_interval))
+        except asyncio.TimeoutError:
+            return batch
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._stopping:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        await self.replay_spill()
+        while not (self._stopping and self.queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self.flush(batch)
+
+    async def flush(self, batch: list) -> bool:
+        """Write one batch, retrying with backoff; a batch that still fails is spilled to disk."""
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session_factory() as session:
+                    # one INSERT ... VALUES (...), (...), ... per batch
+                    await session.execute(insert(AuditLog).values(batch))
+                    await session.commit()
+                self.written += len(batch)
+                break
+            except Exception as e:
+                # a constraint/data error will not go away on retry: spill now, the replay isolates the bad event
+                if attempt == self.retries or isinstance(e, (IntegrityError, DataError)):
+                    self.failed += len(batch)
+                    logger.exception("Failed to write %d audit events, spilling them: %s", len(batch), e)
+                    self.spill(batch)
+                    return False
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 5.0))
+        if self._spill_pending:
+            await self.replay_spill()
+        return True
+
+
+audit_writer = AuditWriter(
+    AsyncSessionLocal,
+    max_queue=settings.AUDIT_MAX_QUEUE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    put_timeout=settings.AUDIT_PUT_TIMEOUT,
+    retries=settings.AUDIT_FLUSH_RETRIES,
+    spill_dir=settings.AUDIT_SPILL_DIR,
+)
+
+
+def audit(action: str, entity: str = None, entity_id=None, actor=None, payload: Any = None) -> bool:
+    return audit_writer.emit(action, entity, entity_id, actor, payload)
+
+
+async def audit_async(action: str, entity: str = None, entity_id=None, actor=None, payload: Any = None) -> bool:
+    return await audit_writer.emit_wait(action, entity, entity_id, actor, payload)
@@ -3,6 +3,22 @@ import os
 from pydantic import BaseSettings, AnyUrl, validator
 from typing import Optional
 
+DEFAULT_SQLITE_URL = "sqlite+aiosqlite:///./hotel_billing.db"
+
+
+def async_database_url(v: str) -> str:
+    """Map a database URL to its async driver form."""
+    # if somebody used the short `postgres://` form, convert to SQLAlchemy asyncpg form
+    if v.startswith("postgres://"):
+        return v.replace("postgres://", "postgresql+asyncpg://", 1)
+    if v.startswith("postgresql://"):
+        return v.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if v.startswith("sqlite://"):
+        return v.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    # if already has an async driver prefix, return as-is
+    return v
+
+
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = os.environ.get("SECRET_KEY", "a_very_secret_key_fallback")
@@ -11,22 +27,113 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24 * 8))  # 8 days default
     REFRESH_TOKEN_EXPIRE_MINUTES: int = int(os.environ.get("REFRESH_TOKEN_EXPIRE_MINUTES", 60 * 24 * 30))  # 30 days default
 
-    # DB: accept a plain string, but we will normalise it for asyncpg usage later
+    # DB: accept a plain string; the validator maps it to an async driver.
+    # Postgres (asyncpg) in production; SQLite (aiosqlite) for tests, benchmarks and offline dev:
+    #   sqlite+aiosqlite:///./hotel_billing.db   (file)
+    #   sqlite+aiosqlite://                      (in-memory, lives as long as the process)
     DATABASE_URL: str = os.environ.get("DATABASE_URL", "")
+    # Outlet local time (timestamps are stored in UTC): receipts, analytics hour buckets. e.g. 330 for IST
+    LOCAL_UTC_OFFSET_MINUTES: int = int(os.environ.get("LOCAL_UTC_OFFSET_MINUTES", 0))
+
+    # Outlets (app/db/outlets.py): requests pick one with the X-Outlet-Id header, this one when absent
+    DEFAULT_OUTLET_ID: int = int(os.environ.get("DEFAULT_OUTLET_ID", 1))
+    # outlets whose data lives elsewhere, "outlet_id=value" comma-separated:
+    #   OUTLET_DATABASE_URLS="7=postgresql://db2/pos,9=postgresql://db2/pos"   (others: DATABASE_URL)
+    #   OUTLET_SCHEMAS="9=outlet_9"                                            (Postgres schema on that URL)
+    OUTLET_DATABASE_URLS: str = os.environ.get("OUTLET_DATABASE_URLS", "")
+    OUTLET_SCHEMAS: str = os.environ.get("OUTLET_SCHEMAS", "")
+
+    # Shift start times in local time, "name=HH:MM" comma-separated; each runs until the next one starts
+    SHIFTS: str = os.environ.get("SHIFTS", "morning=06:00,evening=15:00")
+
+    # Postgres connection pool (SQLite always uses a single connection)
+    DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+
+    # Monthly RANGE partitioning of invoice / invoice_item on created_at (Postgres only).
+    # Must be decided before the tables are first created; see app/db/partitions.py
+    INVOICE_PARTITIONING: bool = os.environ.get("INVOICE_PARTITIONING", "false").lower() in ("1", "true", "yes")
+    PARTITION_MONTHS_AHEAD: int = int(os.environ.get("PARTITION_MONTHS_AHEAD", 3))
+    PARTITION_RETAIN_MONTHS: int = int(os.environ.get("PARTITION_RETAIN_MONTHS", 12))
+    ARCHIVE_DIR: str = os.environ.get("ARCHIVE_DIR", "archive")
+
+    # Prometheus /metrics + SQL timing hooks (app/metrics.py)
+    METRICS_ENABLED: bool = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # Per-request SQL recorder (app/db/query_log.py): slow-query log, N+1 detector, query budgets
+    QUERY_LOG_ENABLED: bool = os.environ.get("QUERY_LOG_ENABLED", "false").lower() in ("1", "true", "yes")
+    SLOW_QUERY_MS: float = float(os.environ.get("SLOW_QUERY_MS", 200))
+    N_PLUS_ONE_THRESHOLD: int = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+    QUERY_BUDGET_STRICT: bool = os.environ.get("QUERY_BUDGET_STRICT", "false").lower() in ("1", "true", "yes")
+
+    # Admission control for database-bound routes (app/admission.py)
+    ADMISSION_ENABLED: bool = os.environ.get("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    # requests allowed to use the database at once; 0 = pool size + overflow
+    ADMISSION_DB_CONCURRENCY: int = int(os.environ.get("ADMISSION_DB_CONCURRENCY", 0))
+    ADMISSION_DB_RESERVED: int = int(os.environ.get("ADMISSION_DB_RESERVED", 2))  # kept for priority reads
+    ADMISSION_DB_QUEUE: int = int(os.environ.get("ADMISSION_DB_QUEUE", 50))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 2.0))
+    ADMISSION_RETRY_AFTER: int = int(os.environ.get("ADMISSION_RETRY_AFTER", 2))
+
+    # Server-side receipts (app/receipts.py)
+    RECEIPT_WIDTH: int = int(os.environ.get("RECEIPT_WIDTH", 48))  # characters per line: 48 = 80mm, 32 = 58mm
+    RECEIPT_HEADER: str = os.environ.get("RECEIPT_HEADER", "Hotel Billing")  # lines separated by "|"
+    RECEIPT_FOOTER: str = os.environ.get("RECEIPT_FOOTER", "Thank you! Visit again")
+    RECEIPT_CACHE_BYTES: int = int(os.environ.get("RECEIPT_CACHE_BYTES", 16 * 1024 * 1024))
+    RECEIPT_PDF_WORKERS: int = int(os.environ.get("RECEIPT_PDF_WORKERS", 2))
+    RECEIPT_BATCH_MAX: int = int(os.environ.get("RECEIPT_BATCH_MAX", 200))
+
+    # GET /invoices/search (app/search.py): widest date window, and page size cap
+    SEARCH_MAX_DAYS: int = int(os.environ.get("SEARCH_MAX_DAYS", 92))
+    SEARCH_PAGE_MAX: int = int(os.environ.get("SEARCH_PAGE_MAX", 200))
+
+    # Stock counters are checked against the ledger this often (seconds, 0 = off); see app/stock.py
+    STOCK_RECONCILE_INTERVAL: float = float(os.environ.get("STOCK_RECONCILE_INTERVAL", 300))
+
+    # Columnar invoice-item snapshot for /analytics/* (app/analytics.py)
+    ANALYTICS_DIR: str = os.environ.get("ANALYTICS_DIR", "analytics_data")
+    ANALYTICS_SNAPSHOT_INTERVAL: float = float(os.environ.get("ANALYTICS_SNAPSHOT_INTERVAL", 900))  # 0 = off
+    ANALYTICS_SNAPSHOT_LAG: int = int(os.environ.get("ANALYTICS_SNAPSHOT_LAG", 60))  # skip bills newer than this
+    ANALYTICS_SEGMENT_ROWS: int = int(os.environ.get("ANALYTICS_SEGMENT_ROWS", 500000))
+    # database the scheduled export reads (a read replica); the schedule stays off until it is set
+    ANALYTICS_SOURCE_URL: str = os.environ.get("ANALYTICS_SOURCE_URL", "")
+    # each run re-reads items this far below the highest id exported (late commits), deduplicated by id
+    ANALYTICS_RESCAN_IDS: int = int(os.environ.get("ANALYTICS_RESCAN_IDS", 100000))
+
+    # Audit log writer (app/audit.py): bounded queue, flushed in multi-row batches
+    AUDIT_MAX_QUEUE: int = int(os.environ.get("AUDIT_MAX_QUEUE", 10000))
+    AUDIT_BATCH_SIZE: int = int(os.environ.get("AUDIT_BATCH_SIZE", 500))
+    AUDIT_FLUSH_INTERVAL: float = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1.0))
+    AUDIT_PUT_TIMEOUT: float = float(os.environ.get("AUDIT_PUT_TIMEOUT", 0.05))
+    AUDIT_FLUSH_RETRIES: int = int(os.environ.get("AUDIT_FLUSH_RETRIES", 3))
+    # events that could not be queued or written are appended here and replayed later
+    AUDIT_SPILL_DIR: str = os.environ.get("AUDIT_SPILL_DIR", "audit_spill")
 
     class Config:
         case_sensitive = True
 
     # Optionally validate / normalize DB url here (not necessary but handy)
-    @validator("DATABASE_URL", pre=True)
-    def normalize_database_url(cls, v: Optional[str]) -> str:
+    @validator("DATABASE_URL", "ANALYTICS_SOURCE_URL", pre=True)
+    def normalize_database_url(cls, v: Optional[str], field) -> str:
         if not v:
-            return ""
-        # if somebody used the short `postgres://` form, convert to SQLAlchemy asyncpg form
-        if v.startswith("postgres://"):
-            return v.replace("postgres://", "postgresql+asyncpg://", 1)
-        # if already has asyncpg prefix, return as-is
-        return v
+            if field.name != "DATABASE_URL":
+                return ""
+            # no server configured: local SQLite file next to the app
+            return DEFAULT_SQLITE_URL
+        return async_database_url(v)
+
+    @validator("OUTLET_DATABASE_URLS")
+    def normalize_outlet_urls(cls, v: str) -> str:
+        parts = []
+        for part in v.split(","):
+            outlet, sep, url = part.strip().partition("=")
+            parts.append(f"{outlet}={async_database_url(url.strip())}" if sep else part.strip())
+        return ",".join(p for p in parts if p)
+
+    @validator("INVOICE_PARTITIONING")
+    def partitioning_needs_postgres(cls, v: bool, values) -> bool:
+        # declarative partitioning is a Postgres feature; other backends keep plain tables
+        return bool(v) and values.get("DATABASE_URL", "").startswith("postgresql")
 
 # instantiate settings
 settings = Settings()
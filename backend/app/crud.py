@@ -1,17 +1,59 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, insert, update
+from sqlalchemy import select, insert, update, func
 from app.db import models
 from decimal import Decimal
+from datetime import datetime
 from app.db.models import Invoice, InvoiceItem   # ✅ you were missing this!
+from app import shifts, stock
+from app.db.dialect import dialect_name
 import traceback                                 # ✅ and this too
 
+# pg_advisory_xact_lock(CATALOG_LOCK, outlet_id): one catalog writer per outlet at a time
+CATALOG_LOCK = 0x0CA7A106
 
-async def get_product(db: AsyncSession, product_id: int):
-    q = await db.execute(select(models.Product).where(models.Product.id == product_id))
+
+class CatalogError(ValueError):
+    """A product, tax slab, category or employee id that doesn't belong to the request's outlet (422)."""
+
+
+async def record_catalog_change(db: AsyncSession, outlet_id: int, entity: str, entity_ids):
+    """
+    Log catalog rows ("products" / "tax_slabs" / "categories") created, changed or deleted in
+    this transaction, for terminal delta sync (app/sync.py). Every catalog write must call it.
+
+    On Postgres the transaction first takes a per-outlet advisory lock held until commit, so
+    catalog_change.seq values commit in order: a terminal that has read up to seq N can never
+    later find an N-1 that was still in flight. SQLite already has a single writer.
+    """
+    if dialect_name(db) == "postgresql":
+        await db.execute(select(func.pg_advisory_xact_lock(CATALOG_LOCK, outlet_id)))
+    await db.execute(insert(models.CatalogChange), [
+        {"outlet_id": outlet_id, "entity": entity, "entity_id": entity_id} for entity_id in entity_ids
+    ])
+
+
+
+async def get_product(db: AsyncSession, outlet_id: int, product_id: int):
+    q = await db.execute(
+        select(models.Product).where(models.Product.id == product_id, models.Product.outlet_id == outlet_id)
+    )
     return q.scalar_one_or_none()
 
-async def create_product(db: AsyncSession, product_in):
+async def check_catalog_refs(db: AsyncSession, outlet_id: int, tax_slab_id=None, category_id=None):
+    """Raise CatalogError unless the tax slab / category (when given) are the outlet's own."""
+    for model, ref_id, label in ((models.TaxSlab, tax_slab_id, "tax_slab_id"),
+                                 (models.Category, category_id, "category_id")):
+        if ref_id is None:
+            continue
+        q = await db.execute(select(model.id).where(model.id == ref_id, model.outlet_id == outlet_id))
+        if q.scalar_one_or_none() is None:
+            raise CatalogError(f"{label} {ref_id} not found in this outlet")
+
+
+async def create_product(db: AsyncSession, outlet_id: int, product_in):
+    await check_catalog_refs(db, outlet_id, product_in.tax_slab_id, product_in.category_id)
     obj = models.Product(
+        outlet_id=outlet_id,
         name=product_in.name,
         sku=product_in.sku,
         category_id=product_in.category_id,
@@ -20,61 +62,136 @@ async def create_product(db: AsyncSession, product_in):
     )
     db.add(obj)
     await db.flush()
+    await record_catalog_change(db, outlet_id, "products", [obj.id])
     return obj
 
-async def get_employee_by_code(db: AsyncSession, code: str):
-    q = await db.execute(select(models.Employee).where(models.Employee.employee_code == code))
+async def get_employee_by_code(db: AsyncSession, outlet_id: int, code: str):
+    q = await db.execute(
+        select(models.Employee).where(models.Employee.employee_code == code, models.Employee.outlet_id == outlet_id)
+    )
     return q.scalar_one_or_none()
 
 # invoice creation in a transaction
 from sqlalchemy import func
 
-async def create_invoice_with_items(db: AsyncSession, payload):
+
+async def list_prices(db: AsyncSession, outlet_id: int, product_ids) -> dict:
+    """{product_id: current_unit_price} for the outlet's products among `product_ids`."""
+    ids = {pid for pid in product_ids if pid is not None}
+    if not ids:
+        return {}
+    q = await db.execute(
+        select(models.Product.id, models.Product.current_unit_price)
+        .where(models.Product.outlet_id == outlet_id, models.Product.id.in_(ids))
+    )
+    return dict(q.all())
+
+
+async def outlet_employees(db: AsyncSession, outlet_id: int, employee_ids) -> set:
+    """The ids among `employee_ids` that are the outlet's own employees."""
+    ids = {eid for eid in employee_ids if eid is not None}
+    if not ids:
+        return set()
+    q = await db.execute(
+        select(models.Employee.id).where(models.Employee.outlet_id == outlet_id, models.Employee.id.in_(ids))
+    )
+    return set(q.scalars())
+
+
+def foreign_products(lines, prices: dict) -> list:
+    """Product ids on `lines` that aren't the outlet's (missing from its list_prices)."""
+    return sorted({line["product_id"] for line in lines if line["product_id"] is not None} - set(prices))
+
+
+def price_overrides(lines, prices: dict) -> list:
+    """Lines billed at something other than the product's list price (audited as price changes)."""
+    return [
+        {"product_id": line["product_id"], "list_price": prices[line["product_id"]], "unit_price": line["unit_price"]}
+        for line in lines
+        if line["product_id"] in prices and line["unit_price"] != prices[line["product_id"]]
+    ]
+
+
+def invoice_item_values(item) -> dict:
+    """Column values (with computed line totals) for one InvoiceItemCreate."""
+    line_total_excl = Decimal(str(item.unit_price)) * Decimal(str(item.quantity))
+    line_tax = (line_total_excl * Decimal(str(item.tax_rate))) / Decimal("100")
+    return {
+        "product_id": item.product_id,
+        "description": item.description,
+        "quantity": Decimal(str(item.quantity)),
+        "unit_price": Decimal(str(item.unit_price)),
+        "tax_rate": Decimal(str(item.tax_rate)),
+        "discount_amount": Decimal(str(item.discount_amount or 0)),
+        "line_total_excl_tax": line_total_excl,
+        "line_tax_amount": line_tax,
+        "line_total_incl_tax": line_total_excl + line_tax,
+    }
+
+
+async def create_invoice_with_items(db: AsyncSession, outlet_id: int, payload):
     """
     Create invoice and its associated items atomically.
     """
     try:
-        # Create the Invoice object
+        lines = [invoice_item_values(item) for item in payload.items]
+        prices = await list_prices(db, outlet_id, [line["product_id"] for line in lines])
+        foreign = foreign_products(lines, prices)
+        if foreign:
+            raise CatalogError(f"products not found in this outlet: {foreign}")
+        if payload.employee_id is not None and not await outlet_employees(db, outlet_id, [payload.employee_id]):
+            raise CatalogError(f"employee_id {payload.employee_id} not found in this outlet")
+
+        # Create the Invoice object; created_at is set here so items can copy the partition key
         invoice = Invoice(
+            outlet_id=outlet_id,
             invoice_number=payload.invoice_number,
             created_by=payload.created_by,
+            created_at=datetime.utcnow(),
             table_number=payload.table_number,
             order_type=payload.order_type,
             employee_id=payload.employee_id,
+            notes=payload.notes,
             status="finalized",
             total_amount=Decimal("0.00")
         )
         db.add(invoice)
         await db.flush()  # ensures invoice.id is generated before adding items
+        if models.PARTITIONED:
+            # a partitioned invoice can only enforce (outlet_id, invoice_number, created_at);
+            # invoice_key's unique constraint rejects a duplicate number in this transaction
+            await db.execute(insert(models.InvoiceKey).values(
+                id=invoice.id, outlet_id=outlet_id, invoice_number=invoice.invoice_number, created_at=invoice.created_at,
+            ))
+
+        if lines:
+            # one executemany for all lines instead of a flush per InvoiceItem object
+            await db.execute(insert(InvoiceItem), [
+                {"invoice_id": invoice.id, "invoice_created_at": invoice.created_at, **line} for line in lines
+            ])
 
-        total = Decimal("0.00")
-
-        for item in payload.items:
-            line_total_excl = Decimal(str(item.unit_price)) * Decimal(str(item.quantity))
-            line_tax = (line_total_excl * Decimal(str(item.tax_rate))) / Decimal("100")
-            line_total_incl = line_total_excl + line_tax
-            total += line_total_incl
-
-            db_item = InvoiceItem(
-                invoice_id=invoice.id,
-                product_id=item.product_id,
-                description=item.description,
-                quantity=Decimal(str(item.quantity)),
-                unit_price=Decimal(str(item.unit_price)),
-                tax_rate=Decimal(str(item.tax_rate)),
-                discount_amount=Decimal(str(item.discount_amount or 0)),
-                line_total_excl_tax=line_total_excl,
-                line_tax_amount=line_tax,
-                line_total_incl_tax=line_total_incl,
-            )
-            db.add(db_item)
-
-        invoice.total_amount = total
+        # all lines in one set-based stock UPDATE, in the same transaction as the bill
+        warnings = await stock.apply_sale(
+            db, outlet_id, [(invoice.id, line["product_id"], line["quantity"]) for line in lines]
+        )
+
+        invoice.total_amount = sum((line["line_total_incl_tax"] for line in lines), Decimal("0.00"))
+        await shifts.record_invoices(db, outlet_id, [(
+            payload.employee_id,
+            invoice.created_at,
+            sum((line["quantity"] for line in lines), Decimal("0")),
+            invoice.total_amount,
+        )])
 
         await db.commit()
         await db.refresh(invoice)
+        invoice.stock_warnings = warnings
+        invoice.price_overrides = price_overrides(lines, prices)
         return invoice
 
+    except CatalogError:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         tb = traceback.format_exc()
@@ -82,16 +199,18 @@ async def create_invoice_with_items(db: AsyncSession, payload):
         raise e
 
 
-async def get_or_create_tax_slab(db, rate: float, name: str):
+async def get_or_create_tax_slab(db, outlet_id: int, rate: float, name: str):
     from app.db.models import TaxSlab
     result = await db.execute(
-        select(TaxSlab).where(TaxSlab.rate == rate)
+        select(TaxSlab).where(TaxSlab.outlet_id == outlet_id, TaxSlab.rate == rate)
     )
     slab = result.scalars().first()
     if slab:
         return slab
-    new_slab = TaxSlab(rate=rate, name=name)
+    new_slab = TaxSlab(outlet_id=outlet_id, rate=rate, name=name)
     db.add(new_slab)
+    await db.flush()
+    await record_catalog_change(db, outlet_id, "tax_slabs", [new_slab.id])
     await db.commit()
     await db.refresh(new_slab)
     return new_slab
@@ -0,0 +1,32 @@
+# app/db/dialect.py
+"""
+Backend-specific SQL behind one interface, so the same code runs on Postgres and SQLite.
+
+- upsert_insert(): INSERT supporting .on_conflict_do_nothing() / .on_conflict_do_update()
+  (Postgres and SQLite >= 3.24 share the syntax, SQLAlchemy has a construct for each)
+- SELECT .. FOR UPDATE: use .with_for_update() freely; the SQLite compiler drops it,
+  and the single pooled SQLite connection (db/session.py) already serialises writers
+- sequences / identity: BigInteger PKs map to INTEGER on SQLite (see BigIntPK in models.py)
+  so ROWID autoincrement works there
+"""
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+def dialect_name(db) -> str:
+    """Backend name ("postgresql", "sqlite", ...) for an AsyncSession / AsyncConnection / engine."""
+    bind = db.get_bind() if hasattr(db, "get_bind") else db
+    return bind.dialect.name
+
+
+def is_sqlite(db) -> bool:
+    return dialect_name(db) == "sqlite"
+
+
+def upsert_insert(db, table):
+    name = dialect_name(db)
+    if name == "postgresql":
+        return pg_insert(table)
+    if name == "sqlite":
+        return sqlite_insert(table)
+    raise NotImplementedError(f"ON CONFLICT is not supported for the {name} backend")
@@ -1,14 +1,32 @@
 from sqlalchemy import (
-    Column, Integer, BigInteger, String, DateTime, Boolean, Numeric, Text, Enum, ForeignKey, Date
+    Column, Integer, BigInteger, String, DateTime, Boolean, Numeric, Text, Enum, ForeignKey, Date, LargeBinary,
+    ForeignKeyConstraint, UniqueConstraint, Index, DDL, event, func, text
 )
+from sqlalchemy.dialects import postgresql  # noqa: F401  registers func.to_tsvector (search indexes)
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 import enum
 # app/db/models.py (add or replace Employee model)
 from sqlalchemy.orm import declarative_base
+from app.core.config import settings
 # keep your current import if different
 Base = declarative_base()
 
+# invoice / invoice_item are RANGE-partitioned by month when enabled (see app/db/partitions.py).
+# Postgres wants the partition key inside every PK / unique constraint of a partitioned table,
+# so in that mode it becomes part of the primary key and of the invoice_number constraint.
+PARTITIONED = settings.INVOICE_PARTITIONING
+
+# SQLite only autoincrements an "INTEGER PRIMARY KEY" (the ROWID alias); BIGINT would stay NULL
+BigIntPK = BigInteger().with_variant(Integer, "sqlite")
+
+
+def _partition_args(key: str, *constraints):
+    """__table_args__ for a table partitioned by month on `key`."""
+    if PARTITIONED:
+        return (*constraints, {"postgresql_partition_by": f"RANGE ({key})"})
+    return constraints
+
 class Role(Base):
     __tablename__ = "role"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -16,7 +34,7 @@ class Role(Base):
 
 class UserAccount(Base):
     __tablename__ = "user_account"
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
     email = Column(String(255), unique=True, nullable=False)
     username = Column(String(100))
     password_hash = Column(String(255), nullable=False)
@@ -30,29 +48,49 @@ class UserAccount(Base):
 
 class RefreshToken(Base):
     __tablename__ = "refresh_token"
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("user_account.id"), nullable=False)
     token_hash = Column(String(255), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=False)
     revoked = Column(Boolean, default=False)
 
+# Tenant-scoped tables carry outlet_id (see app/db/outlets.py); it leads their unique keys
+# and the (outlet_id, id) index a terminal's full catalog download pages through.
+def _sync_index(table: str) -> Index:
+    return Index(f"ix_{table}_outlet_id", "outlet_id", "id")
+
+
 class TaxSlab(Base):
     __tablename__ = "tax_slab"
+    __table_args__ = (_sync_index("tax_slab"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
+    outlet_id = Column(Integer, nullable=False)
     rate = Column(Numeric(5,2), nullable=False)
     name = Column(String(50), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Category(Base):
     __tablename__ = "category"
+    __table_args__ = (
+        UniqueConstraint("outlet_id", "name", name="uq_category_outlet_name"),
+        _sync_index("category"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(150), unique=True, nullable=False)
+    outlet_id = Column(Integer, nullable=False)
+    name = Column(String(150), nullable=False)
     description = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Product(Base):
     __tablename__ = "product"
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    sku = Column(String(100), unique=True)
+    __table_args__ = (
+        UniqueConstraint("outlet_id", "sku", name="uq_product_outlet_sku"),
+        _sync_index("product"),
+    )
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    outlet_id = Column(Integer, nullable=False)
+    sku = Column(String(100))
     name = Column(String(255), nullable=False)
     category_id = Column(Integer, ForeignKey("category.id"))
     current_unit_price = Column(Numeric(12,2), nullable=False, default=0.00)
@@ -60,13 +98,17 @@ class Product(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # stock (app/stock.py): on hand = stock_qty + sum(product_stock_shard.delta)
+    track_stock = Column(Boolean, nullable=False, default=False)
+    stock_qty = Column(Numeric(12, 2), nullable=False, default=0)
+    stock_shards = Column(Integer, nullable=False, default=0)  # >0: sales hit shard rows, not this row
 
     category = relationship("Category")
     tax_slab = relationship("TaxSlab")
 
 class ProductPriceHistory(Base):
     __tablename__ = "product_price_history"
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
     product_id = Column(BigInteger, ForeignKey("product.id"), nullable=False)
     unit_price = Column(Numeric(12,2), nullable=False)
     tax_slab_id = Column(Integer, ForeignKey("tax_slab.id"), nullable=False)
@@ -75,16 +117,48 @@ class ProductPriceHistory(Base):
 
 
 
+class StockLedger(Base):
+    """Every stock movement; sum(delta) per product is the reference the counters reconcile to."""
+    __tablename__ = "stock_ledger"
+    __table_args__ = (
+        Index("ix_stock_ledger_product", "product_id", "id"),
+    )
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    product_id = Column(BigInteger, ForeignKey("product.id"), nullable=False)
+    delta = Column(Numeric(12, 2), nullable=False)
+    reason = Column(String(30), nullable=False)  # sale | receipt | adjustment | reconcile
+    invoice_id = Column(BigInteger, nullable=True)
+    note = Column(String(255))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ProductStockShard(Base):
+    """
+    Split counter for hot products: a sale decrements shard (invoice_id % nshards)
+    instead of the product row, so concurrent bills don't queue on one row lock.
+    """
+    __tablename__ = "product_stock_shard"
+    product_id = Column(BigInteger, ForeignKey("product.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    nshards = Column(Integer, nullable=False)
+    delta = Column(Numeric(12, 2), nullable=False, default=0)
+
+
+
 class Employee(Base):
     __tablename__ = "employee"
+    __table_args__ = (
+        UniqueConstraint("outlet_id", "employee_code", name="uq_employee_outlet_code"),
+    )
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, index=True, autoincrement=True)
+    outlet_id = Column(Integer, nullable=False)
     full_name = Column(String(255), nullable=False)
     phone = Column(String(30))
-    employee_code = Column(String(100), unique=True, nullable=False)
+    employee_code = Column(String(100), nullable=False)
     hire_date = Column(Date)
     designation = Column(String(100))
-    user_account_id = Column(BigInteger, ForeignKey("user_account.id"), nullable=True)
+    user_account_id = Column(BigInteger, nullable=True)  # user_account.id; no FK, see GLOBAL_TABLES
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -99,14 +173,36 @@ class InvoiceStatusEnum(str, enum.Enum):
     cancelled = "cancelled"
 
 
+# invoice_item / payment reference (id, created_at) so their joins can prune partitions.
+# A partitioned invoice already has that as its PK; unpartitioned it needs its own key.
+if PARTITIONED:
+    _INVOICE_KEYS = (UniqueConstraint("outlet_id", "invoice_number", "created_at", name="uq_invoice_number"),)
+else:
+    _INVOICE_KEYS = (
+        UniqueConstraint("outlet_id", "invoice_number", name="uq_invoice_number"),
+        UniqueConstraint("id", "created_at", name="uq_invoice_id_created_at"),
+    )
+
+
 class Invoice(Base):
     __tablename__ = "invoice"
+    __table_args__ = _partition_args(
+        "created_at",
+        *_INVOICE_KEYS,
+        # an outlet's bills by time (reports, rebuilding employee_shift_stats)
+        Index("ix_invoice_outlet_created", "outlet_id", "created_at"),
+        # per-employee time windows (shift reports)
+        Index("ix_invoice_employee_created", "employee_id", "created_at"),
+        # invoice search by table (app/search.py)
+        Index("ix_invoice_outlet_table", "outlet_id", "table_number", "created_at"),
+    )
 
     # Use BigInteger so FK types match user_account.id and other BigInteger PKs
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
-    invoice_number = Column(String(100), unique=True, nullable=False)
-    created_by = Column(BigInteger, ForeignKey("user_account.id"), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    id = Column(BigIntPK, primary_key=True, index=True, autoincrement=True)
+    outlet_id = Column(Integer, nullable=False)
+    invoice_number = Column(String(100), nullable=False)
+    created_by = Column(BigInteger, nullable=True)  # user_account.id; no FK, see GLOBAL_TABLES
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=PARTITIONED)
     status = Column(
         Enum("draft", "preparing", "served", "finalized", "paid", "cancelled", name="invoice_status"),
         default="draft"
@@ -130,9 +226,16 @@ class Invoice(Base):
 
 class InvoiceItem(Base):
     __tablename__ = "invoice_item"
+    __table_args__ = _partition_args(
+        "invoice_created_at",
+        ForeignKeyConstraint(["invoice_id", "invoice_created_at"], ["invoice.id", "invoice.created_at"]),
+        Index("ix_invoice_item_invoice", "invoice_id", "invoice_created_at"),
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    invoice_id = Column(BigInteger, ForeignKey("invoice.id"), nullable=False)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    invoice_id = Column(BigInteger, nullable=False)
+    # copy of invoice.created_at so items land in the same monthly partition as their invoice
+    invoice_created_at = Column(DateTime, nullable=False, primary_key=PARTITIONED)
     product_id = Column(BigInteger, ForeignKey("product.id"), nullable=True)
     description = Column(String(512))
     quantity = Column(Numeric(12, 2), nullable=False)
@@ -150,10 +253,57 @@ class InvoiceItem(Base):
     )
 
 
+class InvoiceKey(Base):
+    """
+    Partitioned mode only (see app/db/partitions.py). A partitioned invoice can only
+    enforce keys that include created_at, so per-outlet invoice_number uniqueness is
+    enforced here, in the same transaction as the insert; and id -> created_at lets a
+    lookup by id pin the partition key. Stays empty when INVOICE_PARTITIONING is off.
+    """
+    __tablename__ = "invoice_key"
+    __table_args__ = (UniqueConstraint("outlet_id", "invoice_number", name="uq_invoice_key_number"),)
+    id = Column(BigInteger, primary_key=True, autoincrement=False)  # invoice.id
+    outlet_id = Column(Integer, nullable=False)
+    invoice_number = Column(String(100), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+# ---- invoice search indexes (see app/search.py) ----
+# Postgres: invoice_number prefixes as a byte-ordered range, and GIN tsvector indexes
+# over notes / item descriptions. The search query reuses these exact expressions.
+NOTES_TSV = func.to_tsvector(text("'simple'"), func.coalesce(Invoice.notes, text("''")))
+DESCRIPTION_TSV = func.to_tsvector(text("'simple'"), func.coalesce(InvoiceItem.description, text("''")))
+Index("ix_invoice_number_prefix", Invoice.outlet_id, Invoice.invoice_number.collate("C")).ddl_if(dialect="postgresql")
+Index("ix_invoice_notes_tsv", NOTES_TSV, postgresql_using="gin").ddl_if(dialect="postgresql")
+Index("ix_invoice_item_description_tsv", DESCRIPTION_TSV, postgresql_using="gin").ddl_if(dialect="postgresql")
+
+# SQLite: FTS5 external-content tables kept in step by triggers; the (outlet_id,
+# invoice_number) unique index already serves prefix ranges there (BINARY collation).
+for _table, _column in (("invoice", "notes"), ("invoice_item", "description")):
+    for _ddl in (
+        f"CREATE VIRTUAL TABLE {_table}_fts USING fts5({_column}, content='{_table}', content_rowid='id')",
+        f"CREATE TRIGGER {_table}_fts_ai AFTER INSERT ON {_table} BEGIN "
+        f"INSERT INTO {_table}_fts(rowid, {_column}) VALUES (new.id, new.{_column}); END",
+        f"CREATE TRIGGER {_table}_fts_ad AFTER DELETE ON {_table} BEGIN "
+        f"INSERT INTO {_table}_fts({_table}_fts, rowid, {_column}) VALUES ('delete', old.id, old.{_column}); END",
+        f"CREATE TRIGGER {_table}_fts_au AFTER UPDATE OF {_column} ON {_table} BEGIN "
+        f"INSERT INTO {_table}_fts({_table}_fts, rowid, {_column}) VALUES ('delete', old.id, old.{_column}); "
+        f"INSERT INTO {_table}_fts(rowid, {_column}) VALUES (new.id, new.{_column}); END",
+    ):
+        event.listen(Base.metadata.tables[_table], "after_create", DDL(_ddl).execute_if(dialect="sqlite"))
+    _drop = DDL(f"DROP TABLE IF EXISTS {_table}_fts").execute_if(dialect="sqlite")
+    event.listen(Base.metadata.tables[_table], "after_drop", _drop)
+
+
 class Payment(Base):
     __tablename__ = "payment"
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    invoice_id = Column(BigInteger, ForeignKey("invoice.id"), nullable=False)
+    __table_args__ = (
+        ForeignKeyConstraint(["invoice_id", "invoice_created_at"], ["invoice.id", "invoice.created_at"]),
+        Index("ix_payment_invoice", "invoice_id", "invoice_created_at"),
+    )
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    invoice_id = Column(BigInteger, nullable=False)
+    invoice_created_at = Column(DateTime, nullable=False)
     paid_at = Column(DateTime, default=datetime.utcnow)
     amount = Column(Numeric(14,2), nullable=False)
     method = Column(String(50))
@@ -162,10 +312,74 @@ class Payment(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_log"
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
     actor_id = Column(BigInteger, ForeignKey("user_account.id"))
     action = Column(String(100))
     entity = Column(String(100))
     entity_id = Column(String(100))
-    payload = Column(Text)  # storing JSON text
+    payload = Column(LargeBinary)  # msgpack, see app/audit.py
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class EmployeeShiftStats(Base):
+    """
+    Running totals per employee per shift, bumped in the same transaction that
+    finalizes an invoice (see app/shifts.py). employee_id 0 = bills without one.
+    """
+    __tablename__ = "employee_shift_stats"
+    outlet_id = Column(Integer, primary_key=True)
+    employee_id = Column(BigInteger, primary_key=True)
+    shift_date = Column(Date, primary_key=True)  # business date the shift started on
+    shift = Column(String(30), primary_key=True)
+    invoices = Column(Integer, nullable=False, default=0)
+    items = Column(Numeric(14, 2), nullable=False, default=0)
+    gross = Column(Numeric(14, 2), nullable=False, default=0)
+    paid_invoices = Column(Integer, nullable=False, default=0)
+
+
+class EmployeeShiftPayment(Base):
+    """Payment mix per employee per shift (of the invoice being paid)."""
+    __tablename__ = "employee_shift_payment"
+    outlet_id = Column(Integer, primary_key=True)
+    employee_id = Column(BigInteger, primary_key=True)
+    shift_date = Column(Date, primary_key=True)
+    shift = Column(String(30), primary_key=True)
+    method = Column(String(50), primary_key=True)
+    payments = Column(Integer, nullable=False, default=0)
+    amount = Column(Numeric(14, 2), nullable=False, default=0)
+
+
+class TerminalSyncLog(Base):
+    """One row per offline record a terminal has pushed; makes /sync/push idempotent."""
+    __tablename__ = "terminal_sync_log"
+    __table_args__ = (
+        UniqueConstraint("outlet_id", "terminal_id", "local_seq", name="uq_terminal_sync_seq"),
+    )
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    outlet_id = Column(Integer, nullable=False)
+    terminal_id = Column(String(100), nullable=False)
+    local_seq = Column(BigInteger, nullable=False)
+    kind = Column(String(20), nullable=False)  # "invoice" | "payment"
+    entity_id = Column(BigInteger, nullable=True)  # invoice.id / payment.id once applied
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CatalogChange(Base):
+    """
+    Commit-ordered feed of catalog writes (Product / TaxSlab / Category) that terminals
+    pull from (app/sync.py); written by crud.record_catalog_change in the writing transaction.
+    """
+    __tablename__ = "catalog_change"
+    __table_args__ = (Index("ix_catalog_change_outlet_seq", "outlet_id", "seq"),)
+    seq = Column(BigIntPK, primary_key=True, autoincrement=True)
+    outlet_id = Column(Integer, nullable=False)
+    entity = Column(String(20), nullable=False)  # "products" | "tax_slabs" | "categories"
+    entity_id = Column(BigInteger, nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Shared by every outlet and kept in DATABASE_URL only: routed databases / schemas
+# (app/db/outlets.py) get OUTLET_TABLES. Outlet rows refer to user accounts by id
+# without a foreign key, since they may live in another database.
+GLOBAL_TABLES = (Role.__table__, UserAccount.__table__, RefreshToken.__table__, AuditLog.__table__)
+OUTLET_TABLES = [t for t in Base.metadata.sorted_tables if t not in GLOBAL_TABLES]
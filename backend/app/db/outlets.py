@@ -0,0 +1,166 @@
+# app/db/outlets.py
+"""
+Outlets (restaurants) and where their data lives.
+
+Tenant-scoped tables (invoice, product, employee, tax_slab, category,
+terminal_sync_log, the shift aggregates) carry outlet_id: every query on them
+filters by it, and their unique keys include it (invoice_number, sku and
+employee_code are unique per outlet). Invoice items, payments and stock rows
+belong to an outlet through their invoice / product.
+
+A request's outlet comes from the X-Outlet-Id header, or DEFAULT_OUTLET_ID
+when it is absent, so single-outlet terminals need no change. Every outlet
+lives in DATABASE_URL unless routed elsewhere:
+
+    OUTLET_DATABASE_URLS="7=postgresql://db2/pos,9=postgresql://db2/pos"
+    OUTLET_SCHEMAS="9=outlet_9"
+
+User accounts, roles, refresh tokens and the audit log are shared by every
+outlet and stay in DATABASE_URL (models.GLOBAL_TABLES); routed databases and
+schemas only get the outlet tables, which refer to user accounts by id.
+
+Outlets routed to the same URL share one engine and pool; a schema is applied
+with schema_translate_map (and search_path for raw SQL), so models, queries
+and the API are the same wherever an outlet lives. Moving a large outlet to
+its own node is: copy its rows, add the route, restart.
+"""
+import re
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from fastapi import Header
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+
+OUTLET_HEADER = "x-outlet-id"
+
+_SCHEMA_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def parse_outlet_map(spec: str) -> Dict[int, str]:
+    """"7=a,9=b" -> {7: "a", 9: "b"}"""
+    routes = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        outlet, sep, value = part.partition("=")
+        if not sep or not value.strip():
+            raise ValueError(f"expected outlet_id=value, got {part.strip()!r}")
+        routes[int(outlet)] = value.strip()
+    return routes
+
+
+class Target(NamedTuple):
+    """One place outlet data lives: a database URL and an optional Postgres schema."""
+    url: str
+    schema: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        """Short label for metrics, logs and directory names; "default" for DATABASE_URL."""
+        if self == DEFAULT_TARGET:
+            return "default"
+        url = make_url(self.url)
+        parts = [url.host or "local", url.database or ""]
+        if self.schema:
+            parts.append(self.schema)
+        parts = [re.sub(r"[^A-Za-z0-9_.]+", "_", p).strip("_") for p in parts]
+        return "-".join(p for p in parts if p)
+
+
+DEFAULT_TARGET = Target(settings.DATABASE_URL)
+
+
+def _routes() -> Dict[int, Target]:
+    urls = parse_outlet_map(settings.OUTLET_DATABASE_URLS)
+    schemas = parse_outlet_map(settings.OUTLET_SCHEMAS)
+    routes = {}
+    for outlet_id in sorted(set(urls) | set(schemas)):
+        target = Target(urls.get(outlet_id, settings.DATABASE_URL), schemas.get(outlet_id))
+        if target.schema is not None:
+            if not target.url.startswith("postgresql"):
+                raise ValueError(f"outlet {outlet_id}: OUTLET_SCHEMAS needs a Postgres database")
+            if not _SCHEMA_RE.match(target.schema):
+                raise ValueError(f"outlet {outlet_id}: invalid schema name {target.schema!r}")
+        routes[outlet_id] = target
+    return routes
+
+
+ROUTES = _routes()
+
+
+def target_for(outlet_id: int) -> Target:
+    return ROUTES.get(outlet_id, DEFAULT_TARGET)
+
+
+def all_targets() -> List[Target]:
+    """Every distinct target, DATABASE_URL first."""
+    return list(dict.fromkeys([DEFAULT_TARGET, *ROUTES.values()]))
+
+
+def current_outlet(x_outlet_id: Optional[int] = Header(None, ge=1)) -> int:
+    """Dependency: the request's outlet."""
+    return x_outlet_id if x_outlet_id is not None else settings.DEFAULT_OUTLET_ID
+
+
+def outlet_from_scope(scope) -> int:
+    """The outlet of a raw ASGI request (for middleware); the default when the header is missing or bad."""
+    for key, value in scope.get("headers", ()):
+        if key == OUTLET_HEADER.encode():
+            try:
+                return int(value)
+            except ValueError:
+                break
+    return settings.DEFAULT_OUTLET_ID
+
+
+class OutletRouter:
+    """Engines and sessions per target. One engine (pool) per URL, created on first use."""
+
+    def __init__(self, default_engine: AsyncEngine, engine_factory: Callable[[str, str], AsyncEngine]):
+        self._factory = engine_factory
+        self._engines: Dict[str, AsyncEngine] = {DEFAULT_TARGET.url: default_engine}
+        self._bound: Dict[Target, AsyncEngine] = {}
+        self._sessions: Dict[Target, async_sessionmaker] = {}
+
+    def engine(self, target: Target) -> AsyncEngine:
+        bound = self._bound.get(target)
+        if bound is None:
+            eng = self._engines.get(target.url)
+            if eng is None:
+                eng = self._engines[target.url] = self._factory(target.url, Target(target.url).name)
+            bound = eng
+            if target.schema:
+                # unqualified tables (all of ours) resolve to the outlet's schema
+                bound = eng.execution_options(schema_translate_map={None: target.schema})
+            self._bound[target] = bound
+        return bound
+
+    def sessionmaker(self, target: Target) -> async_sessionmaker:
+        maker = self._sessions.get(target)
+        if maker is None:
+            maker = self._sessions[target] = async_sessionmaker(
+                bind=self.engine(target), autocommit=False, autoflush=False, expire_on_commit=False
+            )
+        return maker
+
+    def session(self, outlet_id: int) -> AsyncSession:
+        return self.sessionmaker(target_for(outlet_id))()
+
+    @asynccontextmanager
+    async def begin(self, target: Target):
+        """Connection in a transaction on `target`; raw SQL also resolves to its schema."""
+        async with self.engine(target).begin() as conn:
+            if target.schema:
+                await conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {target.schema}"))
+                await conn.execute(text(f"SET LOCAL search_path TO {target.schema}"))
+            yield conn
+
+    async def dispose(self):
+        """Dispose the routed engines; the default engine is disposed by its owner."""
+        for url, eng in self._engines.items():
+            if url != DEFAULT_TARGET.url:
+                await eng.dispose()
@@ -0,0 +1,278 @@
+# app/db/partitions.py
+"""
+Monthly partition maintenance for the invoice tables (Postgres only).
+
+With INVOICE_PARTITIONING on, `invoice` is RANGE-partitioned on created_at and
+`invoice_item` on invoice_created_at (a copy of its invoice's timestamp), so
+both tables are split on the same monthly boundaries:
+
+    invoice_p202610, invoice_item_p202610, ...
+
+Hot queries (today's bills, joins on (invoice_id, invoice_created_at)) only
+touch the recent partitions; lookups by invoice id pin created_at through
+invoice_key (invoice_ids_clause), which also enforces invoice_number
+uniqueness per outlet. Old months are detached and written to gzipped CSV
+files in ARCHIVE_DIR (ARCHIVE_DIR/<target name>/ for a routed database or
+schema), which `scripts/partitions.py` can query or restore.
+Rows that landed in the DEFAULT partition travel with their month.
+"""
+import csv
+import gzip
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import and_, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.db.models import PARTITIONED, Invoice, InvoiceKey
+from app.db.outlets import DEFAULT_TARGET, Target
+
+logger = logging.getLogger(__name__)
+
+# parent table -> partition key column; items go first when detaching (they reference invoice)
+PARTITIONED_TABLES = {
+    "invoice": "created_at",
+    "invoice_item": "invoice_created_at",
+}
+DETACH_ORDER = ("invoice_item", "invoice")
+
+_PARTITION_RE = re.compile(r"^(?P<table>[a-z_]+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + (value.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def parse_partition_name(name: str):
+    """Return (parent_table, month_start) for a name made by partition_name(), else None."""
+    m = _PARTITION_RE.match(name)
+    if not m or m.group("table") not in PARTITIONED_TABLES:
+        return None
+    return m.group("table"), datetime(int(m.group("year")), int(m.group("month")), 1)
+
+
+def archive_path(archive_dir: str, name: str) -> str:
+    return os.path.join(archive_dir, f"{name}.csv.gz")
+
+
+def target_archive_dir(archive_dir: str, target: Target = DEFAULT_TARGET) -> str:
+    """Where `target`'s months are archived: ARCHIVE_DIR itself, or ARCHIVE_DIR/<target name>/ if routed."""
+    if target == DEFAULT_TARGET:
+        return archive_dir
+    return os.path.join(archive_dir, target.name)
+
+
+def invoice_ids_clause(invoice_ids):
+    """
+    WHERE clause for invoices by id. Partitioned, each id also pins created_at
+    with a scalar subquery on invoice_key, so Postgres prunes to the matching
+    partitions at executor startup instead of probing every month.
+    """
+    invoice_ids = list(invoice_ids)
+    if not PARTITIONED:
+        return Invoice.id.in_(invoice_ids)
+    return or_(*(
+        and_(
+            Invoice.id == invoice_id,
+            Invoice.created_at == select(InvoiceKey.created_at).where(InvoiceKey.id == invoice_id).scalar_subquery(),
+        )
+        for invoice_id in invoice_ids
+    ))
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> List[str]:
+    rows = await conn.execute(
+        text(
+            # to_regclass resolves through search_path, so an outlet schema only sees its own partitions
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return [r[0] for r in rows]
+
+
+async def ensure_partitions(conn: AsyncConnection, months_ahead: int, now: Optional[datetime] = None) -> List[str]:
+    """
+    Create the partitions for last month, this month and `months_ahead` future
+    months, plus a DEFAULT partition so an insert outside that range never fails.
+    Idempotent; returns the names of partitions that were newly created.
+    """
+    current = month_start(now or datetime.utcnow())
+    created = []
+    for table in PARTITIONED_TABLES:
+        existing = set(await list_partitions(conn, table))
+        for offset in range(-1, months_ahead + 1):
+            lo = add_months(current, offset)
+            name = partition_name(table, lo)
+            if name in existing:
+                continue
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{lo:%Y-%m-%d}') TO ('{add_months(lo, 1):%Y-%m-%d}')"
+            ))
+            created.append(name)
+        if f"{table}_default" not in existing:
+            await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+            created.append(f"{table}_default")
+    if created:
+        logger.info("Created partitions: %s", ", ".join(created))
+    return created
+
+
+async def _copy_out(conn: AsyncConnection, query: str, path: str) -> None:
+    """Stream `query` as CSV (with header) into a gzip file using asyncpg COPY."""
+    raw = await conn.get_raw_connection()
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wb") as fh:
+        async def sink(chunk: bytes):
+            fh.write(chunk)
+        await raw.driver_connection.copy_from_query(query, output=sink, format="csv", header=True)
+    os.replace(tmp, path)
+
+
+def _month_where(column: str, month: datetime) -> str:
+    return f"{column} >= '{month:%Y-%m-%d}' AND {column} < '{add_months(month, 1):%Y-%m-%d}'"
+
+
+async def archive_month(conn: AsyncConnection, month: datetime, archive_dir: str) -> List[str]:
+    """
+    Export one month of invoices, items and their payments to ARCHIVE_DIR, then
+    delete the payments, detach + drop the month's partitions and delete the
+    month's rows from the DEFAULT partitions. Runs inside the caller's
+    transaction, so a failure leaves the database untouched. Refuses (FileExistsError)
+    to overwrite an existing archive of the month.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    payment_path = archive_path(archive_dir, f"payment_p{month:%Y%m}")
+    table_paths = {table: archive_path(archive_dir, partition_name(table, month)) for table in DETACH_ORDER}
+    files = [payment_path, *table_paths.values()]
+    taken = [path for path in files if os.path.exists(path)]
+    if taken:
+        raise FileExistsError(f"archive already exists: {', '.join(taken)}")
+
+    # payment is not partitioned but references invoice, so its rows travel with the month
+    payment_where = _month_where("invoice_created_at", month)
+    await _copy_out(conn, f"SELECT * FROM payment WHERE {payment_where}", payment_path)
+
+    # read through the parent: the month's partition plus any of its rows in the DEFAULT partition
+    existing = {table: set(await list_partitions(conn, table)) for table in DETACH_ORDER}
+    for table in DETACH_ORDER:
+        query = f"SELECT * FROM {table} WHERE {_month_where(PARTITIONED_TABLES[table], month)}"
+        await _copy_out(conn, query, table_paths[table])
+
+    await conn.execute(text(f"DELETE FROM payment WHERE {payment_where}"))
+    await conn.execute(text(f"DELETE FROM invoice_key WHERE {_month_where('created_at', month)}"))
+    for table in DETACH_ORDER:
+        name = partition_name(table, month)
+        if name in existing[table]:
+            await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+        if f"{table}_default" in existing[table]:
+            await conn.execute(text(
+                f"DELETE FROM {table}_default WHERE {_month_where(PARTITIONED_TABLES[table], month)}"
+            ))
+
+    logger.info("Archived %s to %s", f"{month:%Y-%m}", archive_dir)
+    return files
+
+
+async def archive_old_partitions(
+    conn: AsyncConnection, retain_months: int, archive_dir: str, now: Optional[datetime] = None, dry_run: bool = False
+) -> List[datetime]:
+    """
+    Archive every month older than `retain_months`: months with their own
+    partition, and months that only have rows in the DEFAULT partition (e.g.
+    old offline bills). Returns the months handled.
+    """
+    cutoff = add_months(month_start(now or datetime.utcnow()), -retain_months)
+    months = set()
+    names = await list_partitions(conn, "invoice")
+    for name in names:
+        parsed = parse_partition_name(name)
+        if parsed and parsed[1] < cutoff:
+            months.add(parsed[1])
+    if "invoice_default" in names:
+        rows = await conn.execute(
+            text("SELECT DISTINCT date_trunc('month', created_at) FROM invoice_default WHERE created_at < :cutoff"),
+            {"cutoff": cutoff},
+        )
+        months.update(month_start(r[0]) for r in rows)
+
+    for month in sorted(months):
+        if not dry_run:
+            await archive_month(conn, month, archive_dir)
+    return sorted(months)
+
+
+async def restore_archive(conn: AsyncConnection, path: str, attach: bool = False) -> str:
+    """
+    Load an archived CSV back into Postgres. By default it goes into a standalone
+    `archive_<name>` table for ad-hoc SQL; with attach=True it is re-attached as
+    the month's partition (restore invoice before invoice_item, payments last).
+    """
+    name = os.path.basename(path).split(".", 1)[0]
+    parsed = parse_partition_name(name)
+    parent = parsed[0] if parsed else name.rsplit("_p", 1)[0]
+    target = name if attach else f"archive_{name}"
+
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {target} (LIKE {parent} INCLUDING DEFAULTS)"))
+    raw = await conn.get_raw_connection()
+    with gzip.open(path, "rb") as fh:
+        await raw.driver_connection.copy_to_table(target, source=fh, format="csv", header=True)
+
+    if attach:
+        if parsed:
+            lo = parsed[1]
+            await conn.execute(text(
+                f"ALTER TABLE {parent} ATTACH PARTITION {target} "
+                f"FOR VALUES FROM ('{lo:%Y-%m-%d}') TO ('{add_months(lo, 1):%Y-%m-%d}')"
+            ))
+            if parent == "invoice":
+                await conn.execute(text(
+                    f"INSERT INTO invoice_key (id, outlet_id, invoice_number, created_at) "
+                    f"SELECT id, outlet_id, invoice_number, created_at FROM {target} ON CONFLICT DO NOTHING"
+                ))
+        else:
+            # payments were deleted from a plain table; put the rows back
+            await conn.execute(text(f"INSERT INTO {parent} SELECT * FROM {target}"))
+            await conn.execute(text(f"DROP TABLE {target}"))
+            target = parent
+    return target
+
+
+def query_archive(
+    path: str, where: Optional[dict] = None, since: Optional[str] = None, until: Optional[str] = None
+) -> Iterator[dict]:
+    """
+    Scan an archive file without a database. `where` matches columns exactly
+    (as text); since/until compare against the file's partition key column.
+    """
+    name = os.path.basename(path).split(".", 1)[0]
+    parsed = parse_partition_name(name)
+    time_column = PARTITIONED_TABLES[parsed[0]] if parsed else "invoice_created_at"
+    where = where or {}
+    with gzip.open(path, "rt", newline="") as fh:
+        for row in csv.DictReader(fh):
+            if any(row.get(k) != v for k, v in where.items()):
+                continue
+            ts = row.get(time_column) or ""
+            # ISO timestamps compare correctly as strings
+            if since and ts < since:
+                continue
+            if until and ts >= until:
+                continue
+            yield row
@@ -0,0 +1,191 @@
+# app/db/query_log.py
+"""
+Per-request SQL recorder: slow-query log, N+1 detector and query budgets.
+
+Enable with QUERY_LOG_ENABLED=true (cheap enough for production, verbose in dev):
+
+- every statement run while serving a request is recorded with its duration
+- statements slower than SLOW_QUERY_MS are logged, with parameters redacted
+  to their types (bill contents / customer notes never reach the logs)
+- structurally identical statements repeated N_PLUS_ONE_THRESHOLD+ times in
+  one request are logged as N+1 suspects
+- routes can declare a budget with `query_budget("/invoices/{invoice_id}", 4)`;
+  it is checked when the response starts, before anything reaches the client.
+  Going over logs an error, and with QUERY_BUDGET_STRICT=true raises
+  QueryBudgetExceeded instead of sending the response, so the client gets a
+  500 and the test that made the request fails (tests/test_query_log.py)
+- responses carry an `X-Query-Count` header
+
+For code that runs outside a request (unit tests of crud helpers, scripts):
+
+    with record_queries() as log:
+        await create_invoice_with_items(db, payload)
+    assert log.count <= 6
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.sql")
+
+_WS_RE = re.compile(r"\s+")
+_IN_RE = re.compile(r"\bIN \([^()]*\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"\bVALUES (\([^()]*\))(?:, \([^()]*\))+", re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+
+# route path -> max statements per request
+_budgets: Dict[str, int] = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(route_path: str, max_queries: int):
+    """Declare the most SQL statements one request to `route_path` (the route template) may run."""
+    _budgets[route_path] = max_queries
+
+
+def normalize(statement: str) -> str:
+    """Reduce a statement to its shape: literals and IN-list / multi-VALUES lengths removed."""
+    s = _WS_RE.sub(" ", statement).strip()
+    s = _STRING_RE.sub("?", s)
+    s = _NUMBER_RE.sub("?", s)
+    s = _IN_RE.sub("IN (...)", s)
+    s = _VALUES_RE.sub(r"VALUES \1, ...", s)
+    return s
+
+
+def redact(parameters) -> str:
+    """Describe bound parameters by type only."""
+    if parameters is None:
+        return "()"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"<{len(parameters)} parameter sets>"
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return f"<{type(parameters).__name__}>"
+
+
+class QueryLog:
+    __slots__ = ("statements",)
+
+    def __init__(self):
+        self.statements: List[Tuple[str, float]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(d for _, d in self.statements)
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        counts = Counter(normalize(s) for s, _ in self.statements)
+        return [(shape, n) for shape, n in counts.most_common() if n >= threshold]
+
+
+_current: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+
+
+@contextmanager
+def record_queries():
+    log = QueryLog()
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+
+
+def check_request(log: QueryLog, route: str):
+    """End-of-request checks: N+1 suspects and the route's budget."""
+    for shape, n in log.repeated(settings.N_PLUS_ONE_THRESHOLD):
+        logger.warning("possible N+1 on %s: %d x %s", route, n, shape)
+
+    budget = _budgets.get(route)
+    if budget is not None and log.count > budget:
+        message = f"{route} ran {log.count} SQL statements, budget is {budget}"
+        logger.error(message)
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+
+
+# start time on the execution context, not the connection: a statement that raises
+# never reaches after_cursor_execute, and the context is discarded with it
+_START = "_pos_query_log_start"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        setattr(context, _START, time.perf_counter())
+
+
+def _record(context, statement, parameters):
+    log = _current.get()
+    start = getattr(context, _START, None)
+    if log is None or start is None:
+        return
+    elapsed = time.perf_counter() - start
+    log.statements.append((statement, elapsed))
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            "slow query %.1fms: %s params=%s", elapsed * 1000, _WS_RE.sub(" ", statement), redact(parameters)
+        )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(context, statement, parameters)
+
+
+def _handle_error(exception_context):
+    # a failed statement was still a round trip and counts against the budget
+    _record(exception_context.execution_context, exception_context.statement, exception_context.parameters)
+
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class QueryLogMiddleware:
+    """Pure ASGI middleware: one QueryLog per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        log = QueryLog()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    # raises in strict mode, before the response goes out (the error middleware sends a 500)
+                    check_request(log, route)
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-query-count", str(log.count).encode())]
+            await send(message)
+
+        token = _current.set(log)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
@@ -1,22 +1,64 @@
 # backend/app/db/session.py
+from fastapi import Depends
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.metrics import instrument_engine
+from app.db import query_log
+from app.db.outlets import OutletRouter, current_outlet
 
-db_url = settings.DATABASE_URL or ""
-if not db_url:
-    raise RuntimeError("DATABASE_URL is not set in environment (app/core/config.py)")
+# already normalised to an async driver by app/core/config.py
+db_url = settings.DATABASE_URL
 
-# convert old Heroku-style prefix if needed
-if db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql+asyncpg://", 1)
 
-# ensure the URL uses the asyncpg dialect
-if not db_url.startswith("postgresql+asyncpg://"):
-    # optionally: log or raise — here we just try to be helpful
-    db_url = db_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+def sqlite_memory(url: str) -> bool:
+    """True for an in-memory SQLite URL: the database only exists inside this process."""
+    if not url.startswith("sqlite"):
+        return False
+    rest = url.split("://", 1)[1]
+    return rest in ("", "/", "/:memory:") or "mode=memory" in rest
 
-engine = create_async_engine(db_url, pool_pre_ping=True)
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def make_engine(url: str, name: str = "default"):
+    """Create an async engine with settings suited to the backend in `url`; `name` labels its pool metrics."""
+    if url.startswith("sqlite"):
+        if sqlite_memory(url):
+            url = "sqlite+aiosqlite:///:memory:"
+        # One pooled connection: SQLite allows a single writer, so sessions queue for it
+        # instead of failing with "database is locked". It also keeps an in-memory
+        # database alive for the life of the process.
+        eng = create_async_engine(
+            url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            connect_args={"check_same_thread": False},
+        )
+        event.listen(eng.sync_engine, "connect", _sqlite_pragmas)
+    else:
+        eng = create_async_engine(
+            url, pool_pre_ping=True, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW
+        )
+
+    if settings.METRICS_ENABLED:
+        instrument_engine(eng, name)
+    if settings.QUERY_LOG_ENABLED:
+        query_log.instrument_engine(eng)
+    return eng
+
+
+engine = make_engine(db_url)
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -25,9 +67,19 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+# engines / sessions for outlets routed away from DATABASE_URL (app/db/outlets.py)
+outlet_router = OutletRouter(engine, make_engine)
+
 class Base(DeclarativeBase):
     pass
 
-async def get_db():
+async def get_db(outlet_id: int = Depends(current_outlet)):
+    """Session on the database holding the request's outlet."""
+    async with outlet_router.session(outlet_id) as session:
+        yield session
+
+
+async def get_global_db():
+    """Session on DATABASE_URL, for the tables every outlet shares (models.GLOBAL_TABLES)."""
     async with AsyncSessionLocal() as session:
         yield session
@@ -11,7 +11,21 @@ from app.api import employees as employees_router
 from app.api import invoices as invoices_router
 from app.api import payments as payments_router
 from app.api import tax_slabs as tax_slabs_router
-from app.db.session import engine, Base
+from app.api import metrics as metrics_router
+from app.api import sync as sync_router
+from app.api import analytics as analytics_router
+from app.api import reports as reports_router
+from app.metrics import MetricsMiddleware
+from app.db.query_log import QueryLogMiddleware
+from app.admission import AdmissionMiddleware
+from app.db.session import engine, Base, outlet_router
+from app.db import partitions
+from app.db.outlets import DEFAULT_TARGET, all_targets
+from app.audit import audit_writer
+from app.stock import stock_reconciler
+from app.analytics import snapshotter
+from app.receipts import pdf_pool
+from app.core.config import settings
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import APIRouter
 import asyncio
@@ -46,6 +60,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.QUERY_LOG_ENABLED:
+    app.add_middleware(QueryLogMiddleware)
+# added last so it wraps everything (CORS, error handling) and sees the full latency
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, router=app.router)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # include routers (these imports must exist)
 app.include_router(auth_router.router)
 app.include_router(products_router.router)
@@ -53,6 +75,11 @@ app.include_router(employees_router.router)
 app.include_router(invoices_router.router)
 app.include_router(payments_router.router)
 app.include_router(tax_slabs_router.router)
+app.include_router(sync_router.router)
+app.include_router(analytics_router.router)
+app.include_router(reports_router.router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router.router)
 
 @app.get("/health", tags=["health"])
 async def health():
@@ -93,3 +120,80 @@ async def on_startup():
         print("DB connection failed on startup:", e)
         # Optionally: schedule retry
         # await asyncio.sleep(5); await on_startup()
+
+
+@app.on_event("startup")
+async def ensure_outlet_databases():
+    # outlets routed to another database / schema get the same tables there, minus the
+    # global ones (user accounts, roles, audit log) that stay in DATABASE_URL
+    for target in all_targets():
+        if target == DEFAULT_TARGET:
+            continue
+        try:
+            async with outlet_router.begin(target) as conn:
+                await conn.run_sync(models.Base.metadata.create_all, tables=models.OUTLET_TABLES)
+        except Exception as e:
+            logger.exception("Could not create tables for outlet database %s: %s", target.name, e)
+
+
+@app.on_event("startup")
+async def ensure_invoice_partitions():
+    # runs after the create_all handlers above; cron `scripts/partitions.py` keeps it topped up
+    if not settings.INVOICE_PARTITIONING:
+        return
+    for target in all_targets():
+        if not target.url.startswith("postgresql"):
+            continue
+        try:
+            async with outlet_router.begin(target) as conn:
+                await partitions.ensure_partitions(conn, settings.PARTITION_MONTHS_AHEAD)
+        except Exception as e:
+            logger.exception("Could not create invoice partitions in %s: %s", target.name, e)
+
+
+@app.on_event("startup")
+async def start_audit_writer():
+    await audit_writer.start()
+
+
+@app.on_event("startup")
+async def start_stock_reconciler():
+    await stock_reconciler.start()
+
+
+@app.on_event("shutdown")
+async def stop_stock_reconciler():
+    await stock_reconciler.stop()
+
+
+@app.on_event("shutdown")
+async def stop_receipt_pdf_pool():
+    pdf_pool.stop()
+
+
+@app.on_event("startup")
+async def start_analytics_snapshots():
+    await snapshotter.start()
+
+
+@app.on_event("shutdown")
+async def stop_analytics_snapshots():
+    await snapshotter.stop()
+
+
+@app.on_event("shutdown")
+async def stop_audit_writer():
+    # flush queued audit events before the process exits
+    await audit_writer.stop()
+
+
+@app.on_event("shutdown")
+async def dispose_outlet_engines():
+    await outlet_router.dispose()
+
+
+@app.on_event("shutdown")
+async def dispose_engine():
+    # registered after stop_audit_writer so the final audit flush still has a connection;
+    # also lets the aiosqlite worker thread exit
+    await engine.dispose()
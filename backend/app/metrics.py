@@ -0,0 +1,255 @@
+# app/metrics.py
+"""
+Small built-in Prometheus exporter (text format 0.0.4), no client library.
+
+- MetricsMiddleware: per-route latency histogram, request counter, in-flight gauge
+- instrument_engine(): SQLAlchemy cursor events -> per-route SQL counts/time
+- pool gauges are read from the engine at scrape time
+
+Everything runs on the event loop thread, so the metric objects are plain
+dicts without locks. Each uvicorn worker keeps its own registry.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def collect(self):
+        lines = self.header()
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, *args, fn: Optional[Callable[[], Dict[Tuple, float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fn = fn  # if given, values are computed at scrape time
+
+    def dec(self, labels: Tuple = (), amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+    def set(self, labels: Tuple, value: float):
+        self.values[labels] = value
+
+    def collect(self):
+        if self.fn is not None:
+            self.values = dict(self.fn())
+        return super().collect()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self.counts: Dict[Tuple, list] = {}
+        self.sums: Dict[Tuple, float] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def collect(self):
+        lines = self.header()
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {self.sums[labels]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "pos_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "pos_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "pos_http_requests_in_flight", "HTTP requests currently being served", ("method",)))
+sql_queries = registry.register(Counter(
+    "pos_sql_queries_total", "SQL statements executed, by route", ("route",)))
+sql_seconds = registry.register(Counter(
+    "pos_sql_query_seconds_total", "Time spent in SQL statements, by route", ("route",)))
+sql_latency = registry.register(Histogram(
+    "pos_sql_query_duration_seconds", "SQL statement latency", (), buckets=SQL_BUCKETS))
+
+
+class RequestStats:
+    """Per-request accumulator; SQL event hooks find it through `current_request`."""
+    __slots__ = ("sql_count", "sql_seconds")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+UNMATCHED = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware task hop, so the overhead stays small)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        http_in_flight.inc((method,))
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec((method,))
+            current_request.reset(token)
+            # the router stores the matched route in the scope; use its template, not the raw path
+            route = scope.get("route")
+            label = getattr(route, "path", None) or UNMATCHED
+            http_latency.observe((method, label), elapsed)
+            http_requests.inc((method, label, str(status[0])))
+            if stats.sql_count:
+                sql_queries.inc((label,), stats.sql_count)
+                sql_seconds.inc((label,), stats.sql_seconds)
+
+
+# The start time lives on the statement's execution context, which is discarded with
+# it, so a statement that raises (and never reaches after_cursor_execute) leaves
+# nothing behind on the pooled connection.
+_START = "_pos_metrics_start"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        setattr(context, _START, time.perf_counter())
+
+
+def _observe(context):
+    start = getattr(context, _START, None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    sql_latency.observe((), elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_seconds += elapsed
+    else:
+        # background work (audit writer, startup, scripts)
+        sql_queries.inc(("<background>",))
+        sql_seconds.inc(("<background>",), elapsed)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _observe(context)
+
+
+def _handle_error(exception_context):
+    # failed statements (e.g. a duplicate invoice_number) still cost a round trip
+    _observe(exception_context.execution_context)
+
+
+_pools: Dict[str, object] = {}
+
+
+def _pool_stats():
+    values = {}
+    for database, pool in _pools.items():
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            fn = getattr(pool, name, None)
+            if callable(fn):
+                values[(database, name)] = fn()
+    return values
+
+
+registry.register(Gauge(
+    "pos_db_pool_connections", "DB connection pool state, by database", ("database", "state"), fn=_pool_stats))
+
+
+def instrument_engine(engine, name: str = "default"):
+    """Attach SQL timing hooks and pool gauges to an (async) engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    _pools[name] = sync_engine.pool
@@ -0,0 +1,398 @@
+# app/receipts.py
+"""
+Server-side receipt rendering: 80mm plain text, ESC/POS bytes and PDF.
+
+An invoice is turned into plain data (receipt_data), then laid out once
+into styled lines by the template for the configured width; the three
+formats are different renderings of those same lines. Column formats for a
+width are compiled once and reused (_template).
+
+Receipts of finalized / paid invoices don't change, so rendered output is
+kept in a byte-bounded LRU keyed by (outlet, invoice id, format, template
+version); invoice ids only identify a bill within its outlet's database.
+The version covers TEMPLATE_VERSION plus the header / footer / width /
+timezone settings, so a config change never serves an old layout. Draft and
+cancelled invoices are rendered fresh every time.
+
+PDFs are built in a process pool (RECEIPT_PDF_WORKERS, 0 = inline) so a
+batch reprint doesn't stall the event loop. The PDF writer is a minimal
+single-page Courier document, no external library.
+"""
+import asyncio
+import multiprocessing
+import zlib
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.config import settings
+from app.db.models import Employee, Invoice
+from app.db.partitions import invoice_ids_clause
+from app.metrics import Counter, Gauge, registry
+
+# bump whenever the layout below changes
+TEMPLATE_VERSION = 1
+
+FORMATS = ("text", "escpos", "pdf")
+MEDIA_TYPES = {"text": "text/plain; charset=utf-8", "escpos": "application/octet-stream", "pdf": "application/pdf"}
+CACHEABLE = ("finalized", "paid")
+
+# line styles produced by layout()
+NORMAL, BOLD, CENTER, TITLE, TOTAL = "normal", "bold", "center", "title", "total"
+
+
+def template_version() -> str:
+    config = "|".join(map(str, (
+        settings.RECEIPT_WIDTH, settings.RECEIPT_HEADER, settings.RECEIPT_FOOTER, settings.LOCAL_UTC_OFFSET_MINUTES,
+    )))
+    return f"{TEMPLATE_VERSION}-{zlib.crc32(config.encode()):08x}"
+
+
+# ---- data ----
+
+def receipt_data(invoice, employee_name: Optional[str] = None) -> dict:
+    """Plain, picklable view of an invoice (sent to the PDF workers)."""
+    return {
+        "id": invoice.id,
+        "invoice_number": invoice.invoice_number,
+        "created_at": invoice.created_at.isoformat() if invoice.created_at else None,
+        "status": invoice.status,
+        "table_number": invoice.table_number,
+        "order_type": invoice.order_type,
+        "employee": employee_name,
+        "items": [
+            {
+                "description": it.description or f"Item {it.product_id}",
+                "quantity": str(it.quantity),
+                "unit_price": str(it.unit_price),
+                "tax_rate": str(it.tax_rate),
+                "net": str(it.line_total_excl_tax),
+                "tax": str(it.line_tax_amount),
+                "gross": str(it.line_total_incl_tax),
+            }
+            for it in sorted(invoice.items or [], key=lambda it: it.id)
+        ],
+    }
+
+
+async def load_receipt_data(db: AsyncSession, outlet_id: int, invoice_ids: Sequence[int]) -> Dict[int, dict]:
+    """An outlet's invoices with items and server name, two queries for any number of ids."""
+    if not invoice_ids:
+        return {}
+    q = await db.execute(
+        select(Invoice, Employee.full_name)
+        .outerjoin(Employee, Employee.id == Invoice.employee_id)
+        .options(selectinload(Invoice.items))
+        .where(invoice_ids_clause(invoice_ids), Invoice.outlet_id == outlet_id)
+    )
+    return {invoice.id: receipt_data(invoice, name) for invoice, name in q.all()}
+
+
+# ---- layout ----
+
+class _Template:
+    """Column formats for one receipt width."""
+
+    def __init__(self, width: int):
+        self.width = width
+        self.rule = "-" * width
+        self.desc_width = width - 25
+        # narrow paper: item name on its own line, numbers below
+        self.two_line = self.desc_width < 12
+        if self.two_line:
+            self.item = "{:<%d.%d}" % (width, width)
+            self.numbers = "  {:<%d}{:>10}" % (width - 12)
+        else:
+            self.item = "{:<%d.%d}{:>6}{:>9}{:>10}" % (self.desc_width, self.desc_width)
+            self.heading = self.item.format("Item", "Qty", "Rate", "Amount")
+        self.pair = "{:<%d}{:>%d}"
+        self.total = "{:>%d}{:>12}" % (width - 12)
+
+    def pair_line(self, left: str, right: str) -> str:
+        right = right[: self.width]
+        left = left[: max(0, self.width - len(right) - 1)]
+        return (self.pair % (self.width - len(right), len(right))).format(left, right)
+
+
+@lru_cache(maxsize=4)
+def _template(width: int) -> _Template:
+    return _Template(width)
+
+
+def _money(value) -> str:
+    return f"{Decimal(value):.2f}"
+
+
+def _qty(value) -> str:
+    q = Decimal(value)
+    return str(int(q)) if q == q.to_integral_value() else f"{q:.2f}"
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    words, lines, line = text.split(), [], ""
+    for word in words:
+        while len(word) > width:
+            if line:
+                lines.append(line)
+                line = ""
+            lines.append(word[:width])
+            word = word[width:]
+        if not line:
+            line = word
+        elif len(line) + 1 + len(word) <= width:
+            line += " " + word
+        else:
+            lines.append(line)
+            line = word
+    if line:
+        lines.append(line)
+    return lines or [""]
+
+
+def layout(data: dict, width: Optional[int] = None) -> List[Tuple[str, str]]:
+    """Receipt as (style, text) lines. CENTER / TITLE lines are left for the renderer to center."""
+    t = _template(width or settings.RECEIPT_WIDTH)
+    lines: List[Tuple[str, str]] = []
+    header = [h.strip() for h in settings.RECEIPT_HEADER.split("|") if h.strip()]
+    for i, text in enumerate(header):
+        lines.append((TITLE if i == 0 else CENTER, text))
+    if data["status"] not in CACHEABLE:
+        lines.append((BOLD, f"*** {str(data['status']).upper()} ***".center(t.width)))
+    lines.append((NORMAL, t.rule))
+
+    created = ""
+    if data["created_at"]:
+        local = datetime.fromisoformat(data["created_at"]) + timedelta(minutes=settings.LOCAL_UTC_OFFSET_MINUTES)
+        created = local.strftime("%d-%m-%Y %H:%M")
+    lines.append((NORMAL, t.pair_line(f"Bill: {data['invoice_number']}", created)))
+    where = f"Table: {data['table_number']}" if data["table_number"] else ""
+    lines.append((NORMAL, t.pair_line(where, str(data["order_type"] or "").title())))
+    if data["employee"]:
+        lines.append((NORMAL, f"Served by: {data['employee']}"[: t.width]))
+    lines.append((NORMAL, t.rule))
+
+    if not t.two_line:
+        lines.append((BOLD, t.heading))
+    subtotal = Decimal("0")
+    taxes: Dict[Decimal, Decimal] = defaultdict(Decimal)
+    total = Decimal("0")
+    for item in data["items"]:
+        qty, rate, net = _qty(item["quantity"]), _money(item["unit_price"]), _money(item["net"])
+        if t.two_line:
+            lines.append((NORMAL, t.item.format(item["description"])))
+            lines.append((NORMAL, t.numbers.format(f"{qty} x {rate}", net)))
+        else:
+            desc = _wrap(item["description"], t.desc_width)
+            lines.append((NORMAL, t.item.format(desc[0], qty, rate, net)))
+            lines.extend((NORMAL, part) for part in desc[1:])
+        subtotal += Decimal(item["net"])
+        taxes[Decimal(item["tax_rate"])] += Decimal(item["tax"])
+        total += Decimal(item["gross"])
+    lines.append((NORMAL, t.rule))
+
+    lines.append((NORMAL, t.total.format("Subtotal", _money(subtotal))))
+    for rate in sorted(taxes):
+        if taxes[rate]:
+            lines.append((NORMAL, t.total.format(f"Tax @{rate.normalize():f}%", _money(taxes[rate]))))
+    lines.append((TOTAL, t.total.format("TOTAL", _money(total))))
+    lines.append((NORMAL, t.rule))
+    for text in (f.strip() for f in settings.RECEIPT_FOOTER.split("|")):
+        if text:
+            lines.append((CENTER, text))
+    return lines
+
+
+# ---- renderers ----
+
+def render_text(data: dict) -> bytes:
+    width = settings.RECEIPT_WIDTH
+    out = [text.center(width).rstrip() if style in (CENTER, TITLE) else text.rstrip() for style, text in layout(data)]
+    return ("\n".join(out) + "\n").encode("utf-8")
+
+
+ESC_INIT = b"\x1b@"
+ESC_LEFT, ESC_CENTER = b"\x1ba\x00", b"\x1ba\x01"
+ESC_BOLD_ON, ESC_BOLD_OFF = b"\x1bE\x01", b"\x1bE\x00"
+GS_DOUBLE, GS_TALL, GS_NORMAL = b"\x1d!\x11", b"\x1d!\x01", b"\x1d!\x00"
+GS_FEED_CUT = b"\x1dVB\x03"
+
+
+def render_escpos(data: dict) -> bytes:
+    width = settings.RECEIPT_WIDTH
+    out = [ESC_INIT]
+    for style, text in layout(data):
+        raw = text.rstrip().encode("cp437", errors="replace")
+        if style == TITLE:
+            size = GS_DOUBLE if len(text) <= width // 2 else GS_NORMAL
+            out += [ESC_CENTER, ESC_BOLD_ON, size, raw, b"\n", GS_NORMAL, ESC_BOLD_OFF, ESC_LEFT]
+        elif style == CENTER:
+            out += [ESC_CENTER, raw, b"\n", ESC_LEFT]
+        elif style == TOTAL:
+            out += [ESC_BOLD_ON, GS_TALL, raw, b"\n", GS_NORMAL, ESC_BOLD_OFF]
+        elif style == BOLD:
+            out += [ESC_BOLD_ON, raw, b"\n", ESC_BOLD_OFF]
+        else:
+            out += [raw, b"\n"]
+    out.append(GS_FEED_CUT)
+    return b"".join(out)
+
+
+def _pdf_escape(text: str) -> bytes:
+    raw = text.encode("latin-1", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def render_pdf(data: dict) -> bytes:
+    """One page, as wide as the paper roll and as tall as the receipt."""
+    width = settings.RECEIPT_WIDTH
+    lines = layout(data)
+    size, leading, margin = 7.5, 9.5, 8.0
+    page_w = width * size * 0.6 + 2 * margin
+    page_h = len(lines) * leading + 2 * margin
+
+    content = [b"BT", b"%.2f TL" % leading, b"%.2f %.2f Td" % (margin, page_h - margin - size)]
+    font = None
+    for style, text in lines:
+        want = b"/F2" if style in (TITLE, BOLD, TOTAL) else b"/F1"
+        if want != font:
+            content.append(b"%s %.2f Tf" % (want, size))
+            font = want
+        if style in (CENTER, TITLE):
+            text = text.center(width)
+        content.append(b"(" + _pdf_escape(text.rstrip()) + b") Tj T*")
+    content.append(b"ET")
+    stream = b"\n".join(content)
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+        b"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>" % (page_w, page_h),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+RENDERERS = {"text": render_text, "escpos": render_escpos, "pdf": render_pdf}
+
+
+# ---- cache ----
+
+cache_hits = registry.register(Counter("pos_receipt_cache_hits_total", "Receipts served from cache", ("format",)))
+cache_misses = registry.register(Counter("pos_receipt_cache_misses_total", "Receipts rendered", ("format",)))
+
+
+class ReceiptCache:
+    """LRU of rendered receipts, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, key: tuple, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._entries[key] = body
+        self.bytes += len(body)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+
+cache = ReceiptCache(settings.RECEIPT_CACHE_BYTES)
+registry.register(Gauge(
+    "pos_receipt_cache_bytes", "Bytes held by the receipt cache", (), fn=lambda: {(): cache.bytes}))
+
+
+# ---- PDF process pool ----
+
+class PdfPool:
+    """Lazily started process pool for render_pdf (spawned, not forked: the parent runs an event loop)."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def render(self, items: List[dict]) -> List[bytes]:
+        if self.workers <= 0:
+            return [render_pdf(data) for data in items]
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        return list(await asyncio.gather(*(loop.run_in_executor(self._executor, render_pdf, d) for d in items)))
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+pdf_pool = PdfPool(settings.RECEIPT_PDF_WORKERS)
+
+
+async def render_receipts(
+    db: AsyncSession, outlet_id: int, invoice_ids: Sequence[int], fmt: str
+) -> Tuple[Dict[int, bytes], List[int]]:
+    """Rendered receipts by invoice id (cache first), plus the ids the outlet doesn't have."""
+    version = template_version()
+    out: Dict[int, bytes] = {}
+    misses = []
+    for invoice_id in dict.fromkeys(invoice_ids):
+        body = cache.get((outlet_id, invoice_id, fmt, version))
+        if body is not None:
+            out[invoice_id] = body
+        else:
+            misses.append(invoice_id)
+    if out:
+        cache_hits.inc((fmt,), len(out))
+    if not misses:
+        return out, []
+
+    data = await load_receipt_data(db, outlet_id, misses)
+    cache_misses.inc((fmt,), len(data))
+    items = list(data.values())
+    if fmt == "pdf":
+        bodies = await pdf_pool.render(items)
+    else:
+        bodies = [RENDERERS[fmt](d) for d in items]
+    for d, body in zip(items, bodies):
+        out[d["id"]] = body
+        if d["status"] in CACHEABLE:
+            cache.put((outlet_id, d["id"], fmt, version), body)
+    return out, [i for i in misses if i not in data]
@@ -6,6 +6,8 @@ from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime
 
+from app.core.config import settings
+
 
 class InvoiceItemCreate(BaseModel):
     product_id: int
@@ -24,6 +26,7 @@ class InvoiceCreate(BaseModel):
     table_number: Optional[str] = None
     order_type: Optional[str] = "dine-in"
     employee_id: Optional[int] = None
+    notes: Optional[str] = Field(None, max_length=2000)  # customer requests; searchable
     items: List[InvoiceItemCreate]
 
 
@@ -42,6 +45,11 @@ class InvoiceItemOut(BaseModel):
         orm_mode = True
 
 
+class StockWarning(BaseModel):
+    product_id: int
+    on_hand: Decimal
+
+
 class InvoiceOut(BaseModel):
     id: int
     invoice_number: str
@@ -49,10 +57,13 @@ class InvoiceOut(BaseModel):
     table_number: Optional[str] = None
     order_type: Optional[str] = None
     employee_id: Optional[int] = None
+    notes: Optional[str] = None
     status: str
     created_at: datetime
     total_amount: Decimal
     items: Optional[List[InvoiceItemOut]] = []
+    # tracked products this bill took below zero (86'd items)
+    stock_warnings: List[StockWarning] = []
 
     class Config:
         orm_mode = True
@@ -60,3 +71,44 @@ class InvoiceOut(BaseModel):
             Decimal: lambda v: float(v),
             datetime: lambda v: v.isoformat(),
         }
+
+
+class InvoiceSearchHit(BaseModel):
+    id: int
+    invoice_number: str
+    table_number: Optional[str] = None
+    order_type: Optional[str] = None
+    employee_id: Optional[int] = None
+    notes: Optional[str] = None
+    status: str
+    created_at: datetime
+    total_amount: Decimal
+
+    class Config:
+        orm_mode = True
+        json_encoders = {Decimal: lambda v: float(v)}
+
+
+class InvoiceSearchResponse(BaseModel):
+    date_from: str
+    date_to: str
+    results: List[InvoiceSearchHit]
+    # pass back as ?cursor= for the next page; null on the last page
+    next_cursor: Optional[str] = None
+
+
+class ReceiptBatchRequest(BaseModel):
+    invoice_ids: List[int] = Field(..., min_items=1, max_items=settings.RECEIPT_BATCH_MAX)
+    format: str = Field("text", regex="^(text|escpos|pdf)$")
+
+
+class ReceiptOut(BaseModel):
+    invoice_id: int
+    encoding: str  # "utf-8" for text, "base64" for escpos / pdf
+    content: str
+
+
+class ReceiptBatchResponse(BaseModel):
+    format: str
+    receipts: List[ReceiptOut]
+    missing: List[int] = []
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from decimal import Decimal
 from typing import Optional
 
@@ -10,6 +10,21 @@ class ProductCreate(BaseModel):
     tax_slab_id: int
     is_active: Optional[bool] = True
 
+class StockAdjust(BaseModel):
+    delta: Decimal  # + for deliveries, - for wastage / corrections
+    reason: str = Field("receipt", regex="^(receipt|adjustment)$")
+    note: Optional[str] = None
+
+class StockSettings(BaseModel):
+    track_stock: bool = True
+    shards: int = Field(0, ge=0, le=64)  # >0 for hot items, see app/stock.py
+
+class StockOut(BaseModel):
+    product_id: int
+    track_stock: bool
+    shards: int
+    on_hand: Decimal
+
 class ProductOut(BaseModel):
     id: int
     name: str
@@ -0,0 +1,63 @@
+# app/schemas/sync.py
+from pydantic import BaseModel, Field, root_validator
+from typing import Any, Dict, List, Optional
+from decimal import Decimal
+from datetime import datetime
+
+from app.schemas.invoice import InvoiceCreate
+
+
+class SyncInvoice(InvoiceCreate):
+    local_seq: int = Field(..., ge=0)
+    created_at: datetime  # when the bill was made on the terminal
+
+
+class SyncPayment(BaseModel):
+    local_seq: int = Field(..., ge=0)
+    # the invoice being paid: either one pushed by this terminal, or any invoice by number
+    invoice_local_seq: Optional[int] = None
+    invoice_number: Optional[str] = None
+    amount: Optional[Decimal] = None  # defaults to the invoice total
+    method: str = "cash"
+    reference: Optional[str] = None
+    paid_at: datetime
+
+    @root_validator(skip_on_failure=True)
+    def invoice_ref_required(cls, values):
+        if values.get("invoice_local_seq") is None and not values.get("invoice_number"):
+            raise ValueError("invoice_local_seq or invoice_number is required")
+        return values
+
+
+class SyncPushRequest(BaseModel):
+    terminal_id: str = Field(..., min_length=1, max_length=100)
+    invoices: List[SyncInvoice] = []
+    payments: List[SyncPayment] = []
+    # pass the last cursor to get catalog deltas back in the same round trip
+    cursor: Optional[str] = None
+
+
+class SyncResult(BaseModel):
+    kind: str
+    local_seq: int
+    status: str  # "applied" | "duplicate" | "error"
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class CatalogChanges(BaseModel):
+    cursor: str
+    has_more: bool = False
+    # true for a full download: once has_more is false, drop local rows it did not include
+    snapshot: bool = False
+    products: List[Dict[str, Any]] = []
+    tax_slabs: List[Dict[str, Any]] = []
+    categories: List[Dict[str, Any]] = []
+    # table -> ids deleted since the cursor
+    deleted: Dict[str, List[int]] = {}
+
+
+class SyncPushResponse(BaseModel):
+    terminal_id: str
+    results: List[SyncResult]
+    changes: Optional[CatalogChanges] = None
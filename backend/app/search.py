@@ -0,0 +1,136 @@
+# app/search.py
+"""
+Invoice search for floor staff (GET /invoices/search): find a bill to reprint or void.
+
+Every search is bounded by the outlet and a window of business dates, and each
+filter has an index behind it, so nothing scans invoice with LIKE '%x%':
+
+- number: invoice_number prefix, as the range [prefix, next prefix). Postgres
+  uses ix_invoice_number_prefix (COLLATE "C", so the range is byte order);
+  SQLite uses the (outlet_id, invoice_number) unique index.
+- table: exact table_number (ix_invoice_outlet_table).
+- q: every word, as a prefix, in the bill's notes or in one of its item
+  descriptions. Postgres uses GIN tsvector indexes, SQLite FTS5 tables
+  (both declared in db/models.py).
+- min_total / max_total: total_amount range inside the window.
+
+Results are newest first, keyset-paginated on (created_at, id) with an opaque cursor.
+"""
+import base64
+import json
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, column, literal_column, or_, select, table, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.dialect import is_sqlite
+from app.db.models import DESCRIPTION_TSV, NOTES_TSV, Invoice, InvoiceItem
+from app.shifts import business_day_bounds, shift_of
+
+MAX_TERMS = 8
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+COLUMNS = (
+    Invoice.id, Invoice.invoice_number, Invoice.table_number, Invoice.order_type, Invoice.employee_id,
+    Invoice.notes, Invoice.status, Invoice.created_at, Invoice.total_amount,
+)
+
+# SQLite FTS5 tables; rowid is invoice.id / invoice_item.id
+_invoice_fts = table("invoice_fts", column("rowid"))
+_item_fts = table("invoice_item_fts", column("rowid"))
+
+
+def date_window(date_from: Optional[date], date_to: Optional[date]) -> Tuple[date, date]:
+    """Business dates to search (default today); ValueError when reversed or wider than SEARCH_MAX_DAYS."""
+    today = shift_of(datetime.utcnow())[0]
+    date_from = date_from or date_to or today
+    date_to = date_to or max(date_from, today)
+    if date_from > date_to:
+        raise ValueError("date_from must not be after date_to")
+    if (date_to - date_from).days >= settings.SEARCH_MAX_DAYS:
+        raise ValueError(f"date window is limited to {settings.SEARCH_MAX_DAYS} days")
+    return date_from, date_to
+
+
+def encode_cursor(created_at: datetime, invoice_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), invoice_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        ts, invoice_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(ts), int(invoice_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _prefix(col, prefix: str):
+    """col LIKE 'prefix%' as a range an ordinary btree can serve."""
+    last = ord(prefix[-1])
+    if last >= 0x10FFFF:
+        return col >= prefix
+    return and_(col >= prefix, col < prefix[:-1] + chr(last + 1))
+
+
+def _text_match(db: AsyncSession, words: List[str], start: datetime, end: datetime):
+    """Bills whose notes, or one of whose item descriptions, contain every word (as a prefix)."""
+    items = select(InvoiceItem.invoice_id).where(
+        InvoiceItem.invoice_created_at >= start, InvoiceItem.invoice_created_at < end
+    )
+    if is_sqlite(db):
+        match = " ".join(f'"{w}"*' for w in words)
+        notes = select(_invoice_fts.c.rowid).where(literal_column("invoice_fts").match(match))
+        items = items.join(_item_fts, _item_fts.c.rowid == InvoiceItem.id).where(
+            literal_column("invoice_item_fts").match(match)
+        )
+        return or_(Invoice.id.in_(notes), Invoice.id.in_(items))
+    query = text("to_tsquery('simple', :tsquery)").bindparams(tsquery=" & ".join(f"{w}:*" for w in words))
+    return or_(NOTES_TSV.op("@@")(query), Invoice.id.in_(items.where(DESCRIPTION_TSV.op("@@")(query))))
+
+
+async def search_invoices(
+    db: AsyncSession,
+    outlet_id: int,
+    date_from: date,
+    date_to: date,
+    number: Optional[str] = None,
+    table_number: Optional[str] = None,
+    q: Optional[str] = None,
+    min_total: Optional[Decimal] = None,
+    max_total: Optional[Decimal] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of matching bills (newest first) and the cursor for the next page (None on the last)."""
+    start, end = business_day_bounds(date_from, date_to)
+    stmt = select(*COLUMNS).where(Invoice.outlet_id == outlet_id, Invoice.created_at >= start, Invoice.created_at < end)
+    if number:
+        # must match ix_invoice_number_prefix on Postgres
+        key = Invoice.invoice_number if is_sqlite(db) else Invoice.invoice_number.collate("C")
+        stmt = stmt.where(_prefix(key, number))
+    if table_number:
+        stmt = stmt.where(Invoice.table_number == table_number)
+    if q is not None:
+        words = _WORD_RE.findall(q.lower())[:MAX_TERMS]
+        if not words:
+            raise ValueError("q has no words to search for")
+        stmt = stmt.where(_text_match(db, words, start, end))
+    if min_total is not None:
+        stmt = stmt.where(Invoice.total_amount >= min_total)
+    if max_total is not None:
+        stmt = stmt.where(Invoice.total_amount <= max_total)
+    if cursor:
+        stmt = stmt.where(tuple_(Invoice.created_at, Invoice.id) < tuple_(*decode_cursor(cursor)))
+
+    rows = (await db.execute(stmt.order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [dict(row._mapping) for row in rows], next_cursor
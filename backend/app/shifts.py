@@ -0,0 +1,318 @@
+# app/shifts.py
+"""
+Per-employee, per-shift sales aggregates.
+
+Shifts come from SHIFTS ("morning=06:00,evening=15:00", local time,
+LOCAL_UTC_OFFSET_MINUTES): each runs until the next starts, and the last one
+runs past midnight until the first one starts the next day, still counting
+towards the business date it started on.
+
+employee_shift_stats / employee_shift_payment are bumped with one upsert
+each, in the same transaction that finalizes or pays invoices (invoice
+create, the pay endpoints, offline sync batches), so reports read a few
+rows per shift instead of scanning invoices. rebuild() recomputes a date
+range from invoice / payment (e.g. after enabling this on an existing
+database). Windows that don't line up with shifts are computed live from
+invoice through the (employee_id, created_at) index.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.dialect import upsert_insert
+from app.db.models import Employee, EmployeeShiftPayment, EmployeeShiftStats, Invoice, InvoiceItem, Payment
+
+NO_EMPLOYEE = 0
+# paid through /invoices/{id}/pay, which records no payment row
+UNRECORDED = "unrecorded"
+FINAL_STATUSES = ("finalized", "paid")
+
+ShiftKey = Tuple[int, date, str]  # (employee_id, shift_date, shift) within one outlet
+
+
+def parse_shifts(spec: str) -> List[Tuple[time, str]]:
+    shifts = []
+    for part in spec.split(","):
+        name, _, start = part.strip().partition("=")
+        hours, _, minutes = start.strip().partition(":")
+        shifts.append((time(int(hours), int(minutes or 0)), name.strip()))
+    if not shifts:
+        raise ValueError("SHIFTS must name at least one shift")
+    return sorted(shifts)
+
+
+SHIFTS = parse_shifts(settings.SHIFTS)
+
+
+def _offset() -> timedelta:
+    return timedelta(minutes=settings.LOCAL_UTC_OFFSET_MINUTES)
+
+
+def utc_naive(dt: datetime) -> datetime:
+    """Timestamps are stored as naive UTC: convert an aware value to UTC; a naive one is taken as UTC."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def shift_of(created_at: datetime) -> Tuple[date, str]:
+    """(business date, shift name) of a UTC timestamp."""
+    local = created_at + _offset()
+    current = None
+    for start, name in SHIFTS:
+        if local.time() >= start:
+            current = name
+    if current is None:
+        # before the first shift of the day: still the previous day's last shift
+        return local.date() - timedelta(days=1), SHIFTS[-1][1]
+    return local.date(), current
+
+
+def business_day_bounds(date_from: date, date_to: date) -> Tuple[datetime, datetime]:
+    """UTC [start, end) covering every shift of business dates date_from..date_to."""
+    first = SHIFTS[0][0]
+    start = datetime.combine(date_from, first) - _offset()
+    end = datetime.combine(date_to + timedelta(days=1), first) - _offset()
+    return start, end
+
+
+def _key(employee_id: Optional[int], created_at: datetime) -> ShiftKey:
+    return (employee_id or NO_EMPLOYEE, *shift_of(created_at))
+
+
+# ---- write path ----
+
+async def record_invoices(
+    db: AsyncSession, outlet_id: int, invoices: Iterable[Tuple[Optional[int], datetime, Decimal, Decimal]]
+):
+    """Add an outlet's finalized invoices, given as (employee_id, created_at, items, gross). Does not commit."""
+    totals: Dict[ShiftKey, list] = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    for employee_id, created_at, items, gross in invoices:
+        acc = totals[_key(employee_id, created_at)]
+        acc[0] += 1
+        acc[1] += Decimal(str(items))
+        acc[2] += Decimal(str(gross))
+    if not totals:
+        return
+    stmt = upsert_insert(db, EmployeeShiftStats).values([
+        {"outlet_id": outlet_id, "employee_id": e, "shift_date": d, "shift": s,
+         "invoices": n, "items": items, "gross": gross, "paid_invoices": 0}
+        for (e, d, s), (n, items, gross) in totals.items()
+    ])
+    t = EmployeeShiftStats
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[t.outlet_id, t.employee_id, t.shift_date, t.shift],
+        set_={
+            "invoices": t.invoices + stmt.excluded["invoices"],
+            "items": t.items + stmt.excluded["items"],
+            "gross": t.gross + stmt.excluded["gross"],
+        },
+    ))
+
+
+async def record_payments(
+    db: AsyncSession, outlet_id: int, payments: Iterable[Tuple[Optional[int], datetime, str, Decimal, bool]]
+):
+    """
+    Add an outlet's payments, given as (employee_id, invoice_created_at, method, amount, newly_paid);
+    newly_paid marks the payment that moved its invoice to "paid". Does not commit.
+    """
+    mix: Dict[tuple, list] = defaultdict(lambda: [0, Decimal("0")])
+    paid: Dict[ShiftKey, int] = defaultdict(int)
+    for employee_id, created_at, method, amount, newly_paid in payments:
+        key = _key(employee_id, created_at)
+        acc = mix[key + (method or UNRECORDED,)]
+        acc[0] += 1
+        acc[1] += Decimal(str(amount or 0))
+        if newly_paid:
+            paid[key] += 1
+    if mix:
+        stmt = upsert_insert(db, EmployeeShiftPayment).values([
+            {"outlet_id": outlet_id, "employee_id": e, "shift_date": d, "shift": s, "method": m,
+             "payments": n, "amount": amount}
+            for (e, d, s, m), (n, amount) in mix.items()
+        ])
+        t = EmployeeShiftPayment
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[t.outlet_id, t.employee_id, t.shift_date, t.shift, t.method],
+            set_={"payments": t.payments + stmt.excluded["payments"], "amount": t.amount + stmt.excluded["amount"]},
+        ))
+    if paid:
+        stmt = upsert_insert(db, EmployeeShiftStats).values([
+            {"outlet_id": outlet_id, "employee_id": e, "shift_date": d, "shift": s,
+             "invoices": 0, "items": 0, "gross": 0, "paid_invoices": n}
+            for (e, d, s), n in paid.items()
+        ])
+        t = EmployeeShiftStats
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[t.outlet_id, t.employee_id, t.shift_date, t.shift],
+            set_={"paid_invoices": t.paid_invoices + stmt.excluded["paid_invoices"]},
+        ))
+
+
+async def rebuild(db: AsyncSession, outlet_id: int, date_from: date, date_to: date) -> dict:
+    """Recompute an outlet's aggregates for business dates date_from..date_to from invoice / payment. Commits."""
+    start, end = business_day_bounds(date_from, date_to)
+    for model in (EmployeeShiftStats, EmployeeShiftPayment):
+        await db.execute(delete(model).where(
+            model.outlet_id == outlet_id, model.shift_date >= date_from, model.shift_date <= date_to
+        ))
+    in_range = and_(
+        Invoice.outlet_id == outlet_id,
+        Invoice.created_at >= start,
+        Invoice.created_at < end,
+        Invoice.status.in_(FINAL_STATUSES),
+    )
+
+    items = (
+        select(func.coalesce(func.sum(InvoiceItem.quantity), 0))
+        .where(InvoiceItem.invoice_id == Invoice.id, InvoiceItem.invoice_created_at == Invoice.created_at)
+        .scalar_subquery()
+    )
+    q = await db.execute(
+        select(Invoice.id, Invoice.employee_id, Invoice.created_at, Invoice.total_amount, Invoice.status, items)
+        .where(in_range)
+    )
+    invoices = q.all()
+    await record_invoices(db, outlet_id, [(r.employee_id, r.created_at, r[5], r.total_amount or 0) for r in invoices])
+
+    q = await db.execute(
+        select(Payment.invoice_id, Invoice.employee_id, Invoice.created_at, Payment.method, Payment.amount)
+        .join(Invoice, and_(Invoice.id == Payment.invoice_id, Invoice.created_at == Payment.invoice_created_at))
+        .where(in_range)
+        .order_by(Payment.id)
+    )
+    payments, seen = [], set()
+    for invoice_id, employee_id, created_at, method, amount in q.all():
+        payments.append((employee_id, created_at, method, amount, invoice_id not in seen))
+        seen.add(invoice_id)
+    # paid without a payment row
+    payments += [
+        (r.employee_id, r.created_at, UNRECORDED, r.total_amount, True)
+        for r in invoices if r.status == "paid" and r.id not in seen
+    ]
+    await record_payments(db, outlet_id, payments)
+    await db.commit()
+    return {"date_from": date_from.isoformat(), "date_to": date_to.isoformat(),
+            "invoices": len(invoices), "payments": len(payments)}
+
+
+# ---- read path ----
+
+def _metrics(invoices: int, items, gross, paid_invoices: int, mix: Dict[str, dict]) -> dict:
+    gross = Decimal(str(gross or 0))
+    items = Decimal(str(items or 0))
+    return {
+        "invoices": invoices,
+        "gross": float(gross),
+        "avg_ticket": float(round(gross / invoices, 2)) if invoices else 0.0,
+        "items_per_ticket": float(round(items / invoices, 2)) if invoices else 0.0,
+        "paid_invoices": paid_invoices,
+        "payment_mix": mix,
+    }
+
+
+def _mix_entry(payments: int, amount) -> dict:
+    return {"payments": int(payments), "amount": float(amount or 0)}
+
+
+async def shift_report(
+    db: AsyncSession, outlet_id: int, date_from: date, date_to: date, employee_id: Optional[int] = None
+) -> List[dict]:
+    """One row per (business date, shift, employee) from the aggregate tables."""
+    t, p = EmployeeShiftStats, EmployeeShiftPayment
+    stats_q = (
+        select(t, Employee.full_name)
+        .outerjoin(Employee, Employee.id == t.employee_id)
+        .where(t.outlet_id == outlet_id, t.shift_date >= date_from, t.shift_date <= date_to)
+        .order_by(t.shift_date, t.shift, t.employee_id)
+    )
+    pay_q = select(p).where(p.outlet_id == outlet_id, p.shift_date >= date_from, p.shift_date <= date_to)
+    if employee_id is not None:
+        stats_q = stats_q.where(t.employee_id == employee_id)
+        pay_q = pay_q.where(p.employee_id == employee_id)
+
+    mixes: Dict[ShiftKey, Dict[str, dict]] = defaultdict(dict)
+    for row in (await db.execute(pay_q)).scalars():
+        mixes[(row.employee_id, row.shift_date, row.shift)][row.method] = _mix_entry(row.payments, row.amount)
+    rows = []
+    for row, name in (await db.execute(stats_q)).all():
+        key = (row.employee_id, row.shift_date, row.shift)
+        rows.append({
+            "shift_date": row.shift_date.isoformat(),
+            "shift": row.shift,
+            "employee_id": row.employee_id or None,
+            "employee_name": name,
+            **_metrics(row.invoices, row.items, row.gross, row.paid_invoices, mixes.get(key, {})),
+        })
+    return rows
+
+
+async def employee_totals(db: AsyncSession, outlet_id: int, employee_id: int, date_from: date, date_to: date) -> dict:
+    """Totals over whole business dates, from the aggregate tables."""
+    t, p = EmployeeShiftStats, EmployeeShiftPayment
+    q = await db.execute(
+        select(func.count(), func.sum(t.invoices), func.sum(t.items), func.sum(t.gross), func.sum(t.paid_invoices))
+        .where(t.outlet_id == outlet_id, t.employee_id == employee_id,
+               t.shift_date >= date_from, t.shift_date <= date_to)
+    )
+    shifts, invoices, items, gross, paid = q.one()
+    q = await db.execute(
+        select(p.method, func.sum(p.payments), func.sum(p.amount))
+        .where(p.outlet_id == outlet_id, p.employee_id == employee_id,
+               p.shift_date >= date_from, p.shift_date <= date_to)
+        .group_by(p.method)
+    )
+    mix = {method: _mix_entry(n, amount) for method, n, amount in q.all()}
+    return {"shifts": shifts, **_metrics(int(invoices or 0), items, gross, int(paid or 0), mix)}
+
+
+async def employee_window(db: AsyncSession, outlet_id: int, employee_id: int, since: datetime, until: datetime) -> dict:
+    """Totals for an arbitrary UTC window, computed live through ix_invoice_employee_created."""
+    in_window = and_(
+        Invoice.employee_id == employee_id,
+        Invoice.outlet_id == outlet_id,
+        Invoice.created_at >= since,
+        Invoice.created_at < until,
+        Invoice.status.in_(FINAL_STATUSES),
+    )
+    items = (
+        select(func.coalesce(func.sum(InvoiceItem.quantity), 0))
+        .join(Invoice, and_(Invoice.id == InvoiceItem.invoice_id, Invoice.created_at == InvoiceItem.invoice_created_at))
+        .where(in_window)
+        .scalar_subquery()
+    )
+    q = await db.execute(
+        select(
+            func.count(),
+            func.sum(Invoice.total_amount),
+            func.sum(case((Invoice.status == "paid", 1), else_=0)),
+            items,
+        ).where(in_window)
+    )
+    invoices, gross, paid, item_count = q.one()
+    q = await db.execute(
+        select(Payment.method, func.count(), func.sum(Payment.amount))
+        .join(Invoice, and_(Invoice.id == Payment.invoice_id, Invoice.created_at == Payment.invoice_created_at))
+        .where(in_window)
+        .group_by(Payment.method)
+    )
+    mix = {method: _mix_entry(n, amount) for method, n, amount in q.all()}
+    has_payment = (
+        select(Payment.id)
+        .where(Payment.invoice_id == Invoice.id, Payment.invoice_created_at == Invoice.created_at)
+        .exists()
+    )
+    q = await db.execute(
+        select(func.count(), func.sum(Invoice.total_amount))
+        .where(in_window, Invoice.status == "paid", ~has_payment)
+    )
+    n, amount = q.one()
+    if n:
+        mix[UNRECORDED] = _mix_entry(n, amount)
+    return _metrics(int(invoices or 0), item_count, gross, int(paid or 0), mix)
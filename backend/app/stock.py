@@ -0,0 +1,256 @@
+# app/stock.py
+"""
+Stock tracking for products with track_stock set.
+
+Every movement is a stock_ledger row; product.stock_qty (plus shard deltas) is
+a running counter kept next to it so reads are cheap.
+
+- apply_sale(): called inside the invoice transaction. All lines of a bill
+  (or of a whole sync batch) are applied with one set-based UPDATE ..
+  CASE .. RETURNING, so a bill costs the same number of statements no matter
+  how many lines it has. Products that went below zero are returned as
+  warnings; the sale itself is never blocked (the kitchen already served it).
+- hot products (stock_shards > 0) are decremented on one of N shard rows
+  picked by invoice id, so concurrent bills for the same item don't queue on
+  one row lock.
+- reconcile(): folds shard deltas back into product.stock_qty and checks the
+  counters against sum(ledger.delta), correcting any drift. StockReconciler
+  runs it every STOCK_RECONCILE_INTERVAL seconds on every outlet database.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, delete, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import Product, ProductStockShard, StockLedger
+from app.db.outlets import all_targets
+from app.db.session import outlet_router
+
+logger = logging.getLogger(__name__)
+
+
+def _amounts(column, amounts: Dict[int, Decimal]):
+    """CASE <column> WHEN id THEN amount ... END for a set-based update."""
+    return case({pid: literal(qty) for pid, qty in amounts.items()}, value=column)
+
+
+def _shard_sum():
+    return (
+        select(func.coalesce(func.sum(ProductStockShard.delta), 0))
+        .where(ProductStockShard.product_id == Product.id)
+        .scalar_subquery()
+    )
+
+
+async def on_hand(db: AsyncSession, product_ids: Iterable[int]) -> Dict[int, Decimal]:
+    ids = list(product_ids)
+    if not ids:
+        return {}
+    q = await db.execute(select(Product.id, Product.stock_qty + _shard_sum()).where(Product.id.in_(ids)))
+    return {pid: Decimal(str(qty)) for pid, qty in q.all()}
+
+
+async def apply_sale(
+    db: AsyncSession, outlet_id: int, lines: Iterable[Tuple[int, Optional[int], Decimal]]
+) -> List[dict]:
+    """
+    Decrement stock for sold lines given as (invoice_id, product_id, quantity) of the outlet's products.
+    Does not commit. Returns [{"product_id", "on_hand"}] for tracked products now below zero.
+    """
+    per_product: Dict[int, Decimal] = defaultdict(Decimal)
+    per_invoice: Dict[Tuple[int, int], Decimal] = defaultdict(Decimal)
+    for invoice_id, product_id, qty in lines:
+        if product_id is None:
+            continue
+        per_product[product_id] += Decimal(str(qty))
+        per_invoice[(invoice_id, product_id)] += Decimal(str(qty))
+    if not per_product:
+        return []
+
+    # 1) plain counters: one UPDATE for every line of the bill
+    q = await db.execute(
+        update(Product)
+        .where(
+            Product.id.in_(list(per_product)),
+            Product.outlet_id == outlet_id,
+            Product.track_stock.is_(True),
+            Product.stock_shards == 0,
+        )
+        # keep updated_at: a sale is not a catalog change terminals need to re-sync
+        .values(stock_qty=Product.stock_qty - _amounts(Product.id, per_product), updated_at=Product.updated_at)
+        .returning(Product.id, Product.stock_qty)
+        .execution_options(synchronize_session=False)
+    )
+    levels = {pid: Decimal(str(qty)) for pid, qty in q.all()}
+
+    # 2) sharded (hot) counters: one UPDATE on the shard picked by this bill
+    rest = {pid: qty for pid, qty in per_product.items() if pid not in levels}
+    if rest:
+        slot = min(invoice_id for invoice_id, _ in per_invoice)
+        q = await db.execute(
+            update(ProductStockShard)
+            .where(
+                ProductStockShard.product_id.in_(
+                    select(Product.id).where(Product.id.in_(list(rest)), Product.outlet_id == outlet_id)
+                ),
+                ProductStockShard.shard == literal(slot) % ProductStockShard.nshards,
+            )
+            .values(delta=ProductStockShard.delta - _amounts(ProductStockShard.product_id, rest))
+            .returning(ProductStockShard.product_id)
+            .execution_options(synchronize_session=False)
+        )
+        sharded = set(q.scalars())
+        if sharded:
+            # estimate only; exact per-row levels come back at the next reconcile
+            levels.update(await on_hand(db, sharded))
+
+    if not levels:
+        return []
+    await db.execute(insert(StockLedger), [
+        {"product_id": pid, "delta": -qty, "reason": "sale", "invoice_id": invoice_id}
+        for (invoice_id, pid), qty in per_invoice.items() if pid in levels
+    ])
+    return [{"product_id": pid, "on_hand": qty} for pid, qty in levels.items() if qty < 0]
+
+
+async def adjust(db: AsyncSession, product_id: int, delta: Decimal, reason: str, note: Optional[str] = None) -> Decimal:
+    """Record a receipt / manual adjustment for one product. Does not commit; returns the new on-hand level."""
+    await db.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock_qty=Product.stock_qty + delta, updated_at=Product.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.add(StockLedger(product_id=product_id, delta=delta, reason=reason, note=note))
+    await db.flush()
+    return (await on_hand(db, [product_id]))[product_id]
+
+
+async def _fold_shards(db: AsyncSession, product_ids=None) -> int:
+    """Move shard deltas into product.stock_qty. Shard rows read are locked, so sales on them wait."""
+    q = select(ProductStockShard.product_id, ProductStockShard.shard, ProductStockShard.delta).where(
+        ProductStockShard.delta != 0
+    )
+    if product_ids is not None:
+        q = q.where(ProductStockShard.product_id.in_(product_ids))
+    rows = (await db.execute(q.with_for_update())).all()
+    if not rows:
+        return 0
+    totals: Dict[int, Decimal] = defaultdict(Decimal)
+    for pid, _, delta in rows:
+        totals[pid] += Decimal(str(delta))
+    await db.execute(
+        update(Product)
+        .where(Product.id.in_(list(totals)))
+        .values(stock_qty=Product.stock_qty + _amounts(Product.id, totals), updated_at=Product.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    # subtract exactly what was read, from exactly the rows that were read (and locked):
+    # a shard that was at 0 above was not locked, and a sale may have landed on it since
+    shards = ProductStockShard.__table__
+    await db.execute(
+        update(shards)
+        .where(shards.c.product_id == bindparam("b_product_id"), shards.c.shard == bindparam("b_shard"))
+        .values(delta=shards.c.delta - bindparam("b_read", type_=shards.c.delta.type)),
+        [{"b_product_id": pid, "b_shard": shard, "b_read": delta} for pid, shard, delta in rows],
+    )
+    return len(totals)
+
+
+async def configure(db: AsyncSession, product_id: int, track_stock: bool, shards: int) -> None:
+    """Turn tracking on/off and set the number of shard rows (0 = plain counter). Does not commit."""
+    if not track_stock:
+        shards = 0
+    await _fold_shards(db, [product_id])
+    await db.execute(delete(ProductStockShard).where(ProductStockShard.product_id == product_id))
+    if shards > 0:
+        await db.execute(insert(ProductStockShard), [
+            {"product_id": product_id, "shard": n, "nshards": shards, "delta": 0} for n in range(shards)
+        ])
+    await db.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(track_stock=track_stock, stock_shards=shards, updated_at=Product.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def reconcile(db: AsyncSession, fix: bool = True, outlet_id: Optional[int] = None) -> dict:
+    """
+    Fold shards, then compare each tracked product's on-hand (counter plus shard
+    deltas) with its ledger, in one statement: a sale committed after the fold
+    is counted on both sides. Drift is corrected by adding the difference (not
+    overwriting), so sales committed meanwhile are kept. Covers one outlet, or
+    the whole database when outlet_id is None. Commits.
+    """
+    outlet_products = select(Product.id).where(Product.outlet_id == outlet_id) if outlet_id is not None else None
+    folded = await _fold_shards(db, outlet_products)
+    ledger = (
+        select(func.coalesce(func.sum(StockLedger.delta), 0))
+        .where(StockLedger.product_id == Product.id)
+        .scalar_subquery()
+    )
+    q = select(Product.id, Product.stock_qty + _shard_sum(), ledger).where(Product.track_stock.is_(True))
+    if outlet_id is not None:
+        q = q.where(Product.outlet_id == outlet_id)
+    q = await db.execute(q)
+    drift = {}
+    for pid, counter, expected in q.all():
+        diff = Decimal(str(expected)) - Decimal(str(counter))
+        if diff != 0:
+            drift[pid] = diff
+    if drift and fix:
+        await db.execute(
+            update(Product)
+            .where(Product.id.in_(list(drift)))
+            .values(stock_qty=Product.stock_qty + _amounts(Product.id, drift), updated_at=Product.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    if drift:
+        logger.warning("Stock drift on %d products (fixed=%s): %s", len(drift), fix, drift)
+    return {"folded_products": folded, "drift": {pid: float(d) for pid, d in drift.items()}}
+
+
+class StockReconciler:
+    """Background task running reconcile() every `interval` seconds (same lifecycle as the audit writer)."""
+
+    def __init__(self, session_factories: Callable[[], Iterable], interval: float):
+        self.session_factories = session_factories
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="stock-reconciler")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for session_factory in self.session_factories():
+                try:
+                    async with session_factory() as session:
+                        await reconcile(session)
+                except Exception as e:
+                    logger.exception("Stock reconciliation failed: %s", e)
+
+
+def _outlet_databases():
+    return [outlet_router.sessionmaker(target) for target in all_targets()]
+
+
+stock_reconciler = StockReconciler(_outlet_databases, settings.STOCK_RECONCILE_INTERVAL)
@@ -0,0 +1,393 @@
+# app/sync.py
+"""
+Offline terminal sync.
+
+Push: a terminal that billed while offline sends everything it made in one
+batch, each record tagged with its own (terminal_id, local_seq); terminal ids
+are per outlet, like everything else here. The batch is
+applied with set-based statements, not per bill:
+
+  1. claim every (terminal_id, local_seq) in terminal_sync_log with one
+     INSERT .. ON CONFLICT DO NOTHING; seqs that were already claimed are
+     reported back as "duplicate" with the server id they got the first time,
+     so retrying a batch after a lost response is safe
+  2. one multi-row INSERT for the invoices, one for all their items
+  3. payments: one SELECT .. FOR UPDATE on the invoices they pay, one INSERT,
+     one UPDATE marking those invoices paid
+  4. the per-shift employee aggregates (app/shifts.py), one upsert per table
+  5. after commit, bills with lines sold off list price go to the audit log
+
+Pull: Product / TaxSlab / Category rows changed since the terminal's cursor.
+Every catalog write appends (entity, id) to catalog_change in its own
+transaction (crud.record_catalog_change), and seq commits in order, so
+paging through the log by seq cannot skip a row that committed late, which a
+keyset on app-assigned updated_at could. Each page returns the current state
+of the rows it names; a row that no longer exists is reported in `deleted`
+(deactivation is just a change to is_active). The first pull, or one with a
+cursor from before the log, is a full download paged by id. The cursor is
+opaque to terminals.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.audit import audit_async
+from app.crud import foreign_products, invoice_item_values, list_prices, outlet_employees, price_overrides
+from app.db.dialect import upsert_insert
+from app import shifts, stock
+from app.db.models import (
+    PARTITIONED, CatalogChange, Category, Invoice, InvoiceItem, InvoiceKey, Payment, Product, TaxSlab,
+    TerminalSyncLog,
+)
+
+
+class SyncError(ValueError):
+    pass
+
+
+def _result(kind: str, seq: int, status: str, id_: Optional[int] = None, error: Optional[str] = None) -> dict:
+    return {"kind": kind, "local_seq": seq, "status": status, "id": id_, "error": error}
+
+
+async def _claim(db: AsyncSession, outlet_id: int, terminal_id: str, entries: List[Tuple[int, str]]) -> Dict[int, int]:
+    """Insert sync-log rows for (seq, kind) pairs; returns {seq: log_id} for the ones not seen before."""
+    stmt = (
+        upsert_insert(db, TerminalSyncLog)
+        .values([
+            {"outlet_id": outlet_id, "terminal_id": terminal_id, "local_seq": seq, "kind": kind}
+            for seq, kind in entries
+        ])
+        .on_conflict_do_nothing(index_elements=["outlet_id", "terminal_id", "local_seq"])
+        .returning(TerminalSyncLog.id, TerminalSyncLog.local_seq)
+    )
+    return {seq: log_id for log_id, seq in (await db.execute(stmt)).all()}
+
+
+async def _apply_invoices(
+    db: AsyncSession, outlet_id: int, invoices, results: dict, overrides: list
+) -> Dict[int, Tuple[int, datetime]]:
+    """Insert claimed invoices + items; returns {local_seq: (invoice_id, created_at)}.
+
+    Bills with lines sold off list price are appended to `overrides` as (invoice_id, created_by, lines).
+    """
+    numbers = [inv.invoice_number for inv in invoices]
+    taken = set()
+    if numbers:
+        q = await db.execute(
+            select(Invoice.invoice_number).where(Invoice.outlet_id == outlet_id, Invoice.invoice_number.in_(numbers))
+        )
+        taken = set(q.scalars())
+
+    lines_of = {inv.local_seq: [invoice_item_values(item) for item in inv.items] for inv in invoices}
+    prices = await list_prices(db, outlet_id, [line["product_id"] for lines in lines_of.values() for line in lines])
+    employees = await outlet_employees(db, outlet_id, [inv.employee_id for inv in invoices])
+
+    rows, items, accepted = [], [], []
+    for inv in invoices:
+        if inv.invoice_number in taken:
+            results[inv.local_seq] = _result("invoice", inv.local_seq, "error", error="invoice_number already exists")
+            continue
+        lines = lines_of[inv.local_seq]
+        foreign = foreign_products(lines, prices)
+        if foreign:
+            results[inv.local_seq] = _result(
+                "invoice", inv.local_seq, "error", error=f"products not found in this outlet: {foreign}"
+            )
+            continue
+        if inv.employee_id is not None and inv.employee_id not in employees:
+            results[inv.local_seq] = _result(
+                "invoice", inv.local_seq, "error", error=f"employee_id {inv.employee_id} not found in this outlet"
+            )
+            continue
+        taken.add(inv.invoice_number)
+        created_at = shifts.utc_naive(inv.created_at)
+        rows.append({
+            "outlet_id": outlet_id,
+            "invoice_number": inv.invoice_number,
+            "created_by": inv.created_by,
+            "created_at": created_at,
+            "table_number": inv.table_number,
+            "order_type": inv.order_type,
+            "employee_id": inv.employee_id,
+            "notes": inv.notes,
+            "status": "finalized",
+            "total_amount": sum((line["line_total_incl_tax"] for line in lines), Decimal("0.00")),
+        })
+        items.append(lines)
+        accepted.append(inv)
+
+    applied = {}
+    if not rows:
+        return applied
+    stmt = insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True)
+    ids = (await db.execute(stmt, rows)).scalars().all()
+    if PARTITIONED:
+        # enforces per-outlet invoice_number uniqueness against concurrent writers (see InvoiceKey)
+        await db.execute(insert(InvoiceKey), [
+            {"id": invoice_id, "outlet_id": outlet_id, "invoice_number": row["invoice_number"],
+             "created_at": row["created_at"]}
+            for row, invoice_id in zip(rows, ids)
+        ])
+
+    item_rows = []
+    for inv, row, invoice_id, lines in zip(accepted, rows, ids, items):
+        applied[inv.local_seq] = (invoice_id, row["created_at"])
+        results[inv.local_seq] = _result("invoice", inv.local_seq, "applied", invoice_id)
+        changed = price_overrides(lines, prices)
+        if changed:
+            overrides.append((invoice_id, row["created_by"], changed))
+        for line in lines:
+            item_rows.append({"invoice_id": invoice_id, "invoice_created_at": row["created_at"], **line})
+    if item_rows:
+        await db.execute(insert(InvoiceItem), item_rows)
+        # stock for the whole batch in one pass
+        await stock.apply_sale(db, outlet_id, [(r["invoice_id"], r["product_id"], r["quantity"]) for r in item_rows])
+    await shifts.record_invoices(db, outlet_id, [
+        (row["employee_id"], row["created_at"], sum((line["quantity"] for line in lines), Decimal("0")),
+         row["total_amount"])
+        for row, lines in zip(rows, items)
+    ])
+    return applied
+
+
+async def _apply_payments(
+    db: AsyncSession, outlet_id: int, terminal_id: str, payments, invoice_ids: dict, results: dict
+) -> None:
+    # resolve invoice_local_seq references not pushed in this batch from earlier syncs
+    missing = {p.invoice_local_seq for p in payments
+               if p.invoice_local_seq is not None and p.invoice_local_seq not in invoice_ids}
+    by_seq = {seq: inv_id for seq, (inv_id, _) in invoice_ids.items()}
+    if missing:
+        q = await db.execute(
+            select(TerminalSyncLog.local_seq, TerminalSyncLog.entity_id).where(
+                TerminalSyncLog.outlet_id == outlet_id,
+                TerminalSyncLog.terminal_id == terminal_id,
+                TerminalSyncLog.kind == "invoice",
+                TerminalSyncLog.local_seq.in_(missing),
+            )
+        )
+        by_seq.update({seq: inv_id for seq, inv_id in q.all() if inv_id is not None})
+
+    numbers = {p.invoice_number for p in payments if p.invoice_local_seq is None}
+    wanted_ids = {by_seq[p.invoice_local_seq] for p in payments if p.invoice_local_seq in by_seq}
+    conditions = []
+    if wanted_ids:
+        conditions.append(Invoice.id.in_(wanted_ids))
+    if numbers:
+        conditions.append(Invoice.invoice_number.in_(numbers))
+    found = {}
+    if conditions:
+        q = await db.execute(
+            select(
+                Invoice.id, Invoice.created_at, Invoice.invoice_number, Invoice.total_amount,
+                Invoice.employee_id, Invoice.status,
+            )
+            .where(Invoice.outlet_id == outlet_id, or_(*conditions))
+            .with_for_update()
+        )
+        found = {row.id: row for row in q.all()}
+    by_number = {row.invoice_number: row for row in found.values()}
+
+    rows, accepted, shift_rows = [], [], []
+    newly_paid = {row.id for row in found.values() if row.status != "paid"}
+    for p in payments:
+        if p.invoice_local_seq is not None:
+            invoice = found.get(by_seq.get(p.invoice_local_seq))
+        else:
+            invoice = by_number.get(p.invoice_number)
+        if invoice is None:
+            results[p.local_seq] = _result("payment", p.local_seq, "error", error="invoice not found")
+            continue
+        rows.append({
+            "invoice_id": invoice.id,
+            "invoice_created_at": invoice.created_at,
+            "paid_at": shifts.utc_naive(p.paid_at),
+            "amount": p.amount if p.amount is not None else invoice.total_amount,
+            "method": p.method,
+            "reference": p.reference or f"PAY-{invoice.invoice_number}",
+        })
+        accepted.append(p)
+        shift_rows.append((invoice.employee_id, invoice.created_at, p.method, rows[-1]["amount"],
+                           invoice.id in newly_paid))
+        newly_paid.discard(invoice.id)
+
+    if not rows:
+        return
+    stmt = insert(Payment).returning(Payment.id, sort_by_parameter_order=True)
+    ids = (await db.execute(stmt, rows)).scalars().all()
+    for p, payment_id in zip(accepted, ids):
+        results[p.local_seq] = _result("payment", p.local_seq, "applied", payment_id)
+    await db.execute(
+        update(Invoice)
+        .where(Invoice.id.in_({row["invoice_id"] for row in rows}))
+        .values(status="paid")
+        .execution_options(synchronize_session=False)
+    )
+    await shifts.record_payments(db, outlet_id, shift_rows)
+
+
+async def push_batch(db: AsyncSession, outlet_id: int, req) -> List[dict]:
+    """Apply one offline batch in a single transaction; returns one result per record, in request order."""
+    entries = [(inv.local_seq, "invoice") for inv in req.invoices] + [(p.local_seq, "payment") for p in req.payments]
+    if not entries:
+        return []
+    seqs = [seq for seq, _ in entries]
+    if len(set(seqs)) != len(seqs):
+        raise SyncError("local_seq values must be unique within a terminal")
+
+    results: Dict[int, dict] = {}
+    claimed = await _claim(db, outlet_id, req.terminal_id, entries)
+
+    duplicates = [seq for seq in seqs if seq not in claimed]
+    if duplicates:
+        q = await db.execute(
+            select(TerminalSyncLog.local_seq, TerminalSyncLog.kind, TerminalSyncLog.entity_id).where(
+                TerminalSyncLog.outlet_id == outlet_id,
+                TerminalSyncLog.terminal_id == req.terminal_id,
+                TerminalSyncLog.local_seq.in_(duplicates),
+            )
+        )
+        for seq, kind, entity_id in q.all():
+            results[seq] = _result(kind, seq, "duplicate", entity_id)
+
+    overrides: list = []
+    invoice_ids = await _apply_invoices(
+        db, outlet_id, [inv for inv in req.invoices if inv.local_seq in claimed], results, overrides
+    )
+    await _apply_payments(
+        db, outlet_id, req.terminal_id, [p for p in req.payments if p.local_seq in claimed], invoice_ids, results
+    )
+
+    # record server ids; drop the claim on failed records so the terminal can retry them
+    applied = [{"id": claimed[seq], "entity_id": r["id"]}
+               for seq, r in results.items() if seq in claimed and r["status"] == "applied"]
+    failed = [claimed[seq] for seq, r in results.items() if seq in claimed and r["status"] == "error"]
+    if applied:
+        await db.execute(update(TerminalSyncLog), applied)
+    if failed:
+        await db.execute(delete(TerminalSyncLog).where(TerminalSyncLog.id.in_(failed)))
+    await db.commit()
+
+    for invoice_id, actor, lines in overrides:
+        await audit_async("invoice.price_override", "invoice", invoice_id, actor=actor, payload={"lines": lines})
+
+    return [results[seq] for seq in seqs]
+
+
+# ---- catalog deltas ----
+
+_CATALOG = (
+    ("products", Product, ("id", "sku", "name", "category_id", "current_unit_price", "tax_slab_id", "is_active")),
+    ("tax_slabs", TaxSlab, ("id", "rate", "name")),
+    ("categories", Category, ("id", "name", "description")),
+)
+
+
+def encode_cursor(state: dict) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> dict:
+    """{"seq": N} once caught up, plus {"snapshot": {table: last id}} while a full download is paging."""
+    if not cursor:
+        return {}
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+        if not isinstance(state, dict):
+            raise ValueError(state)
+    except Exception:
+        raise SyncError("invalid cursor")
+    if "seq" not in state:
+        return {}  # a cursor from before the change log: start over with a full download
+    try:
+        return {
+            "seq": int(state["seq"]),
+            **({"snapshot": {k: int(v) for k, v in state["snapshot"].items()}} if "snapshot" in state else {}),
+        }
+    except Exception:
+        raise SyncError("invalid cursor")
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _rows(rows, fields) -> list:
+    return [
+        {**{f: _plain(getattr(row, f)) for f in fields},
+         "updated_at": row.updated_at.isoformat() if row.updated_at else None}
+        for row in rows
+    ]
+
+
+async def _snapshot(db: AsyncSession, outlet_id: int, state: dict, limit: int) -> dict:
+    """One page of every catalog row, by id; the cursor moves to the change log after the last page."""
+    marks = state.setdefault("snapshot", {})
+    out = {"has_more": False, "snapshot": True}
+    for key, model, fields in _CATALOG:
+        q = select(model).where(model.outlet_id == outlet_id, model.id > marks.get(key, 0))
+        rows = (await db.execute(q.order_by(model.id).limit(limit + 1))).scalars().all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            out["has_more"] = True
+        out[key] = _rows(rows, fields)
+        if rows:
+            marks[key] = rows[-1].id
+    if not out["has_more"]:
+        del state["snapshot"]
+    out["cursor"] = encode_cursor(state)
+    return out
+
+
+async def _log_page(db: AsyncSession, outlet_id: int, state: dict, limit: int) -> dict:
+    """Current state of the rows named by the next `limit` catalog_change entries after the cursor."""
+    q = await db.execute(
+        select(CatalogChange.seq, CatalogChange.entity, CatalogChange.entity_id)
+        .where(CatalogChange.outlet_id == outlet_id, CatalogChange.seq > state["seq"])
+        .order_by(CatalogChange.seq)
+        .limit(limit + 1)
+    )
+    changes = q.all()
+    out = {"has_more": len(changes) > limit, "snapshot": False, "deleted": {}}
+    changes = changes[:limit]
+    for key, model, fields in _CATALOG:
+        ids = {entity_id for _, entity, entity_id in changes if entity == key}
+        rows = []
+        if ids:
+            q = select(model).where(model.outlet_id == outlet_id, model.id.in_(ids)).order_by(model.id)
+            rows = (await db.execute(q)).scalars().all()
+        out[key] = _rows(rows, fields)
+        # changed, then gone by the time we looked: deleted
+        gone = sorted(ids - {row.id for row in rows})
+        if gone:
+            out["deleted"][key] = gone
+    if changes:
+        state["seq"] = changes[-1].seq
+    out["cursor"] = encode_cursor(state)
+    return out
+
+
+async def catalog_changes(db: AsyncSession, outlet_id: int, cursor: Optional[str], limit: int = 1000) -> dict:
+    """
+    The outlet's catalog rows changed since `cursor`, in commit order, as their current state;
+    without a cursor, a full download (`snapshot: true`) paged by id, `limit` rows per table.
+    """
+    state = decode_cursor(cursor)
+    if "seq" not in state:
+        # log position first: anything written while the download pages is replayed after it
+        last = await db.execute(
+            select(func.coalesce(func.max(CatalogChange.seq), 0)).where(CatalogChange.outlet_id == outlet_id)
+        )
+        state = {"seq": last.scalar_one(), "snapshot": {}}
+    if "snapshot" in state:
+        return await _snapshot(db, outlet_id, state, limit)
+    return await _log_page(db, outlet_id, state, limit)
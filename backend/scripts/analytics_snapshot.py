@@ -0,0 +1,42 @@
+# scripts/analytics_snapshot.py
+"""
+Run the analytics snapshot export outside the API process (e.g. from cron,
+with ANALYTICS_SNAPSHOT_INTERVAL=0 on the API workers). Reads from
+ANALYTICS_SOURCE_URL when set, else DATABASE_URL.
+
+Run from backend/ (same env as the API):
+
+    python -m scripts.analytics_snapshot            # export new invoice items
+    python -m scripts.analytics_snapshot --full     # rebuild from scratch
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from app.analytics import AnalyticsSnapshotter
+from app.core.config import settings
+from app.db.session import engine, outlet_router
+
+
+async def _run(args):
+    snapshotter = AnalyticsSnapshotter(0, settings.ANALYTICS_SOURCE_URL)
+    try:
+        # already its own process: export here rather than in another child
+        return await snapshotter.export(full=args.full)
+    finally:
+        await snapshotter.stop()
+        await outlet_router.dispose()
+        await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="discard existing segments and export everything")
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(_run(args))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+# scripts/bench_api.py
+"""
+Load test / benchmark for the billing API.
+
+Seeds tax slabs, a product catalog and employees, then runs a weighted mix of
+invoice creation (normal and item-heavy), payments and reads at a fixed
+concurrency. Reports throughput, p50/p95/p99 latency and SQL queries per
+request (from the X-Query-Count header, see app/db/query_log.py), and saves
+the run as JSON so runs can be compared across commits.
+
+    # in-process through httpx's ASGI transport (uses DATABASE_URL from the env)
+    python -m scripts.bench_api --concurrency 16 --requests 2000
+
+    # against a running server (start it with QUERY_LOG_ENABLED=true for query counts)
+    python -m scripts.bench_api --base-url http://127.0.0.1:8000 --duration 30
+
+    # compare two saved runs
+    python -m scripts.bench_api --compare bench_results/a.json bench_results/b.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+# op name -> default weight
+DEFAULT_MIX = {
+    "invoice_create": 40,
+    "invoice_create_heavy": 5,
+    "payment": 25,
+    "invoice_read": 20,
+    "product_read": 10,
+}
+TAX_RATES = ((0, "GST 0%"), (5, "GST 5%"), (18, "GST 18%"))
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+class Bench:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:8]
+        self.products = []    # (id, unit_price, tax_rate)
+        self.employees = []
+        self.unpaid = []      # invoice ids waiting for payment
+        self.invoices = []    # every invoice id created in this run
+        self.samples = {op: [] for op in DEFAULT_MIX}  # op -> [(seconds, status, queries)]
+        self._seq = 0
+
+    async def seed(self):
+        c = self.client
+        slabs = []
+        for rate, name in TAX_RATES:
+            r = await c.post("/tax_slabs/", json={"rate": rate, "name": name})
+            r.raise_for_status()
+            slabs.append((r.json()["id"], rate))
+        for i in range(self.args.products):
+            slab_id, rate = slabs[i % len(slabs)]
+            price = round(20 + (i * 37) % 480, 2)
+            r = await c.post("/products/", json={
+                "name": f"Bench Dish {self.run_id}-{i}", "sku": f"B{self.run_id}{i}",
+                "current_unit_price": price, "tax_slab_id": slab_id,
+            })
+            r.raise_for_status()
+            self.products.append((r.json()["id"], price, rate))
+        for i in range(self.args.employees):
+            r = await c.post("/employees/", json={
+                "full_name": f"Bench Waiter {i}", "employee_code": f"BW{self.run_id}{i}", "designation": "Waiter",
+            })
+            r.raise_for_status()
+            self.employees.append(r.json()["id"])
+
+    def _invoice_payload(self, rng: random.Random, n_items: int) -> dict:
+        self._seq += 1
+        items = []
+        for product_id, price, rate in rng.sample(self.products, min(n_items, len(self.products))):
+            items.append({
+                "product_id": product_id, "description": f"dish {product_id}",
+                "quantity": rng.randint(1, 4), "unit_price": price, "tax_rate": rate,
+            })
+        return {
+            "invoice_number": f"B{self.run_id}-{self._seq}",
+            "table_number": f"T{rng.randint(1, 40)}",
+            "order_type": "dine-in",
+            "employee_id": rng.choice(self.employees) if self.employees else None,
+            "items": items,
+        }
+
+    async def _request(self, op: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            r = await self.client.request(method, url, **kwargs)
+            status = r.status_code
+        except httpx.HTTPError:
+            r, status = None, 0
+        elapsed = time.perf_counter() - start
+        queries = r.headers.get("x-query-count") if r is not None else None
+        self.samples[op].append((elapsed, status, int(queries) if queries is not None else None))
+        return r
+
+    async def run_op(self, op: str, rng: random.Random):
+        if op in ("payment", "invoice_read") and not (self.unpaid if op == "payment" else self.invoices):
+            op = "invoice_create"  # nothing to pay / read yet
+        if op == "invoice_create":
+            payload = self._invoice_payload(rng, rng.randint(1, 4))
+        elif op == "invoice_create_heavy":
+            payload = self._invoice_payload(rng, rng.randint(20, 40))
+        if op.startswith("invoice_create"):
+            r = await self._request(op, "POST", "/invoices/", json=payload)
+            if r is not None and r.status_code == 200:
+                invoice_id = r.json()["id"]
+                self.invoices.append(invoice_id)
+                self.unpaid.append(invoice_id)
+        elif op == "payment":
+            invoice_id = self.unpaid.pop(rng.randrange(len(self.unpaid)))
+            await self._request(op, "POST", f"/payments/{invoice_id}/pay")
+        elif op == "invoice_read":
+            await self._request(op, "GET", f"/invoices/{rng.choice(self.invoices)}")
+        elif op == "product_read":
+            await self._request(op, "GET", f"/products/{rng.choice(self.products)[0]}")
+
+    async def run(self, mix: dict) -> float:
+        ops, weights = list(mix), list(mix.values())
+        deadline = time.perf_counter() + self.args.duration if self.args.duration else None
+        remaining = [self.args.requests]
+
+        async def worker(n: int):
+            rng = random.Random(self.args.seed * 1000 + n)
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                else:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                await self.run_op(rng.choices(ops, weights)[0], rng)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(self.args.concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, wall: float) -> dict:
+        ops = {}
+        total = 0
+        for op, samples in self.samples.items():
+            if not samples:
+                continue
+            latencies = sorted(s[0] for s in samples)
+            queries = [s[2] for s in samples if s[2] is not None]
+            errors = sum(1 for s in samples if not 200 <= s[1] < 300)
+            total += len(samples)
+            ops[op] = {
+                "requests": len(samples),
+                "errors": errors,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "mean_ms": sum(latencies) / len(latencies) * 1000,
+                "queries_per_request": (sum(queries) / len(queries)) if queries else None,
+            }
+        all_latencies = sorted(s[0] for samples in self.samples.values() for s in samples)
+        return {
+            "requests": total,
+            "seconds": wall,
+            "rps": total / wall if wall else 0.0,
+            "p50_ms": percentile(all_latencies, 50) * 1000,
+            "p95_ms": percentile(all_latencies, 95) * 1000,
+            "p99_ms": percentile(all_latencies, 99) * 1000,
+            "ops": ops,
+        }
+
+
+def print_report(result: dict):
+    s = result["summary"]
+    print(f"\n{result['commit']}  {result['target']}  concurrency={result['config']['concurrency']}")
+    print(f"{s['requests']} requests in {s['seconds']:.1f}s = {s['rps']:.1f} req/s  "
+          f"p50 {s['p50_ms']:.1f}ms  p95 {s['p95_ms']:.1f}ms  p99 {s['p99_ms']:.1f}ms")
+    print(f"{'op':<22}{'n':>7}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>8}")
+    for op, o in s["ops"].items():
+        q = f"{o['queries_per_request']:.1f}" if o["queries_per_request"] is not None else "-"
+        print(f"{op:<22}{o['requests']:>7}{o['errors']:>6}{o['p50_ms']:>9.1f}{o['p95_ms']:>9.1f}{o['p99_ms']:>9.1f}{q:>8}")
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as fh:
+        old = json.load(fh)
+    with open(new_path) as fh:
+        new = json.load(fh)
+
+    def delta(a, b):
+        if a is None or b is None or not a:
+            return "-"
+        return f"{(b - a) / a * 100:+.1f}%"
+
+    print(f"{old['commit']} -> {new['commit']}")
+    so, sn = old["summary"], new["summary"]
+    for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+        print(f"  {key:<8}{so[key]:>10.1f}{sn[key]:>10.1f}  {delta(so[key], sn[key])}")
+    for op in sn["ops"]:
+        if op not in so["ops"]:
+            continue
+        a, b = so["ops"][op], sn["ops"][op]
+        print(f"  {op:<22} p95 {a['p95_ms']:.1f} -> {b['p95_ms']:.1f} ({delta(a['p95_ms'], b['p95_ms'])})  "
+              f"q/req {a['queries_per_request']} -> {b['queries_per_request']}")
+
+
+def parse_mix(value: str) -> dict:
+    mix = dict(DEFAULT_MIX)
+    if value:
+        for part in value.split(","):
+            op, weight = part.split("=")
+            if op not in DEFAULT_MIX:
+                raise SystemExit(f"unknown op {op!r}, expected one of {', '.join(DEFAULT_MIX)}")
+            mix[op] = float(weight)
+    return {op: w for op, w in mix.items() if w > 0}
+
+
+async def main(args):
+    mix = parse_mix(args.mix)
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        target, app = args.base_url, None
+    else:
+        # import late so env tweaks (QUERY_LOG_ENABLED) apply to the app's settings
+        os.environ.setdefault("QUERY_LOG_ENABLED", "true")
+        from app.main import app
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout)
+        target = "in-process"
+
+    try:
+        async with client:
+            bench = Bench(client, args)
+            await bench.seed()
+            wall = await bench.run(mix)
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+
+    result = {
+        "commit": git_commit(),
+        "label": args.label,
+        "started_at": datetime.utcnow().isoformat(),
+        "target": target,
+        "config": {
+            "concurrency": args.concurrency, "requests": args.requests, "duration": args.duration,
+            "products": args.products, "employees": args.employees, "seed": args.seed, "mix": mix,
+        },
+        "summary": bench.report(wall),
+    }
+    print_report(result)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{result['commit']}{'-' + args.label if args.label else ''}.json"
+    path = os.path.join(args.output_dir, name)
+    with open(path, "w") as fh:
+        json.dump(result, fh, indent=2)
+    print(f"\nsaved {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="run for N seconds instead")
+    parser.add_argument("--products", type=int, default=60)
+    parser.add_argument("--employees", type=int, default=10)
+    parser.add_argument("--mix", default="", help="override weights, e.g. payment=10,invoice_create_heavy=0")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output-dir", default="bench_results")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+    asyncio.run(main(args))
@@ -0,0 +1,103 @@
+# scripts/partitions.py
+"""
+Partition maintenance / archive tool for the invoice tables.
+
+Run from backend/ (same env as the API, INVOICE_PARTITIONING=true):
+
+    python -m scripts.partitions create [--months-ahead 3]
+    python -m scripts.partitions archive [--retain-months 12] [--archive-dir archive] [--dry-run]
+    python -m scripts.partitions query archive/invoice_p202401.csv.gz --where table_number=T4 --since 2024-01-10
+    python -m scripts.partitions restore archive/invoice_p202401.csv.gz [--attach]
+
+`create`, `archive` and `restore` take --outlet N to work on the database /
+schema that outlet is routed to (default: DATABASE_URL); a routed target is
+archived under <archive-dir>/<target name>/. An existing archive of a month is
+never overwritten.
+`create` and `archive` are safe to run from cron (e.g. nightly).
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from app.core.config import settings
+from app.db import partitions
+
+
+def _target(args):
+    from app.db.outlets import DEFAULT_TARGET, target_for
+    return target_for(args.outlet) if args.outlet else DEFAULT_TARGET
+
+
+def _begin(args):
+    from app.db.session import outlet_router
+    return outlet_router.begin(_target(args))
+
+
+async def _create(args):
+    async with _begin(args) as conn:
+        created = await partitions.ensure_partitions(conn, args.months_ahead)
+    print("created:", ", ".join(created) if created else "nothing (all partitions exist)")
+
+
+async def _archive(args):
+    async with _begin(args) as conn:
+        months = await partitions.archive_old_partitions(
+            conn, args.retain_months, partitions.target_archive_dir(args.archive_dir, _target(args)),
+            dry_run=args.dry_run,
+        )
+    verb = "would archive" if args.dry_run else "archived"
+    print(f"{verb}:", ", ".join(f"{m:%Y-%m}" for m in months) if months else "nothing")
+
+
+async def _restore(args):
+    async with _begin(args) as conn:
+        table = await partitions.restore_archive(conn, args.file, attach=args.attach)
+    print("restored into", table)
+
+
+def _query(args):
+    where = dict(kv.split("=", 1) for kv in args.where)
+    for n, row in enumerate(partitions.query_archive(args.file, where, args.since, args.until)):
+        if args.limit and n >= args.limit:
+            break
+        print(json.dumps(row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outlet", type=int, help="work on the database this outlet is routed to")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("create", help="create current + future monthly partitions")
+    p.add_argument("--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD)
+
+    p = sub.add_parser("archive", help="export + detach partitions older than --retain-months")
+    p.add_argument("--retain-months", type=int, default=settings.PARTITION_RETAIN_MONTHS)
+    p.add_argument("--archive-dir", default=settings.ARCHIVE_DIR)
+    p.add_argument("--dry-run", action="store_true")
+
+    p = sub.add_parser("query", help="scan an archive file (no database needed)")
+    p.add_argument("file")
+    p.add_argument("--where", action="append", default=[], metavar="COLUMN=VALUE")
+    p.add_argument("--since", help="partition key >= this ISO timestamp")
+    p.add_argument("--until", help="partition key < this ISO timestamp")
+    p.add_argument("--limit", type=int, default=0)
+
+    p = sub.add_parser("restore", help="load an archive file back into Postgres")
+    p.add_argument("file")
+    p.add_argument("--attach", action="store_true", help="re-attach as a live partition")
+
+    args = parser.parse_args(argv)
+    if args.command == "query":
+        _query(args)
+        return 0
+    if not settings.INVOICE_PARTITIONING:
+        print("INVOICE_PARTITIONING is not enabled", file=sys.stderr)
+        return 1
+    asyncio.run({"create": _create, "archive": _archive, "restore": _restore}[args.command](args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# tests/conftest.py
+"""
+Shared fixtures. Settings are read once at import, so the environment is set
+here before anything from `app` is imported: a throwaway SQLite database
+(plus a second one outlet 900 is routed to), strict query budgets, and no
+background jobs.
+
+Tests are isolated by outlet rather than by database: the `outlet` fixture
+hands every test a fresh outlet id, and `headers` sends it as X-Outlet-Id.
+"""
+import itertools
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+TMP = tempfile.mkdtemp(prefix="pos-tests-")
+ROUTED_OUTLET = 900
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{TMP}/pos.db",
+    "OUTLET_DATABASE_URLS": f"{ROUTED_OUTLET}=sqlite+aiosqlite:///{TMP}/outlet{ROUTED_OUTLET}.db",
+    "QUERY_LOG_ENABLED": "true",
+    "QUERY_BUDGET_STRICT": "true",
+    "ANALYTICS_DIR": os.path.join(TMP, "analytics"),
+    "ANALYTICS_SNAPSHOT_INTERVAL": "0",
+    "STOCK_RECONCILE_INTERVAL": "0",
+    "RECEIPT_PDF_WORKERS": "0",
+    "ARCHIVE_DIR": os.path.join(TMP, "archive"),
+    "AUDIT_SPILL_DIR": os.path.join(TMP, "audit_spill"),
+    "AUDIT_FLUSH_INTERVAL": "0.05",
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+_outlets = itertools.count(100)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def run(client):
+    """Run an async function on the app's event loop (where the engines' connections live)."""
+    def call(fn, *args, **kwargs):
+        return client.portal.call(lambda: fn(*args, **kwargs))
+    return call
+
+
+@pytest.fixture
+def outlet():
+    return next(_outlets)
+
+
+@pytest.fixture
+def headers(outlet):
+    return {"X-Outlet-Id": str(outlet)}
+
+
+def seed_catalog(client, headers, price=100, track_stock=False):
+    """A tax slab, one product and one employee in the outlet of `headers`."""
+    slab = client.post("/tax_slabs/", json={"rate": 5, "name": "GST 5%"}, headers=headers).json()
+    product = client.post(
+        "/products/",
+        json={"name": "Masala Dosa", "sku": "DOSA", "current_unit_price": price, "tax_slab_id": slab["id"]},
+        headers=headers,
+    ).json()
+    employee = client.post("/employees/", json={"full_name": "Asha", "employee_code": "E1"}, headers=headers).json()
+    if track_stock:
+        client.put(f"/products/{product['id']}/stock/settings", json={"track_stock": True, "shards": 0}, headers=headers)
+    return SimpleNamespace(tax_slab_id=slab["id"], product_id=product["id"], employee_id=employee["id"])
+
+
+@pytest.fixture
+def catalog(client, headers):
+    return seed_catalog(client, headers)
+
+
+def item(product_id, quantity=1, unit_price=100, tax_rate=0, description="Masala Dosa"):
+    return {
+        "product_id": product_id, "description": description,
+        "quantity": quantity, "unit_price": unit_price, "tax_rate": tax_rate,
+    }
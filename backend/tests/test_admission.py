@@ -0,0 +1,86 @@
+# tests/test_admission.py
+import asyncio
+
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route, Router
+
+from app import admission
+from app.admission import QUEUE_FULL, TIMEOUT, AdmissionMiddleware, Limiter
+from conftest import ROUTED_OUTLET
+
+
+def test_limiter_queues_then_refuses():
+    async def scenario():
+        limiter = Limiter("test-queue", 1, max_queue=1)
+        assert await limiter.acquire() is None
+        waiting = asyncio.ensure_future(limiter.acquire(timeout=1))
+        await asyncio.sleep(0)
+        assert await limiter.acquire(timeout=1) == QUEUE_FULL
+        limiter.release()
+        assert await waiting is None
+        assert await limiter.acquire(timeout=0.01) == TIMEOUT
+        limiter.release()
+        assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_priority_requests_use_reserved_slots_and_go_first():
+    async def scenario():
+        limiter = Limiter("test-priority", 2, max_queue=4, reserved=1)
+        assert await limiter.acquire() is None
+        assert await limiter.acquire(timeout=0.01) == TIMEOUT
+        assert await limiter.acquire(priority=True) is None
+        normal = asyncio.ensure_future(limiter.acquire(timeout=1))
+        priority = asyncio.ensure_future(limiter.acquire(priority=True, timeout=1))
+        await asyncio.sleep(0)
+        limiter.release()
+        assert await priority is None
+        assert not normal.done()
+        normal.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_route_limiter_and_db_gate_share_one_deadline(monkeypatch):
+    """Waiting 0.15s at each of two limiters must not fit in a 0.25s timeout."""
+    monkeypatch.setattr(admission.settings, "ADMISSION_QUEUE_TIMEOUT", 0.25)
+    path = "/test-admission-deadline"
+    admission.admission_limit("GET", path, 1, queue=1)
+    route_limiter = admission.limiters[f"GET {path}"]
+    gate = admission.db_gate_for(ROUTED_OUTLET)
+
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    middleware = AdmissionMiddleware(Router(routes=[Route(path, ok)]), Router(routes=[Route(path, ok)]))
+
+    async def scenario():
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "method": "GET", "path": path, "query_string": b"", "root_path": "",
+            "headers": [(b"x-outlet-id", str(ROUTED_OUTLET).encode())],
+        }
+        await route_limiter.acquire()
+        for _ in range(gate.limit):
+            assert await gate.acquire() is None
+
+        async def release_later(limiter, delay, count=1):
+            await asyncio.sleep(delay)
+            for _ in range(count):
+                limiter.release()
+
+        releases = asyncio.gather(release_later(route_limiter, 0.15), release_later(gate, 0.3, gate.limit))
+        await middleware(scope, receive, send)
+        await releases
+        return sent[0]["status"]
+
+    assert asyncio.run(scenario()) == 503
+    assert (route_limiter.in_flight, gate.in_flight) == (0, 0)
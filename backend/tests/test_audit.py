@@ -0,0 +1,116 @@
+# tests/test_audit.py
+import asyncio
+import json
+
+from sqlalchemy import select
+
+from app.audit import AuditWriter, audit_writer, decode_payload, encode_payload
+from app.db.models import AuditLog
+from app.db.session import AsyncSessionLocal
+from conftest import item
+
+
+class _DatabaseDown:
+    async def __aenter__(self):
+        raise ConnectionError("database is down")
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _writer(tmp_path, session_factory=AsyncSessionLocal, **kwargs):
+    options = {"max_queue": 10, "batch_size": 10, "flush_interval": 0.01, "put_timeout": 0.01, "retries": 1}
+    options.update(kwargs)
+    return AuditWriter(session_factory, spill_dir=str(tmp_path), **options)
+
+
+async def _actions(action: str, entity_id=None) -> list:
+    stmt = select(AuditLog).where(AuditLog.action == action).order_by(AuditLog.id)
+    if entity_id is not None:
+        stmt = stmt.where(AuditLog.entity_id == str(entity_id))
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(stmt)).scalars().all()
+
+
+async def _wait_for(action: str, count: int = 1, entity_id=None) -> list:
+    """Rows for `action` (of one entity, if given); other tests' rows share the table."""
+    for _ in range(100):
+        rows = await _actions(action, entity_id)
+        if len(rows) >= count:
+            return rows
+        await asyncio.sleep(0.02)
+    return await _actions(action, entity_id)
+
+
+def test_full_queue_spills_instead_of_dropping(tmp_path, run):
+    writer = _writer(tmp_path, max_queue=1)
+    assert writer.emit("test.queued") is True
+    assert writer.emit("test.full") is False
+    assert run(writer.emit_wait, "test.full_wait") is False
+    assert (writer.spilled, writer.dropped) == (2, 0)
+
+    assert run(writer.replay_spill) == 2
+    assert [row.action for row in run(_actions, "test.full")] == ["test.full"]
+    assert len(run(_actions, "test.full_wait")) == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_flush_is_retried_then_spilled_and_replayed(tmp_path, run):
+    writer = _writer(tmp_path, session_factory=lambda: _DatabaseDown())
+    batch = [writer._event("test.outage", "invoice", 7, None, {"amount": 12.5})]
+    assert run(writer.flush, batch) is False
+    assert (writer.failed, writer.spilled) == (1, 1)
+
+    # the database is back: the next successful flush replays the spill file too
+    writer.session_factory = AsyncSessionLocal
+    assert run(writer.flush, [writer._event("test.recovered", None, None, None, None)]) is True
+    assert writer.replayed == 1
+    (row,) = run(_actions, "test.outage")
+    assert row.entity_id == "7"
+    assert decode_payload(row.payload) == {"amount": 12.5}
+
+
+def test_event_the_database_rejects_does_not_block_the_batch(tmp_path, run):
+    writer = _writer(tmp_path)
+    # actor_id references user_account: an unknown actor fails the multi-row INSERT
+    batch = [
+        writer._event("test.poison", None, None, 987654321, None),
+        writer._event("test.ok", None, None, None, None),
+    ]
+    assert run(writer.flush, batch) is False
+    assert writer.failed == 2
+
+    assert run(writer.replay_spill) == 1
+    assert len(run(_actions, "test.ok")) == 1
+    assert run(_actions, "test.poison") == []
+    assert [p.suffix for p in tmp_path.iterdir()] == [".rejected"]
+
+
+def test_spill_is_replayed_on_start(tmp_path, run):
+    _writer(tmp_path).spill([AuditWriter._event("test.left_over", None, None, None, None)])
+    writer = _writer(tmp_path)
+    run(writer.start)
+    run(writer.stop)
+    assert len(run(_actions, "test.left_over")) == 1
+
+
+def test_price_changes_are_audited(client, headers, catalog, run):
+    slab = client.post("/tax_slabs/", json={"rate": 12, "name": "GST 12%"}, headers=headers).json()
+    invoice = client.post("/invoices/", headers=headers, json={
+        "invoice_number": "AUD-1", "employee_id": catalog.employee_id,
+        "items": [item(catalog.product_id, unit_price=80), item(catalog.product_id)],
+    }).json()
+
+    assert run(_wait_for, "tax_slab.rate_set", entity_id=slab["id"])
+    (override,) = run(_wait_for, "invoice.price_override", entity_id=invoice["id"])
+    (line,) = decode_payload(override.payload)["lines"]
+    assert (line["product_id"], float(line["list_price"]), float(line["unit_price"])) == (catalog.product_id, 100, 80)
+    assert audit_writer.dropped == 0
+
+
+def test_decode_payload_reads_msgpack_and_old_json_rows():
+    payload = {"invoice_id": 7, "amount": "12.50", "lines": [1, 2]}
+    assert decode_payload(encode_payload(payload)) == payload
+    assert decode_payload(json.dumps(payload).encode()) == payload  # text column converted to bytea
+    assert decode_payload(json.dumps(payload)) == payload
+    assert decode_payload(None) is None
@@ -0,0 +1,57 @@
+# tests/test_bench.py
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from scripts import bench_api
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert bench_api.percentile(values, 50) == 50
+    assert bench_api.percentile(values, 99) == 99
+    assert bench_api.percentile([7.0], 95) == 7
+    assert bench_api.percentile([], 95) == 0.0
+
+
+def test_parse_mix_overrides_and_drops_zero_weights():
+    mix = bench_api.parse_mix("payment=10,invoice_create_heavy=0")
+    assert mix["payment"] == 10
+    assert "invoice_create_heavy" not in mix
+    assert mix["invoice_create"] == bench_api.DEFAULT_MIX["invoice_create"]
+    with pytest.raises(SystemExit):
+        bench_api.parse_mix("refund=5")
+
+
+def test_compare_prints_relative_change(tmp_path, capsys):
+    def run(commit, p95):
+        summary = {"rps": 100.0, "p50_ms": 5.0, "p95_ms": p95, "p99_ms": 30.0,
+                   "ops": {"payment": {"p95_ms": p95, "queries_per_request": 9.0}}}
+        path = tmp_path / f"{commit}.json"
+        path.write_text(json.dumps({"commit": commit, "summary": summary}))
+        return str(path)
+
+    bench_api.compare(run("aaa", 20.0), run("bbb", 15.0))
+    out = capsys.readouterr().out
+    assert "aaa -> bbb" in out
+    assert "p95_ms        20.0      15.0  -25.0%" in out
+
+
+def test_bench_runs_the_mix_against_the_app(client, run):
+    args = SimpleNamespace(products=5, employees=2, requests=40, duration=0, concurrency=4, seed=3)
+
+    async def bench():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            b = bench_api.Bench(http, args)
+            await b.seed()
+            return b.report(await b.run(bench_api.DEFAULT_MIX))
+
+    report = run(bench)
+    assert report["requests"] == 40
+    for op, stats in report["ops"].items():
+        assert stats["errors"] == 0, op
+        # X-Query-Count is read back from every response
+        assert stats["queries_per_request"] >= 1, op
@@ -0,0 +1,75 @@
+# tests/test_dialect.py
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, select, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app.core.config import async_database_url
+from app.db import dialect
+from app.db.session import sqlite_memory, make_engine
+
+counters = Table(
+    "test_counter", MetaData(),
+    Column("name", String(20), primary_key=True),
+    Column("hits", Integer, nullable=False),
+)
+
+
+def _bind(d):
+    return SimpleNamespace(dialect=d)
+
+
+def test_database_urls_get_async_drivers():
+    assert async_database_url("postgres://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert async_database_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert async_database_url("sqlite:///./x.db") == "sqlite+aiosqlite:///./x.db"
+    assert async_database_url("postgresql+asyncpg://h/db") == "postgresql+asyncpg://h/db"
+
+
+def testsqlite_memory_urls():
+    assert sqlite_memory("sqlite+aiosqlite://")
+    assert sqlite_memory("sqlite+aiosqlite:///:memory:")
+    assert sqlite_memory("sqlite+aiosqlite:///file:x?mode=memory&cache=shared")
+    assert not sqlite_memory("sqlite+aiosqlite:///./hotel_billing.db")
+    assert not sqlite_memory("postgresql+asyncpg://")
+
+
+def test_upsert_compiles_for_both_backends():
+    for d in (postgresql.dialect(), sqlite.dialect()):
+        stmt = dialect.upsert_insert(_bind(d), counters).values(name="a", hits=1)
+        stmt = stmt.on_conflict_do_update(index_elements=["name"], set_={"hits": counters.c.hits + stmt.excluded.hits})
+        sql = str(stmt.compile(dialect=d))
+        assert "ON CONFLICT (name) DO UPDATE SET hits = (test_counter.hits + excluded.hits)" in sql
+    with pytest.raises(NotImplementedError):
+        dialect.upsert_insert(_bind(mysql.dialect()), counters)
+
+
+def test_for_update_is_dropped_on_sqlite():
+    stmt = select(counters).with_for_update()
+    assert "FOR UPDATE" in str(stmt.compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE" not in str(stmt.compile(dialect=sqlite.dialect()))
+
+
+def test_upsert_on_sqlite_engine(run):
+    async def go():
+        engine = make_engine("sqlite+aiosqlite://", "test-dialect")
+        try:
+            async with engine.begin() as conn:
+                assert dialect.is_sqlite(conn)
+                assert (await conn.execute(text("PRAGMA foreign_keys"))).scalar() == 1
+                await conn.run_sync(counters.metadata.create_all)
+                for _ in range(3):
+                    stmt = dialect.upsert_insert(conn, counters).values(name="a", hits=1)
+                    await conn.execute(stmt.on_conflict_do_update(
+                        index_elements=["name"], set_={"hits": counters.c.hits + stmt.excluded["hits"]}
+                    ))
+                await conn.execute(
+                    dialect.upsert_insert(conn, counters).values(name="a", hits=100).on_conflict_do_nothing()
+                )
+                return (await conn.execute(select(counters.c.hits))).scalar_one(), engine.pool.size()
+        finally:
+            await engine.dispose()
+
+    # one pooled connection: SQLite writers queue for it rather than fail with "database is locked"
+    assert run(go) == (3, 1)
@@ -0,0 +1,56 @@
+# tests/test_metrics.py
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import metrics
+from scripts import bench_metrics
+from conftest import item
+
+
+def _sql_observations() -> int:
+    return sum(counts[-1] + sum(counts[:-1]) for counts in metrics.sql_latency.counts.values())
+
+
+def test_failed_statements_are_timed_and_leave_no_state():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine, "test-failures")
+    before = _sql_observations()
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+        assert not any(key for key in conn.info if "start" in key)
+    assert _sql_observations() - before == 4
+    engine.dispose()
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = metrics.Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(("/x",), value)
+    lines = hist.collect()
+    assert 't_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{route="/x",le="1.0"} 3' in lines
+    assert 't_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 't_seconds_count{route="/x"} 4' in lines
+
+
+def test_requests_are_labelled_by_route_template(client, headers, catalog):
+    body = {"invoice_number": "MET-1", "employee_id": catalog.employee_id, "items": [item(catalog.product_id)]}
+    invoice_id = client.post("/invoices/", json=body, headers=headers).json()["id"]
+    assert client.post("/invoices/", json=body, headers=headers).status_code == 409
+    client.get(f"/invoices/{invoice_id}", headers=headers)
+
+    text_ = client.get("/metrics").text
+    assert 'pos_http_requests_total{method="POST",route="/invoices/",status="409"}' in text_
+    assert 'route="/invoices/{invoice_id}"' in text_
+    assert f"/invoices/{invoice_id}\"" not in text_
+    assert 'pos_sql_queries_total{route="/invoices/"}' in text_
+
+
+def test_bench_sql_hook_cost_runs_the_hooks():
+    before = _sql_observations()
+    assert bench_metrics._sql_hook_cost(50) > 0
+    assert _sql_observations() - before == 50
@@ -0,0 +1,104 @@
+# tests/test_outlets.py
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect
+
+from app.auth import hash_password
+from app.db import models, partitions
+from app.db.outlets import DEFAULT_TARGET, Target, parse_outlet_map, target_for
+from app.db.session import AsyncSessionLocal, outlet_router
+from conftest import ROUTED_OUTLET, item, seed_catalog
+
+
+async def _user(email):
+    async with AsyncSessionLocal() as db:
+        role = models.Role(name=f"cashier-{email}")
+        db.add(role)
+        await db.flush()
+        user = models.UserAccount(email=email, password_hash=hash_password("x"), role_id=role.id)
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+async def _tables(target):
+    async with outlet_router.engine(target).connect() as conn:
+        return set(await conn.run_sync(lambda sync: inspect(sync).get_table_names()))
+
+
+def test_parse_outlet_map():
+    assert parse_outlet_map(" 7=a, 9=b ,") == {7: "a", 9: "b"}
+    with pytest.raises(ValueError):
+        parse_outlet_map("7")
+
+
+def test_ids_from_another_outlet_are_not_found(client, headers, catalog, outlet):
+    other = {"X-Outlet-Id": str(outlet + 1000)}
+    assert client.get(f"/products/{catalog.product_id}", headers=headers).status_code == 200
+    assert client.get(f"/products/{catalog.product_id}", headers=other).status_code == 404
+
+
+def test_foreign_catalog_ids_are_rejected(client, headers, catalog, outlet):
+    other = {"X-Outlet-Id": str(outlet + 1000)}
+    response = client.post("/products/", headers=other, json={
+        "name": "Idli", "sku": "IDLI", "current_unit_price": 40, "tax_slab_id": catalog.tax_slab_id,
+    })
+    assert response.status_code == 422, response.text
+
+    response = client.post("/invoices/", headers=other, json={
+        "invoice_number": "OUT-1", "items": [item(catalog.product_id)],
+    })
+    assert response.status_code == 422, response.text
+
+    own = seed_catalog(client, other)
+    response = client.post("/invoices/", headers=other, json={
+        "invoice_number": "OUT-1", "employee_id": catalog.employee_id, "items": [item(own.product_id)],
+    })
+    assert response.status_code == 422, response.text
+    assert "employee_id" in response.json()["detail"]
+
+    now = datetime.utcnow().isoformat()
+    response = client.post("/sync/push", headers=other, json={"terminal_id": "T1", "invoices": [
+        {"local_seq": 1, "invoice_number": "OUT-2", "created_at": now, "items": [item(catalog.product_id)]},
+        {"local_seq": 2, "invoice_number": "OUT-3", "created_at": now, "items": [item(own.product_id)],
+         "employee_id": own.employee_id},
+        {"local_seq": 3, "invoice_number": "OUT-4", "created_at": now, "items": [item(own.product_id)],
+         "employee_id": catalog.employee_id},
+    ]})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["error", "applied", "error"]
+    assert "employee_id" in results[2]["error"]
+
+
+def test_routed_outlet_bills_reference_central_users(client, run):
+    routed = {"X-Outlet-Id": str(ROUTED_OUTLET)}
+    user_id = run(_user, "routed-cashier@example.com")
+    catalog = seed_catalog(client, routed)
+    response = client.post("/invoices/", headers=routed, json={
+        "invoice_number": "R-1", "created_by": str(user_id), "employee_id": catalog.employee_id,
+        "items": [item(catalog.product_id)],
+    })
+    assert response.status_code == 200, response.text
+
+    tables = run(_tables, target_for(ROUTED_OUTLET))
+    assert "invoice" in tables
+    assert not tables & {t.name for t in models.GLOBAL_TABLES}
+    assert {t.name for t in models.GLOBAL_TABLES} <= run(_tables, DEFAULT_TARGET)
+
+
+def test_archives_are_kept_per_target_and_never_overwritten(tmp_path, run):
+    base = str(tmp_path)
+    a = partitions.target_archive_dir(base, Target("postgresql://db2/pos", "outlet_7"))
+    b = partitions.target_archive_dir(base, Target("postgresql://db2/pos", "outlet_9"))
+    assert partitions.target_archive_dir(base) == base
+    assert len({a, b, base}) == 3
+
+    month = datetime(2024, 1, 1)
+    existing = partitions.archive_path(a, partitions.partition_name("invoice", month))
+    (tmp_path / "db2-pos-outlet_7").mkdir()
+    open(existing, "w").close()
+    with pytest.raises(FileExistsError):
+        # refused before the connection is touched
+        run(partitions.archive_month, None, month, a)
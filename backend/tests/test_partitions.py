@@ -0,0 +1,63 @@
+# tests/test_partitions.py
+import csv
+import gzip
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.db import partitions
+from conftest import item
+from app.db.models import Invoice
+
+
+def test_month_arithmetic():
+    assert partitions.add_months(datetime(2026, 11, 1), 2) == datetime(2027, 1, 1)
+    assert partitions.add_months(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+    assert partitions.month_start(datetime(2026, 10, 19, 13, 5)) == datetime(2026, 10, 1)
+
+
+def test_partition_names_round_trip():
+    name = partitions.partition_name("invoice_item", datetime(2026, 3, 1))
+    assert name == "invoice_item_p202603"
+    assert partitions.parse_partition_name(name) == ("invoice_item", datetime(2026, 3, 1))
+    assert partitions.parse_partition_name("invoice_default") is None
+    assert partitions.parse_partition_name("payment_p202603") is None
+
+
+def test_query_archive_filters(tmp_path):
+    path = tmp_path / "invoice_p202601.csv.gz"
+    with gzip.open(path, "wt", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=["id", "table_number", "created_at"])
+        writer.writeheader()
+        writer.writerow({"id": 1, "table_number": "T4", "created_at": "2026-01-05 10:00:00"})
+        writer.writerow({"id": 2, "table_number": "T4", "created_at": "2026-01-20 10:00:00"})
+        writer.writerow({"id": 3, "table_number": "T1", "created_at": "2026-01-21 10:00:00"})
+
+    rows = partitions.query_archive(str(path), {"table_number": "T4"}, since="2026-01-10")
+    assert [r["id"] for r in rows] == ["2"]
+
+
+def _sql(clause) -> str:
+    return str(select(Invoice.id).where(clause).compile(dialect=postgresql.dialect()))
+
+
+def test_invoice_ids_clause_plain_table():
+    assert "invoice_key" not in _sql(partitions.invoice_ids_clause([1, 2]))
+
+
+def test_invoice_ids_clause_pins_partition_key(monkeypatch):
+    monkeypatch.setattr(partitions, "PARTITIONED", True)
+    sql = _sql(partitions.invoice_ids_clause([1, 2]))
+    # one scalar subquery per id, so Postgres can prune at executor startup
+    assert sql.count("SELECT invoice_key.created_at") == 2
+    assert "invoice.created_at = (SELECT" in sql
+
+
+def test_get_invoice_by_id(client, headers, catalog):
+    created = client.post(
+        "/invoices/", json={"invoice_number": "P-1", "items": [item(catalog.product_id)]}, headers=headers
+    ).json()
+    r = client.get(f"/invoices/{created['id']}", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["invoice_number"] == "P-1"
@@ -0,0 +1,102 @@
+# tests/test_query_log.py
+"""
+The suite runs with QUERY_BUDGET_STRICT=true, so every request a test makes is
+held to its route's budget; these tests check the mechanism itself.
+"""
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.db import query_log
+from conftest import item
+
+
+def test_normalize_reduces_statements_to_their_shape():
+    a = "SELECT * FROM invoice WHERE id IN (1, 2, 3) AND notes = 'no onion'"
+    b = "SELECT *  FROM invoice\n WHERE id IN (7) AND notes = 'x'"
+    assert query_log.normalize(a) == query_log.normalize(b) == "SELECT * FROM invoice WHERE id IN (...) AND notes = ?"
+    assert query_log.normalize("INSERT INTO t VALUES (1, 'a'), (2, 'b')") == "INSERT INTO t VALUES (?, ?), ..."
+
+
+def test_redact_keeps_only_types():
+    assert query_log.redact({"notes": "no onion", "id": 4}) == "{notes: str, id: int}"
+    assert query_log.redact([(1,), (2,)]) == "<2 parameter sets>"
+
+
+def test_repeated_statements_are_reported():
+    log = query_log.QueryLog()
+    log.statements = [(f"SELECT * FROM product WHERE id = {i}", 0.0) for i in range(6)]
+    assert log.repeated(5) == [("SELECT * FROM product WHERE id = ?", 6)]
+
+
+def test_failed_statements_are_recorded():
+    engine = create_engine("sqlite://")
+    query_log.instrument_engine(engine)
+    with query_log.record_queries() as log, engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        conn.execute(text("SELECT 1"))
+    assert [s for s, _ in log.statements] == ["SELECT * FROM no_such_table", "SELECT 1"]
+    engine.dispose()
+
+
+def test_responses_carry_the_query_count(client, headers, catalog):
+    response = client.get(f"/products/{catalog.product_id}", headers=headers)
+    assert int(response.headers["x-query-count"]) >= 1
+
+
+def test_over_budget_request_fails_before_the_response_is_sent(client, headers, catalog, monkeypatch):
+    invoice = client.post("/invoices/", headers=headers, json={
+        "invoice_number": "QB-1", "employee_id": catalog.employee_id, "items": [item(catalog.product_id)],
+    }).json()
+    monkeypatch.setitem(query_log._budgets, "/invoices/{invoice_id}", 1)
+    with pytest.raises(query_log.QueryBudgetExceeded, match=r"/invoices/\{invoice_id\} ran \d+ SQL statements"):
+        client.get(f"/invoices/{invoice['id']}", headers=headers)
+
+
+def test_budget_is_checked_before_anything_is_sent(run, monkeypatch):
+    monkeypatch.setitem(query_log._budgets, "/budgeted", 1)
+    sent = []
+
+    async def app(scope, receive, send):
+        scope["route"] = type("Route", (), {"path": "/budgeted"})()
+        query_log._current.get().statements += [("SELECT 1", 0.0), ("SELECT 2", 0.0)]
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def send(message):
+        sent.append(message)
+
+    with pytest.raises(query_log.QueryBudgetExceeded):
+        run(query_log.QueryLogMiddleware(app), {"type": "http"}, None, send)
+    assert sent == []
+
+
+def test_over_budget_request_only_logs_when_not_strict(client, headers, catalog, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "QUERY_BUDGET_STRICT", False)
+    monkeypatch.setitem(query_log._budgets, "/products/{product_id}", 0)
+    with caplog.at_level(logging.ERROR, logger="app.sql"):
+        response = client.get(f"/products/{catalog.product_id}", headers=headers)
+    assert response.status_code == 200
+    assert "budget is 0" in caplog.text
+
+
+def test_declared_budgets_hold_for_the_billing_flow(client, headers, catalog):
+    invoice = client.post("/invoices/", headers=headers, json={
+        "invoice_number": "QB-2", "employee_id": catalog.employee_id,
+        "items": [item(catalog.product_id) for _ in range(20)],
+    }).json()
+    for method, path in [
+        ("GET", f"/invoices/{invoice['id']}"),
+        ("GET", f"/invoices/{invoice['id']}/receipt"),
+        ("POST", f"/payments/{invoice['id']}/pay"),
+        ("GET", "/invoices/search"),
+        ("GET", f"/employees/{catalog.employee_id}/performance"),
+        ("GET", "/reports/shifts"),
+    ]:
+        response = client.request(method, path, headers=headers)
+        assert response.status_code == 200, (path, response.text)
+    assert set(query_log._budgets) >= {"/invoices/", "/invoices/{invoice_id}", "/payments/{invoice_id}/pay"}
@@ -0,0 +1,90 @@
+# tests/test_receipts.py
+import base64
+
+from sqlalchemy import update
+
+from app import receipts
+from app.db.models import Invoice
+from app.db.session import AsyncSessionLocal
+from conftest import item
+
+
+def _bill(client, headers, catalog, number, pay=True):
+    response = client.post("/invoices/", headers=headers, json={
+        "invoice_number": number, "employee_id": catalog.employee_id,
+        "items": [item(catalog.product_id, quantity=2, description="Masala Dosa")],
+    })
+    assert response.status_code == 200, response.text
+    invoice = response.json()
+    if pay:
+        assert client.post(f"/payments/{invoice['id']}/pay", headers=headers).status_code == 200
+    return invoice
+
+
+async def _set_status(invoice_id, status):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Invoice).where(Invoice.id == invoice_id).values(status=status))
+        await db.commit()
+
+
+def test_text_and_escpos_render_the_same_bill(client, headers, catalog):
+    invoice = _bill(client, headers, catalog, "RC-1")
+
+    text = client.get(f"/invoices/{invoice['id']}/receipt", headers=headers)
+    assert text.status_code == 200
+    assert text.headers["content-type"].startswith("text/plain")
+    assert "RC-1" in text.text and "Masala Dosa" in text.text
+    assert all(len(line) <= receipts.settings.RECEIPT_WIDTH for line in text.text.splitlines())
+
+    escpos = client.get(f"/invoices/{invoice['id']}/receipt", params={"format": "escpos"}, headers=headers).content
+    assert escpos.startswith(receipts.ESC_INIT) and escpos.endswith(receipts.GS_FEED_CUT)
+    assert b"RC-1" in escpos
+
+    pdf = client.get(f"/invoices/{invoice['id']}/receipt", params={"format": "pdf"}, headers=headers).content
+    assert pdf.startswith(b"%PDF")
+
+
+def test_paid_receipts_are_cached_drafts_are_not(client, headers, catalog, run):
+    paid = _bill(client, headers, catalog, "RC-2")
+    draft = _bill(client, headers, catalog, "RC-3", pay=False)
+    run(_set_status, draft["id"], "draft")
+    hits = lambda: receipts.cache_hits.values.get(("text",), 0)  # noqa: E731
+
+    for invoice in (paid, draft):
+        client.get(f"/invoices/{invoice['id']}/receipt", headers=headers)
+    before = hits()
+    client.get(f"/invoices/{paid['id']}/receipt", headers=headers)
+    assert hits() == before + 1
+    client.get(f"/invoices/{draft['id']}/receipt", headers=headers)
+    assert hits() == before + 1
+
+
+def test_batch_reports_missing_and_other_outlets_bills(client, headers, catalog, outlet):
+    invoice = _bill(client, headers, catalog, "RC-4")
+    other = {"X-Outlet-Id": str(outlet + 1000)}
+    assert client.get(f"/invoices/{invoice['id']}/receipt", headers=other).status_code == 404
+
+    response = client.post("/invoices/receipts", headers=headers, json={
+        "invoice_ids": [invoice["id"], 10 ** 9], "format": "escpos",
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["missing"] == [10 ** 9]
+    [receipt] = body["receipts"]
+    assert receipt["encoding"] == "base64"
+    assert base64.b64decode(receipt["content"]).startswith(receipts.ESC_INIT)
+
+    response = client.post("/invoices/receipts", headers=other, json={"invoice_ids": [invoice["id"]]})
+    assert response.json()["missing"] == [invoice["id"]]
+
+
+def test_cache_is_bounded_by_bytes():
+    cache = receipts.ReceiptCache(10)
+    cache.put(("a",), b"12345")
+    cache.put(("b",), b"12345")
+    assert cache.get(("a",)) == b"12345"  # now most recent
+    cache.put(("c",), b"123")
+    assert cache.get(("b",)) is None
+    assert (len(cache), cache.bytes) == (2, 8)
+    cache.put(("d",), b"x" * 11)
+    assert cache.get(("d",)) is None
@@ -0,0 +1,80 @@
+# tests/test_search.py
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import search
+from conftest import item, seed_catalog
+
+
+def _bill(client, headers, catalog, number, table=None, notes=None, description="Masala Dosa", price=100):
+    response = client.post("/invoices/", headers=headers, json={
+        "invoice_number": number, "table_number": table, "notes": notes, "employee_id": catalog.employee_id,
+        "items": [item(catalog.product_id, unit_price=price, description=description)],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def _search(client, headers, **params):
+    response = client.get("/invoices/search", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _numbers(body):
+    return [r["invoice_number"] for r in body["results"]]
+
+
+def test_filters(client, headers, catalog, outlet):
+    _bill(client, headers, catalog, "S-101", table="T4", notes="extra spicy", price=100)
+    _bill(client, headers, catalog, "S-102", table="T5", description="Filter Coffee", price=250)
+    _bill(client, headers, catalog, "S-200", table="T4", price=40)
+    other = {"X-Outlet-Id": str(outlet + 1000)}
+    _bill(client, other, seed_catalog(client, other), "S-103", table="T4")
+
+    assert _numbers(_search(client, headers, number="S-1")) == ["S-102", "S-101"]
+    assert _numbers(_search(client, headers, table="T4")) == ["S-200", "S-101"]
+    assert _numbers(_search(client, headers, q="SPIC")) == ["S-101"]
+    assert _numbers(_search(client, headers, q="coffee filter")) == ["S-102"]
+    assert _numbers(_search(client, headers, min_total=50, max_total=200)) == ["S-101"]
+    assert _numbers(_search(client, headers, table="T4", number="S-2")) == ["S-200"]
+
+
+def test_cursor_pages_through_every_bill_once(client, headers, catalog):
+    numbers = [f"P-{n}" for n in range(5)]
+    for number in numbers:
+        _bill(client, headers, catalog, number)
+    seen, cursor = [], None
+    while True:
+        params = {"number": "P-", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        body = _search(client, headers, **params)
+        seen += _numbers(body)
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert seen == numbers[::-1]
+
+
+def test_bad_input_is_rejected(client, headers):
+    assert client.get("/invoices/search", params={"cursor": "not-a-cursor"}, headers=headers).status_code == 422
+    assert client.get("/invoices/search", params={"q": "--"}, headers=headers).status_code == 422
+    wide = {"date_from": "2026-01-01", "date_to": "2026-12-31"}
+    assert client.get("/invoices/search", params=wide, headers=headers).status_code == 422
+
+
+def test_date_window():
+    today = search.shift_of(datetime.utcnow())[0]
+    assert search.date_window(None, None) == (today, today)
+    assert search.date_window(date(2026, 1, 5), date(2026, 1, 7)) == (date(2026, 1, 5), date(2026, 1, 7))
+    with pytest.raises(ValueError):
+        search.date_window(date(2026, 1, 7), date(2026, 1, 5))
+    with pytest.raises(ValueError):
+        search.date_window(today - timedelta(days=search.settings.SEARCH_MAX_DAYS), today)
+
+
+def test_cursor_round_trip():
+    ts = datetime(2026, 10, 19, 13, 5, 7, 123)
+    assert search.decode_cursor(search.encode_cursor(ts, 42)) == (ts, 42)
@@ -0,0 +1,70 @@
+# tests/test_shifts.py
+from datetime import datetime, timedelta, timezone
+
+from app import shifts
+from conftest import item
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def _bill(client, headers, catalog, number, price=100):
+    response = client.post("/invoices/", headers=headers, json={
+        "invoice_number": number, "employee_id": catalog.employee_id,
+        "items": [item(catalog.product_id, quantity=2, unit_price=price)],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _performance(client, headers, catalog, **params):
+    response = client.get(f"/employees/{catalog.employee_id}/performance", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_utc_naive():
+    aware = datetime(2024, 1, 1, 10, 0, tzinfo=IST)
+    assert shifts.utc_naive(aware) == datetime(2024, 1, 1, 4, 30)
+    assert shifts.utc_naive(datetime(2024, 1, 1, 4, 30)) == datetime(2024, 1, 1, 4, 30)
+
+
+def test_window_with_offset_is_converted_to_utc(client, headers, catalog):
+    _bill(client, headers, catalog, "SH-1")
+    now = datetime.now(IST)
+    window = _performance(
+        client, headers, catalog,
+        since=(now - timedelta(hours=1)).isoformat(), until=(now + timedelta(hours=1)).isoformat(),
+    )
+    assert window["invoices"] == 1
+    assert window["since"] == shifts.utc_naive(now - timedelta(hours=1)).isoformat()
+
+    earlier = _performance(
+        client, headers, catalog,
+        since=(now - timedelta(hours=3)).isoformat(), until=(now - timedelta(hours=1)).isoformat(),
+    )
+    assert earlier["invoices"] == 0
+
+
+def test_paying_twice_counts_the_invoice_once(client, headers, catalog):
+    invoice = _bill(client, headers, catalog, "SH-2")
+    assert client.post(f"/payments/{invoice['id']}/pay", headers=headers).status_code == 200
+    assert client.post(f"/invoices/{invoice['id']}/pay", headers=headers).status_code == 200
+    assert client.post(f"/payments/{invoice['id']}/pay", headers=headers).status_code == 200
+
+    totals = _performance(client, headers, catalog)
+    assert (totals["invoices"], totals["paid_invoices"]) == (1, 1)
+    assert totals["payment_mix"]["cash"]["payments"] == 2
+
+
+def test_shift_report_matches_the_live_window(client, headers, catalog):
+    for n in range(3):
+        _bill(client, headers, catalog, f"SH-R{n}", price=100 + n)
+    rows = client.get("/reports/shifts", headers=headers).json()["rows"]
+    assert sum(r["invoices"] for r in rows) == 3
+
+    now = datetime.utcnow()
+    window = _performance(
+        client, headers, catalog,
+        since=(now - timedelta(hours=1)).isoformat(), until=(now + timedelta(hours=1)).isoformat(),
+    )
+    assert window["gross"] == sum(r["gross"] for r in rows)
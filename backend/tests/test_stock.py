@@ -0,0 +1,125 @@
+# tests/test_stock.py
+from decimal import Decimal
+
+from sqlalchemy import select, update
+
+from app import stock
+from app.db.models import Product, ProductStockShard
+from app.db.session import AsyncSessionLocal
+from conftest import item, seed_catalog
+
+
+def _tracked(client, headers, shards=0, receipt=10):
+    catalog = seed_catalog(client, headers)
+    pid = catalog.product_id
+    client.put(f"/products/{pid}/stock/settings", json={"track_stock": True, "shards": shards}, headers=headers)
+    client.post(f"/products/{pid}/stock", json={"delta": receipt, "reason": "receipt"}, headers=headers)
+    return catalog
+
+
+def _sell(client, headers, catalog, number, quantity=1):
+    response = client.post("/invoices/", headers=headers, json={
+        "invoice_number": number, "employee_id": catalog.employee_id,
+        "items": [item(catalog.product_id, quantity=quantity)],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _on_hand(client, headers, product_id):
+    return client.get(f"/products/{product_id}/stock", headers=headers).json()["on_hand"]
+
+
+def test_sale_below_zero_is_saved_with_a_warning(client, headers):
+    catalog = _tracked(client, headers, receipt=2)
+    invoice = _sell(client, headers, catalog, "ST-1", quantity=3)
+    assert invoice["stock_warnings"] == [{"product_id": catalog.product_id, "on_hand": -1}]
+    assert _on_hand(client, headers, catalog.product_id) == -1
+
+
+def test_sharded_sales_fold_back_without_drift(client, headers):
+    catalog = _tracked(client, headers, shards=4)
+    for n in range(3):
+        _sell(client, headers, catalog, f"SH-{n}")
+    assert _on_hand(client, headers, catalog.product_id) == 7
+    result = client.post("/products/stock/reconcile", headers=headers).json()
+    assert result == {"folded_products": 1, "drift": {}}
+    assert _on_hand(client, headers, catalog.product_id) == 7
+
+
+class _SaleDuringFold:
+    """Session wrapper: right after the fold has read (and locked) its shard rows, a sale lands on another shard."""
+
+    def __init__(self, db, product_id, shard):
+        self.db, self.product_id, self.shard, self.fired = db, product_id, shard, False
+
+    async def execute(self, *args, **kwargs):
+        result = await self.db.execute(*args, **kwargs)
+        if not self.fired:
+            self.fired = True
+            await self.db.execute(
+                update(ProductStockShard)
+                .where(ProductStockShard.product_id == self.product_id, ProductStockShard.shard == self.shard)
+                .values(delta=ProductStockShard.delta - 2)
+            )
+        return result
+
+
+def test_fold_keeps_a_sale_on_a_shard_it_did_not_read(client, headers, run):
+    catalog = _tracked(client, headers, shards=4)
+    invoice = _sell(client, headers, catalog, "FOLD-1")
+    sold_shard = invoice["id"] % 4
+    other_shard = (sold_shard + 1) % 4
+    pid = catalog.product_id
+
+    async def fold():
+        async with AsyncSessionLocal() as db:
+            assert await stock._fold_shards(_SaleDuringFold(db, pid, other_shard), [pid]) == 1
+            await db.commit()
+            shards = dict((await db.execute(
+                select(ProductStockShard.shard, ProductStockShard.delta).where(ProductStockShard.product_id == pid)
+            )).all())
+            qty = (await db.execute(select(Product.stock_qty).where(Product.id == pid))).scalar_one()
+            return qty, shards
+
+    qty, shards = run(fold)
+    assert qty == Decimal("9")  # 10 received - 1 folded
+    assert shards[sold_shard] == 0
+    assert shards[other_shard] == Decimal("-2")  # the concurrent sale survives the fold
+    assert _on_hand(client, headers, pid) == 7
+
+
+def test_reconcile_corrects_counter_drift(client, headers, run):
+    catalog = _tracked(client, headers)
+    _sell(client, headers, catalog, "DR-1")
+
+    async def corrupt():
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Product).where(Product.id == catalog.product_id).values(stock_qty=Product.stock_qty + 5)
+            )
+            await db.commit()
+
+    run(corrupt)
+    assert _on_hand(client, headers, catalog.product_id) == 14
+    result = client.post("/products/stock/reconcile", headers=headers).json()
+    assert result["drift"] == {str(catalog.product_id): -5.0}
+    assert _on_hand(client, headers, catalog.product_id) == 9
+
+
+def test_reconcile_counts_a_sale_committed_after_the_fold(client, headers, run, monkeypatch):
+    catalog = _tracked(client, headers, shards=4)
+    invoice = _sell(client, headers, catalog, "RF-1")
+    pid = catalog.product_id
+    fold = stock._fold_shards
+
+    async def fold_then_sell(db, product_ids=None):
+        folded = await fold(db, product_ids)
+        # a 2-unit sale (shard delta and ledger row) lands before reconcile compares
+        await stock.apply_sale(db, int(headers["X-Outlet-Id"]), [(invoice["id"] + 1, pid, Decimal("2"))])
+        return folded
+
+    monkeypatch.setattr(stock, "_fold_shards", fold_then_sell)
+    result = client.post("/products/stock/reconcile", headers=headers).json()
+    assert result == {"folded_products": 1, "drift": {}}
+    assert _on_hand(client, headers, pid) == 7
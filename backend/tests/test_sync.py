@@ -0,0 +1,141 @@
+# tests/test_sync.py
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
+
+from app.crud import record_catalog_change
+from app.db.models import Payment, Product
+from app.db.session import AsyncSessionLocal
+from conftest import item
+
+
+def _invoice(catalog, seq, number, created_at="2026-10-19T10:00:00+05:30", **extra):
+    return {"local_seq": seq, "invoice_number": number, "created_at": created_at,
+            "employee_id": catalog.employee_id, "items": [item(catalog.product_id)], **extra}
+
+
+def _push(client, headers, **body):
+    response = client.post("/sync/push", json={"terminal_id": "T1", **body}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_push_is_idempotent(client, headers, catalog):
+    batch = {
+        "invoices": [_invoice(catalog, 1, "OFF-1")],
+        "payments": [{"local_seq": 2, "invoice_local_seq": 1, "paid_at": "2026-10-19T10:05:00Z"}],
+    }
+    first = _push(client, headers, **batch)["results"]
+    assert [r["status"] for r in first] == ["applied", "applied"]
+
+    again = _push(client, headers, **batch)["results"]
+    assert [(r["status"], r["id"]) for r in again] == [("duplicate", r["id"]) for r in first]
+    invoice = client.get(f"/invoices/{first[0]['id']}", headers=headers).json()
+    assert invoice["status"] == "paid"
+
+
+def test_offline_timestamps_are_converted_to_utc(client, headers, catalog, run):
+    results = _push(
+        client, headers,
+        invoices=[_invoice(catalog, 1, "OFF-TZ", created_at="2026-10-19T10:00:00+05:30")],
+        payments=[{"local_seq": 2, "invoice_local_seq": 1, "paid_at": "2026-10-19T10:30:00+05:30"}],
+    )["results"]
+    invoice = client.get(f"/invoices/{results[0]['id']}", headers=headers).json()
+    assert invoice["created_at"].startswith("2026-10-19T04:30:00")
+
+    async def paid_at():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(Payment.paid_at).where(Payment.id == results[1]["id"]))).scalar_one()
+
+    assert run(paid_at) == datetime(2026, 10, 19, 5, 0)
+
+
+def test_failed_records_can_be_retried(client, headers, catalog):
+    client.post("/invoices/", json={"invoice_number": "TAKEN", "items": [item(catalog.product_id)]}, headers=headers)
+    (result,) = _push(client, headers, invoices=[_invoice(catalog, 5, "TAKEN")])["results"]
+    assert (result["status"], result["error"]) == ("error", "invoice_number already exists")
+    # the claim on local_seq 5 was released, so the fixed record goes through
+    (result,) = _push(client, headers, invoices=[_invoice(catalog, 5, "TAKEN-2")])["results"]
+    assert result["status"] == "applied"
+
+
+def test_duplicate_local_seq_in_a_batch_is_rejected(client, headers, catalog):
+    response = client.post("/sync/push", headers=headers, json={
+        "terminal_id": "T1", "invoices": [_invoice(catalog, 1, "D-1"), _invoice(catalog, 1, "D-2")],
+    })
+    assert response.status_code == 422
+
+
+def _changes(client, headers, cursor=None, **params):
+    if cursor is not None:
+        params["cursor"] = cursor
+    response = client.get("/sync/changes", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _new_product(client, headers, catalog, sku):
+    return client.post("/products/", headers=headers, json={
+        "name": sku, "sku": sku, "current_unit_price": 50, "tax_slab_id": catalog.tax_slab_id,
+    }).json()["id"]
+
+
+def test_catalog_download_then_deltas(client, headers, outlet, catalog, run):
+    full = _changes(client, headers)
+    assert full["snapshot"] is True and full["has_more"] is False
+    assert [p["id"] for p in full["products"]] == [catalog.product_id]
+    assert [t["id"] for t in full["tax_slabs"]] == [catalog.tax_slab_id]
+    assert _changes(client, headers, full["cursor"])["products"] == []
+
+    new_id = _new_product(client, headers, catalog, "IDLY")
+
+    async def deactivate_and_delete():
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Product).where(Product.id == catalog.product_id).values(is_active=False))
+            await record_catalog_change(db, outlet, "products", [catalog.product_id])
+            await db.execute(delete(Product).where(Product.id == new_id))
+            await record_catalog_change(db, outlet, "products", [new_id])
+            await db.commit()
+
+    run(deactivate_and_delete)
+    delta = _changes(client, headers, full["cursor"])
+    assert delta["snapshot"] is False
+    assert [(p["id"], p["is_active"]) for p in delta["products"]] == [(catalog.product_id, False)]
+    assert delta["deleted"] == {"products": [new_id]}
+    assert _changes(client, headers, delta["cursor"])["products"] == []
+
+
+def test_late_committed_row_is_not_skipped(client, headers, catalog, run):
+    cursor = _changes(client, headers)["cursor"]
+    new_id = _new_product(client, headers, catalog, "VADA")
+
+    async def backdate():
+        # an updated_at older than anything the terminal has seen, as a slow transaction would leave it
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Product).where(Product.id == new_id).values(updated_at=datetime(2000, 1, 1)))
+            await db.commit()
+
+    run(backdate)
+    assert [p["id"] for p in _changes(client, headers, cursor)["products"]] == [new_id]
+
+
+def test_full_download_pages_by_id(client, headers, catalog):
+    extra = [_new_product(client, headers, catalog, f"P{i}") for i in range(2)]
+    page = _changes(client, headers, limit=2)
+    assert page["has_more"] is True
+    ids = [p["id"] for p in page["products"]]
+    late = _new_product(client, headers, catalog, "LATE")  # written while the download is paging
+    page = _changes(client, headers, page["cursor"], limit=2)
+    assert page["snapshot"] is True and page["has_more"] is False
+    assert ids + [p["id"] for p in page["products"]] == [catalog.product_id] + extra + [late]
+    # writes made during the download are replayed from the log afterwards
+    assert [p["id"] for p in _changes(client, headers, page["cursor"])["products"]] == [late]
+
+
+def test_cursor_from_before_the_change_log_restarts_the_download(client, headers, catalog):
+    old = base64.urlsafe_b64encode(json.dumps({"products": ["2026-10-01T00:00:00", 5]}).encode()).decode()
+    assert _changes(client, headers, old)["snapshot"] is True
+    response = client.get("/sync/changes", params={"cursor": "!!not-a-cursor"}, headers=headers)
+    assert response.status_code == 422